@@ -0,0 +1,125 @@
+import asyncio
+import tempfile
+import threading
+import time
+import numpy as np
+import Otter_api
+import Otter_emulator
+import lib.Async_connector as Async_connector
+import lib.Connector as Connector
+import lib.Live_guidance as Live_guidance
+import lib.PID_Controller_test_v2 as PID_Controller_test_v2
+import lib.Trajectory as Trajectory
+
+
+#
+#   End to end benchmark of the Otter API against the emulator in Otter_emulator.py, which runs in a thread of this process.
+#
+#   Telemetry: the emulator runs faster than real time with a high IMU rate and the connector reads and parses every
+#   sentence. Shows how many sentences per second the connector keeps up with and if any are lost.
+#
+#   Tracking: live_guidance.trajectory_tracking_async tracks a moving target in real time with the async connector, like
+#   on the water. Shows the cycle times and telemetry age of the guidance loop, the command rate and delay seen by the
+#   emulator, and the distance to the target.
+#
+
+
+##########################################################################################################################################################
+#                                                                      OPTIONS                                                                           #
+##########################################################################################################################################################
+
+
+port = 2010                                                                                             # Port of the emulator, not the same as a running Otter_emulator.py
+start_position = [59.908642666666665, 10.71945885, 0.0]
+
+telemetry_duration = 10                                                                                 # Real seconds of the telemetry test
+telemetry_speedup = 20                                                                                  # Simulated seconds per real second
+telemetry_imu_rate = 100                                                                                # $PMARIMU per simulated second, $PMARGPS is 10
+
+tracking_duration = 60                                                                                  # Real seconds of tracking, after the 3 s start of the guidance
+start_north = -20                                                                                       # Target start and speed, same as in main.py
+start_east = -20
+v_north = 0
+v_east = -1.5
+gains = {"surge_kp" : 14.39, "surge_ki" : 3.13, "surge_kd" : 0, "yaw_kp" : 15.21, "yaw_ki" : 0.7, "yaw_kd" : 1.86}
+
+
+def start_emulator(emulator, duration):
+    thread = threading.Thread(target=asyncio.run, args=(emulator.serve("localhost", port, duration),), daemon=True)
+    thread.start()
+    time.sleep(1)
+    return thread
+
+
+def telemetry_test():
+    emulator = Otter_emulator.otter_emulator(start_position, sampleTime=0.01, speedup=telemetry_speedup, gps_rate=10, imu_rate=telemetry_imu_rate)
+    thread = start_emulator(emulator, (telemetry_duration + 2) * telemetry_speedup)
+
+    connector = Connector.otter_connector()
+    connector.verbose = False
+    connector.establish_connection("localhost", port)
+
+    received = 0
+    parse_time = 0.0
+    sent = emulator.sentences_sent
+    start = time.perf_counter()
+    while time.perf_counter() - start < telemetry_duration:
+        connector.receive_message(0.1)
+        sentences = connector.received_sentences
+        connector.received_sentences = []
+
+        parse_start = time.perf_counter()
+        for sentence in sentences:
+            connector.update_from_sentence(sentence)
+        parse_time = parse_time + time.perf_counter() - parse_start
+        received = received + len(sentences)
+    wall = time.perf_counter() - start
+    sent = emulator.sentences_sent - sent
+
+    connector.close_connection()
+    thread.join()
+
+    print(f"Telemetry, x{telemetry_speedup} real time with {telemetry_imu_rate} Hz IMU:")
+    print(f"    sent {sent / wall:.0f} sentences/s, received and parsed {received / wall:.0f} sentences/s, "
+          f"{max(sent - received, 0)} sent but not received yet when the test ended")
+    print(f"    parsing took {parse_time / max(received, 1) * 1e6:.1f} us per sentence, {parse_time / wall * 100:.1f} % of the time")
+
+
+def tracking_test():
+    emulator = Otter_emulator.otter_emulator(start_position)
+    thread = start_emulator(emulator, tracking_duration + 10)
+
+    otter = Otter_api.otter(Async_connector.async_otter_connector())
+    otter.otter_connector.verbose = False
+    otter.otter_control.verbose = False
+
+    surge_PID = PID_Controller_test_v2.PIDController(gains["surge_kp"], gains["surge_ki"], gains["surge_kd"])
+    yaw_PID = PID_Controller_test_v2.PIDController(gains["yaw_kp"], gains["yaw_ki"], gains["yaw_kd"])
+    guidance = Live_guidance.live_guidance("localhost", port, surge_PID, yaw_PID, 1, otter)
+
+    path = Trajectory.trajectory([start_north, start_east], [{"type" : "line", "velocity" : [v_north, v_east]}], guidance.cycletime)
+
+    with tempfile.TemporaryDirectory() as logs_dir:
+        guidance.logs_dir = logs_dir
+        asyncio.run(guidance.trajectory_tracking_async(path, tracking_duration))
+
+    stats = emulator.stats()
+    thread.join()
+
+    log = guidance.log.iloc[2:]                                         # The first row is before the start and the first cycle includes the 3 s start
+    cycle_time = log["cycle_time"].to_numpy(float)
+    telemetry_age = log["telemetry_age"].to_numpy(float) if "telemetry_age" in log else np.array([np.nan])
+    distance = log["distance_to_target"].to_numpy(float)
+
+    print(f"Tracking for {tracking_duration} s:")
+    print(f"    {len(log)} guidance cycles, cycle time mean {np.nanmean(cycle_time) * 1e3:.1f} ms, "
+          f"p95 {np.nanpercentile(cycle_time, 95) * 1e3:.1f} ms, max {np.nanmax(cycle_time) * 1e3:.1f} ms")
+    print(f"    telemetry age when used mean {np.nanmean(telemetry_age) * 1e3:.1f} ms, max {np.nanmax(telemetry_age) * 1e3:.1f} ms")
+    print(f"    emulator received {stats['commands']} commands, interval mean {stats['command_interval_mean'] * 1e3:.1f} ms, "
+          f"std {stats['command_interval_std'] * 1e3:.1f} ms, delay after telemetry mean {stats['command_delay_mean'] * 1e3:.1f} ms")
+    print(f"    distance to target mean {distance.mean():.2f} m, last 20 s {distance[-200:].mean():.2f} m")
+
+
+if __name__ == "__main__":
+    telemetry_test()
+    tracking_test()
@@ -0,0 +1,84 @@
+import math
+import time
+import numpy as np
+import Otter_simulator
+
+
+#
+#   Compares the integrators in otter_simulator. The Otter is driven open loop with propeller commands that change
+#   every control period, like the PID controllers do in the simulator. Each integrator is run with different sample
+#   times and compared to RK4 with a very small sample time, which is used as the reference solution.
+#
+#   Since the commands are held constant over the control period no integrator can step past a controller update. Euler
+#   and RK4 take one step per sample, while rk45 steps over the whole control period if the error allows and takes the
+#   samples in between from its dense output. With the sampleTime of 0.02 s used in main.py, rk45 needs fewer
+#   dynamics evaluations than RK4 for the same accuracy. RK4 with one step per control period is still the cheapest
+#   when only the states at the controller updates are needed.
+#
+
+
+##########################################################################################################################################################
+#                                                                      OPTIONS                                                                           #
+##########################################################################################################################################################
+
+
+duration = 60                                                                                           # Simulated time (s)
+control_period = 0.1                                                                                    # Time the propeller commands are held constant (s)
+reference_sampleTime = 0.0025                                                                           # Sample time of the RK4 reference solution
+runs = [("euler", 0.02), ("euler", 0.01), ("euler", 0.005), ("euler", 0.002),                           # (integrator, sampleTime) pairs to compare
+        ("rk4", 0.1), ("rk4", 0.05), ("rk4", 0.02), ("rk45", 0.1), ("rk45", 0.02)]
+
+
+# Propeller commands (rad/s) for each control period. Slow turns in both directions at varying speed
+def propeller_commands(duration, control_period):
+    t = np.arange(0, duration, control_period)
+    n_mean = 60 + 30 * np.sin(2 * math.pi * t / 40)
+    n_diff = 25 * np.sin(2 * math.pi * t / 25)
+    return np.stack((n_mean + n_diff, n_mean - n_diff), axis=1)
+
+
+def new_simulator(integrator):
+    return Otter_simulator.otter_simulator([[0, 0]], False, 1, False, [0, 0], [0, 0], False, False, False, False, False, integrator)
+
+
+# Runs the open loop scenario and returns the positions and heading at the end of every control period
+def run(simulator, commands, sampleTime, control_period):
+    steps = int(round(control_period / sampleTime))
+    eta = np.zeros(6)
+    nu = np.zeros(6)
+    u_actual = np.zeros(2)
+    simulator.dynamics_evaluations = 0
+    simulator.rk45_step = None
+
+    states = np.empty((len(commands), 3))
+    for k, u_control in enumerate(commands):
+        if simulator.integrator == "rk45":                                  # The whole control period at once, like simulate_stream
+            x = simulator.rk45(np.concatenate((eta, nu, u_actual)), u_control, sampleTime, steps)
+            eta, nu, u_actual = simulator.split_state(x[-1])
+        else:
+            for _ in range(steps):
+                eta, nu, u_actual = simulator.propagate(eta, nu, u_actual, u_control, sampleTime)
+        states[k] = [eta[0], eta[1], eta[5]]
+
+    return states
+
+
+if __name__ == "__main__":
+    commands = propeller_commands(duration, control_period)
+
+    print(f"Calculating reference with RK4, sampleTime = {reference_sampleTime}")
+    reference = run(new_simulator("rk4"), commands, reference_sampleTime, control_period)
+
+    print(f"{'integrator':>10} {'sampleTime':>10} {'evaluations':>12} {'evals/s':>9} {'wall (s)':>9} {'samples/s':>10} {'pos. error (m)':>15} {'yaw error (rad)':>16}")
+    for integrator, sampleTime in runs:
+        simulator = new_simulator(integrator)
+        start = time.perf_counter()
+        states = run(simulator, commands, sampleTime, control_period)
+        wall = time.perf_counter() - start
+
+        samples = len(commands) * int(round(control_period / sampleTime))
+        position_error = np.sqrt(((states[:, 0:2] - reference[:, 0:2]) ** 2).sum(axis=1)).max()
+        yaw_error = np.abs(np.angle(np.exp(1j * (states[:, 2] - reference[:, 2])))).max()
+
+        print(f"{integrator:>10} {sampleTime:>10} {simulator.dynamics_evaluations:>12} {simulator.dynamics_evaluations / duration:>9.0f} "
+              f"{wall:>9.3f} {samples / wall:>10.0f} {position_error:>15.2e} {yaw_error:>16.2e}")
@@ -0,0 +1,108 @@
+import time
+import math
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import lib.Live_plotter as Live_plotter
+
+
+#
+#   Time of one frame of the live plot after the tracking has run for a while. The plotter in lib/Live_plotter.py is
+#   compared to redrawing the full history on cleared axes every frame, which the plotter did before. The frames are
+#   drawn with the Agg backend, so the numbers are the drawing in matplotlib without the window system.
+#
+
+
+##########################################################################################################################################################
+#                                                                      OPTIONS                                                                           #
+##########################################################################################################################################################
+
+
+minutes = [1, 10, 30, 60]                                                                               # Length of the tracking when the frames are timed, 5 frames per second
+frames = 20                                                                                             # Frames timed at each length
+
+
+class fake_otter():
+
+    def __init__(self):
+        self.sorted_values = {}
+        self.k = 0
+
+    # Values like the ones from a tracking, changing every frame
+    def update(self):
+        t = self.k * 0.2
+        self.sorted_values = {"tau_X" : 100 * math.sin(t / 10), "tau_N" : 30 * math.cos(t / 7), "east_from_observer" : 20 * math.sin(t / 60),
+                              "north_from_observer" : 20 * math.cos(t / 60), "target_east_from_observer" : 22 * math.sin(t / 60),
+                              "target_north_from_observer" : 22 * math.cos(t / 60), "current_orientation_3" : (t * 3) % 360,
+                              "yaw_setpoint" : math.radians((t * 3 + 5) % 360), "distance_to_target" : 2 + math.sin(t), "n1" : 500 + 100 * math.sin(t),
+                              "n2" : 500 - 100 * math.sin(t)}
+        self.k = self.k + 1
+
+
+# The plotting the live plotter did before: every frame all the axes are cleared and the full history is plotted
+class full_redraw_plotter():
+
+    def __init__(self, otter):
+        self.otter = otter
+        self.fig, ax = plt.subplots(2, 3, figsize=(10,8))
+        self.axes = ax.flatten()[:5]
+        self.keys = [("tau_X", "tau_N"), ("north_from_observer", "target_north_from_observer"), ("current_orientation_3", "yaw_setpoint"),
+                     ("distance_to_target", "distance_to_target"), ("n1", "n2")]
+        self.history = {key : [] for pair in self.keys for key in pair}
+        self.history["time"] = []
+        self.history["east_from_observer"] = []
+        self.history["target_east_from_observer"] = []
+
+    def sample(self):
+        self.history["time"].append(self.otter.k * 0.2)
+        for key in self.history:
+            if key != "time":
+                self.history[key].append(float(self.otter.sorted_values[key]))
+
+    def animate(self, i=None):
+        self.sample()
+        for k, (ax, (y1, y2)) in enumerate(zip(self.axes, self.keys)):
+            ax.clear()
+            x1 = self.history["east_from_observer"] if k == 1 else self.history["time"]
+            x2 = self.history["target_east_from_observer"] if k == 1 else self.history["time"]
+            ax.plot(x1, self.history[y1], "r-", label=y1)
+            ax.plot(x2, self.history[y2], "b-", label=y2)
+            ax.legend()
+        self.fig.canvas.draw()
+
+
+# Samples without drawing up to each length of the tracking, then times the frames
+def frame_times(plotter, otter):
+    results = []
+    for length in minutes:
+        while otter.k < length * 300 - frames:
+            otter.update()
+            plotter.start_time = time.time() - otter.k * 0.2                # The samples get the time of the tracking
+            plotter.sample()
+        frame_time = 0.0
+        for _ in range(frames):
+            otter.update()
+            plotter.start_time = time.time() - otter.k * 0.2
+            start = time.perf_counter()
+            plotter.animate()
+            frame_time = frame_time + time.perf_counter() - start
+        results.append(frame_time / frames)
+    return results
+
+
+if __name__ == "__main__":
+    otter = fake_otter()
+    otter.update()
+    plotter = Live_plotter.live_plotter(otter, show=False)
+    blitted = frame_times(plotter, otter)
+
+    print("Frame time of the live plotter:")
+    for length, frame_time in zip(minutes, blitted):
+        print(f"    after {length:>3} min {frame_time * 1e3:7.1f} ms")
+
+    otter = fake_otter()
+    otter.update()
+    full_redraw = frame_times(full_redraw_plotter(otter), otter)
+    print("Frame time when the full history is redrawn every frame:")
+    for length, frame_time in zip(minutes, full_redraw):
+        print(f"    after {length:>3} min {frame_time * 1e3:7.1f} ms")
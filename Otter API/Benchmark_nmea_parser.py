@@ -0,0 +1,105 @@
+import time
+import numpy as np
+import lib.Connector as Connector
+
+
+#
+#   Measures how many sentences per second the NMEA parsing in lib/Connector.py handles. The bytes parser (nmea_framer,
+#   sentence_fields and ddmm_to_degrees) is compared to the string parsing the connector used before, which is copied
+#   below. Both turn a received buffer of $PMARGPS and $PMARIMU sentences into the float values with checked checksums.
+#   The position and speed updates of the connector are not included, only the parsing.
+#
+
+
+##########################################################################################################################################################
+#                                                                      OPTIONS                                                                           #
+##########################################################################################################################################################
+
+
+sentences = 20000                                                                                       # Number of sentences in the received buffer, every fifth is $PMARGPS
+repeats = 5                                                                                             # The best of this many runs is used
+seed = 0
+
+
+# The checksum and parsing the connector used before, working on strings
+def string_checksum(message):
+    checksum = 0
+    for character in message:
+        checksum ^= ord(character)
+    checksum = hex(checksum)
+    checksum = checksum[2:]
+    if len(checksum) == 1:
+        checksum = "0" + checksum
+    return checksum
+
+
+def string_parse(buffer):
+    values = []
+    for message in buffer.decode().split():
+        if string_checksum(message[1:-3]) != message[-2:].lower():
+            continue
+        fields = message.split("*")[0].split(",")
+        if message[:8] == "$PMARGPS":
+            lat = float(fields[2][:2]) + ((float(fields[2][2:]) / 100) / 0.6)
+            lon = float(fields[4][:3]) + ((float(fields[4][3:]) / 100) / 0.6)
+            values.append((lat, lon, float(fields[8])))
+        elif message[:8] == "$PMARIMU":
+            values.append((float(fields[1]), float(fields[2]), float(fields[3]), float(fields[4]), float(fields[5]), float(fields[6])))
+    return values
+
+
+def bytes_parse(buffer):
+    values = []
+    framer = Connector.nmea_framer()
+    for message in framer.feed(buffer):
+        fields = Connector.sentence_fields(message)
+        if fields is None:
+            continue
+        name = fields[0]
+        if name == b"$PMARGPS":
+            values.append((Connector.ddmm_to_degrees(fields[2], 2), Connector.ddmm_to_degrees(fields[4], 3), float(fields[8])))
+        elif name == b"$PMARIMU":
+            values.append((float(fields[1]), float(fields[2]), float(fields[3]), float(fields[4]), float(fields[5]), float(fields[6])))
+    return values
+
+
+def nmea(body):
+    return f"${body}*{Connector.checksum(body).upper()}\r\n"
+
+
+# Received buffer with GPS and IMU sentences like the ones from the Otter
+def telemetry_buffer(sentences, seed):
+    rng = np.random.default_rng(seed)
+    messages = []
+    for k in range(sentences):
+        if k % 5 == 0:
+            lat = 5954 + rng.uniform(0, 1)
+            lon = 1043 + rng.uniform(0, 1)
+            messages.append(nmea(f"PMARGPS,{120000 + k / 10:.2f},{lat:.6f},N,{lon:012.6f},E,1,{rng.uniform(0, 2):.2f},{rng.uniform(0, 360):.2f},"))
+        else:
+            roll, pitch, yaw, p, q, r = rng.uniform(-180, 180, 6)
+            messages.append(nmea(f"PMARIMU,{roll:.2f},{pitch:.2f},{yaw:.2f},{p:.3f},{q:.3f},{r:.3f}"))
+    return "".join(messages).encode()
+
+
+def best_time(function, buffer, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function(buffer)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+if __name__ == "__main__":
+    buffer = telemetry_buffer(sentences, seed)
+
+    string_values = string_parse(buffer)
+    bytes_values = bytes_parse(buffer)
+    difference = np.abs(np.concatenate([np.subtract(a, b) for a, b in zip(string_values, bytes_values)])).max()
+    print(f"{len(bytes_values)} of {sentences} sentences parsed, largest difference from the string parser {difference:.2e}")
+
+    string_time = best_time(string_parse, buffer, repeats)
+    bytes_time = best_time(bytes_parse, buffer, repeats)
+    print(f"String parser: {sentences / string_time:>10.0f} sentences/s, {string_time / sentences * 1e6:.2f} us per sentence")
+    print(f"Bytes parser:  {sentences / bytes_time:>10.0f} sentences/s, {bytes_time / sentences * 1e6:.2f} us per sentence")
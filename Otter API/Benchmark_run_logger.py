@@ -0,0 +1,85 @@
+import time
+import tempfile
+import os
+import numpy as np
+import pandas as pd
+import lib.Run_logger as Run_logger
+
+
+#
+#   Compares the time it takes to log one guidance cycle with pd.concat, like live_guidance did before, and with the
+#   run_logger from lib/Run_logger.py. The rows are like otter.sorted_values after log_cycle. The time per row is shown
+#   for the start and the end of the run, with pd.concat it grows with the length of the log.
+#
+
+
+##########################################################################################################################################################
+#                                                                      OPTIONS                                                                           #
+##########################################################################################################################################################
+
+
+minutes = 10                                                                                            # Length of the logged run, 600 rows per minute
+concat_minutes = 3                                                                                      # pd.concat is only run this long, it gets slow
+window = 200                                                                                            # Number of rows the time per row is averaged over
+
+
+columns = ["current_time", "lat", "lon", "height", "previous_lat", "previous_lon", "previous_height", "last_speed_update",
+           "current_course_over_ground", "current_speed", "current_fuel_capacity", "current_orientation_1", "current_orientation_2",
+           "current_orientation_3", "current_rotational_velocities_1", "current_rotational_velocities_2", "current_rotational_velocities_3",
+           "observer_lat", "observer_lon", "observer_height", "north_from_observer", "east_from_observer", "down_from_observer",
+           "previous_time", "cycle_time", "telemetry_age", "speed_n", "speed_e", "speed_surge", "speed_sway", "n1", "n2", "north_error",
+           "east_error", "distance_to_target", "yaw_setpoint", "current_angle", "tau_X", "tau_N", "target_north_from_observer",
+           "target_east_from_observer"]
+
+
+def sorted_values(rng):
+    values = dict(zip(columns, rng.uniform(-100, 100, len(columns))))
+    values["current_fuel_capacity"] = 100.0
+    return values
+
+
+def concat_log(rows, rng):
+    times = np.empty(rows)
+    log = pd.DataFrame([sorted_values(rng)], index=["start"])
+    for k in range(rows):
+        values = sorted_values(rng)
+        start = time.perf_counter()
+        temp_df = pd.DataFrame([values], index=[str(k)])
+        log = pd.concat([log, temp_df])
+        times[k] = time.perf_counter() - start
+    return times, log
+
+
+def logger_log(rows, rng, spill_path):
+    times = np.empty(rows)
+    logger = Run_logger.run_logger(spill_path)
+    for k in range(rows):
+        values = sorted_values(rng)
+        start = time.perf_counter()
+        logger.append(values)
+        times[k] = time.perf_counter() - start
+    return times, logger
+
+
+def report(name, times):
+    print(f"{name:<12} first {window} rows {times[:window].mean() * 1e6:8.1f} us per row, last {window} rows {times[-window:].mean() * 1e6:8.1f} us per row, "
+          f"total {times.sum():.2f} s for {len(times)} rows")
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+
+    concat_times, log = concat_log(concat_minutes * 600, rng)
+    report("pd.concat", concat_times)
+
+    with tempfile.TemporaryDirectory() as logs_dir:
+        logger_times, logger = logger_log(minutes * 600, rng, os.path.join(logs_dir, "run.chunks"))
+        report("run_logger", logger_times)
+
+        start = time.perf_counter()
+        logger.save(os.path.join(logs_dir, "run.csv"))
+        print(f"Saving {len(logger)} rows as CSV took {time.perf_counter() - start:.2f} s")
+        start = time.perf_counter()
+        logger.save(os.path.join(logs_dir, "run.pkl"))
+        print(f"Saving {len(logger)} rows as .pkl took {time.perf_counter() - start:.2f} s")
+        logger.close()
@@ -0,0 +1,59 @@
+import math
+import time
+import numpy as np
+import lib.Control as Control
+
+
+#
+#   Compares the k-NN inverse distance interpolation in otter_control.interpolate_force_values with the regular grid
+#   lookup table in lookup_force_values. Prints the time per call and the difference between the two for random
+#   propeller speeds inside the throttle map, for some grid resolutions.
+#
+
+
+##########################################################################################################################################################
+#                                                                      OPTIONS                                                                           #
+##########################################################################################################################################################
+
+
+samples = 20000                                                                                         # Number of random propeller speed pairs
+rpm_steps = [5, 10, 20]                                                                                 # Grid resolutions (rpm) to test
+seed = 0
+
+
+def time_per_call(function, rads_left, rads_right):
+    start = time.perf_counter()
+    for left, right in zip(rads_left, rads_right):
+        function(left, right)
+    return (time.perf_counter() - start) / len(rads_left)
+
+
+if __name__ == "__main__":
+    control = Control.otter_control()
+    control.verbose = False
+
+    rng = np.random.default_rng(seed)
+    rpm_max = max(control.rpm_left.max(), control.rpm_right.max())
+    rads_left = rng.uniform(0, rpm_max, samples) * 2 * math.pi / 60
+    rads_right = rng.uniform(0, rpm_max, samples) * 2 * math.pi / 60
+
+    reference = np.array([control.interpolate_force_values(left, right, 3)[0:2] for left, right in zip(rads_left, rads_right)])
+    idw_time = time_per_call(lambda left, right: control.interpolate_force_values(left, right, 3), rads_left.tolist(), rads_right.tolist())
+    print(f"k-NN interpolation: {idw_time * 1e6:.1f} us per call")
+
+    for rpm_step in rpm_steps:
+        start = time.perf_counter()
+        control.build_force_lut(rpm_step)
+        build_time = time.perf_counter() - start
+
+        lut_time = time_per_call(control.lookup_force_values, rads_left.tolist(), rads_right.tolist())
+
+        start = time.perf_counter()
+        force_x, force_z, speed = control.lookup_force_values(rads_left, rads_right)
+        vector_time = (time.perf_counter() - start) / samples
+
+        error = np.abs(np.column_stack((force_x, force_z)) - reference)
+        print(f"Lookup table {rpm_step} rpm ({control.lut_size}x{control.lut_size}, built in {build_time * 1e3:.1f} ms): "
+              f"{lut_time * 1e6:.2f} us per call, {vector_time * 1e9:.0f} ns per value vectorized, "
+              f"force_x error max {error[:, 0].max():.4f} mean {error[:, 0].mean():.4f}, "
+              f"force_z error max {error[:, 1].max():.4f} mean {error[:, 1].mean():.4f}")
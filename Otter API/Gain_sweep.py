@@ -0,0 +1,185 @@
+import contextlib
+import csv
+import io
+import itertools
+import math
+import multiprocessing
+import os
+import numpy as np
+import pandas as pd
+import Otter_api
+import Otter_simulator
+import lib.PID_Controller_test_v2 as PID_Controller_test_v2
+
+
+#
+#   Runs the simulator for many sets of PID gains in parallel and stores a table of metrics for each set.
+#   Runs headless, without plotting or input(). Every result is written to the results file as soon as it is finished,
+#   so a sweep that is stopped can be started again and will only run the gain sets that are missing.
+#
+
+
+##########################################################################################################################################################
+#                                                                      OPTIONS                                                                           #
+##########################################################################################################################################################
+
+
+sweep_mode = "grid"                                                                                     # "grid" for every combination of the values below or "random" for random samples
+results_file = "gain_sweep_results.csv"                                                                 # Results are appended to this file
+processes = None                                                                                        # Number of processes, None uses all cores
+
+grid = {"surge_kp" : [10, 14.39, 18], "surge_ki" : [0, 3.13], "surge_kd" : [0],                         # Values used in grid mode
+        "yaw_kp" : [10, 15.21, 20], "yaw_ki" : [0, 0.7], "yaw_kd" : [0, 1.86]}
+
+random_bounds = {"surge_kp" : [0, 30], "surge_ki" : [0, 5], "surge_kd" : [0, 15],                       # [min, max] used in random mode
+                 "yaw_kp" : [0, 30], "yaw_ki" : [0, 5], "yaw_kd" : [0, 15]}
+random_samples = 200
+random_seed = 0
+
+# Scenario that is simulated for every gain set. Same options as in main.py
+scenario = {"N" : 13333, "sampleTime" : 0.02, "target_list" : [[0, 10000]], "use_target_coordinates" : False,
+            "target_radius" : 1, "use_moving_target" : True, "moving_target_start" : [0, -10],
+            "moving_target_increase" : [-1.5, 0.0], "end_when_last_target_reached" : False, "circular_target" : True,
+            "use_compiled_dynamics" : True, "integrator" : "euler"}
+
+
+gain_names = ["surge_kp", "surge_ki", "surge_kd", "yaw_kp", "yaw_ki", "yaw_kd"]
+metric_names = ["avg_distance", "reached_target_time", "settling_time", "peak_tau_X", "peak_tau_N"]
+
+
+# Every combination of the values in a dictionary with a list of values for each gain
+def grid_parameters(values):
+    return [dict(zip(gain_names, combination)) for combination in itertools.product(*(values[name] for name in gain_names))]
+
+
+# Random gain sets drawn uniformly between the [min, max] values for each gain
+def random_parameters(bounds, samples, seed=None):
+    rng = np.random.default_rng(seed)
+    parameter_sets = []
+    for _ in range(samples):
+        parameter_sets.append({name : float(rng.uniform(bounds[name][0], bounds[name][1])) for name in gain_names})
+    return parameter_sets
+
+
+# Key used to find gain sets that are already in the results file
+def parameter_key(parameters):
+    return tuple(round(float(parameters[name]), 9) for name in gain_names)
+
+
+# Calculates the metrics of one simulation. The distance is to the moving target, or to the current target in the target list
+def calculate_metrics(simTime, simData, targetData, force_array, scenario):
+    t = simTime[:simData.shape[0], 0]
+    position = simData[:, 0:2]
+
+    if scenario["use_moving_target"]:
+        target = targetData[:simData.shape[0]]
+    else:
+        target = np.array(scenario["target_list"][-1], float)
+
+    distance = np.sqrt(((target - position) ** 2).sum(axis=1))
+    within = distance < scenario["target_radius"] + 2                                       # Same limit as the verbose printing in the simulator
+
+    if within.any():
+        reached_target_time = t[np.argmax(within)]
+    else:
+        reached_target_time = math.nan
+
+    # Settling time is the start of the last period where the Otter stays within the limit until the end of the run
+    if within[-1]:
+        outside = np.flatnonzero(~within)
+        settling_time = t[outside[-1] + 1] if len(outside) else t[0]
+    else:
+        settling_time = math.nan
+
+    return {"avg_distance" : float(distance.mean()),
+            "reached_target_time" : float(reached_target_time),
+            "settling_time" : float(settling_time),
+            "peak_tau_X" : float(np.abs(force_array[:, 0]).max()) if len(force_array) else math.nan,
+            "peak_tau_N" : float(np.abs(force_array[:, 1]).max()) if len(force_array) else math.nan}
+
+
+_otter = None
+
+
+# Runs once in every worker process. The Otter API object only holds the control allocation and throttle map
+def _init_worker():
+    global _otter
+    _otter = Otter_api.otter()
+    _otter.otter_control.verbose = False
+    _otter.otter_connector.verbose = False
+
+
+# Runs one simulation and returns the gains together with the metrics
+def run_simulation(parameters, scenario):
+    if _otter is None:
+        _init_worker()
+
+    simulator = Otter_simulator.otter_simulator(scenario["target_list"], scenario["use_target_coordinates"], scenario["target_radius"],
+                                                scenario["use_moving_target"], list(scenario["moving_target_start"]),
+                                                scenario["moving_target_increase"], scenario["end_when_last_target_reached"],
+                                                False, False, scenario["circular_target"], scenario.get("use_compiled_dynamics", False),
+                                                scenario.get("integrator", "euler"))
+    simulator.record_forces = True
+
+    surge_PID = PID_Controller_test_v2.PIDController(parameters["surge_kp"], parameters["surge_ki"], parameters["surge_kd"])
+    yaw_PID = PID_Controller_test_v2.PIDController(parameters["yaw_kp"], parameters["yaw_ki"], parameters["yaw_kd"])
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        with np.errstate(all='ignore'):
+            simTime, simData, targetData = simulator.simulate(scenario["N"], scenario["sampleTime"], _otter, surge_PID, yaw_PID)
+
+    result = {name : float(parameters[name]) for name in gain_names}
+    result.update(calculate_metrics(simTime, simData, targetData, simulator.force_array, scenario))
+    return result
+
+
+def _run_simulation(arguments):
+    return run_simulation(*arguments)
+
+
+# Runs all gain sets that are not already in the results file and returns the complete results table
+def run_sweep(parameter_sets, scenario, results_file, processes=None):
+    columns = gain_names + metric_names
+
+    done = set()
+    if os.path.exists(results_file) and os.path.getsize(results_file) > 0:
+        previous = pd.read_csv(results_file, sep=';')
+        done = {parameter_key(row) for row in previous[gain_names].to_dict("records")}
+
+    remaining = []
+    for parameters in parameter_sets:
+        key = parameter_key(parameters)
+        if key not in done:
+            remaining.append(parameters)
+            done.add(key)
+
+    print(f"{len(parameter_sets) - len(remaining)} gain sets already done, running {len(remaining)}")
+
+    if remaining:
+        new_file = not os.path.exists(results_file) or os.path.getsize(results_file) == 0
+        if processes is None:
+            processes = os.cpu_count() or 1
+
+        with open(results_file, "a", newline="") as file:
+            writer = csv.DictWriter(file, fieldnames=columns, delimiter=';')
+            if new_file:
+                writer.writeheader()
+                file.flush()
+
+            with multiprocessing.Pool(processes, initializer=_init_worker) as pool:
+                for count, result in enumerate(pool.imap_unordered(_run_simulation, [(parameters, scenario) for parameters in remaining]), 1):
+                    writer.writerow(result)
+                    file.flush()
+                    print(f"Finished {count}/{len(remaining)}: {result}")
+
+    return pd.read_csv(results_file, sep=';')
+
+
+if __name__ == "__main__":
+    if sweep_mode == "grid":
+        parameter_sets = grid_parameters(grid)
+    else:
+        parameter_sets = random_parameters(random_bounds, random_samples, random_seed)
+
+    results = run_sweep(parameter_sets, scenario, results_file, processes)
+    print(results.sort_values("avg_distance").head(10))
@@ -1,7 +1,8 @@
 import lib.Control as Control
 import lib.Connector as Connector
+import lib.Projection as Projection
 import time
-import pymap3d as pm
+import threading
 import math
 
 
@@ -11,18 +12,25 @@ import math
 
 class otter():
 
-    def __init__(self):
+    def __init__(self, otter_connector=None):
 
         self.verbose = True
 
-        # Creates instances of the connector and control classes
-        self.otter_connector = Connector.otter_connector()
+        # Creates instances of the connector and control classes. An async_otter_connector from lib/Async_connector.py can be passed instead
+        if otter_connector is None:
+            otter_connector = Connector.otter_connector()
+        self.otter_connector = otter_connector
         self.otter_control = Control.otter_control()
 
 
         # The observer coordinates for the geodetic to ned conversion. This can be changed manually
         self.observer_coordinates = [59.908642666666665, 10.71945885, 0.0]
 
+        # The geodetic to ned conversion for the observer coordinates, made again when the observer coordinates change.
+        # Set use_flat_earth to True to use the flat earth approximation, see lib/Projection.py
+        self.projection = None
+        self.use_flat_earth = False
+
 
         # Creates an empty dictionary for the values
         self.values = {}
@@ -36,6 +44,12 @@ class otter():
 
         self.sorted_values["current_time"] = time.time()
 
+        # Background telemetry. The newest snapshot of the values is replaced as a whole by the receiver thread and never
+        # changed after, so the control loop can read it without locks
+        self.telemetry = None
+        self.telemetry_thread = None
+        self.telemetry_stop = threading.Event()
+
     # Tries to establish connection to the otter. Default values are in place for testing on a local machine with a test server. Returns boolean
     def establish_connection(self, ip, port):
         return self.otter_connector.establish_connection(ip, port)
@@ -57,16 +71,81 @@ class otter():
         return self.otter_connector.send_message(message, checksum_needed)
 
     # Tries to update all the values in the dictionary "values" with the current values from the Otter. Requires connection established. Returns updated dictionary "values"
+    # If the telemetry thread is running the newest snapshot is used, so this does not wait for the Otter
     def update_values(self):
+        if self.telemetry_thread is not None:
+            return self.sort_values(self.telemetry)
         self.otter_connector.update_values(timeout = 0.1)
-        self.values["current_position"] = self.otter_connector.current_position
-        self.values["previous_position"] = self.otter_connector.previous_position
-        self.values["last_speed_update"] = self.otter_connector.last_speed_update
-        self.values["current_course_over_ground"] = self.otter_connector.current_course_over_ground
-        self.values["current_speed"] = self.otter_connector.current_speed
-        self.values["current_fuel_capacity"] = self.otter_connector.current_fuel_capacity
-        self.values["current_orientation"] = self.otter_connector.current_orientation
-        self.values["current_rotational_velocities"] = self.otter_connector.current_rotational_velocities
+        return self.sort_values()
+
+    # Copies the current values from the connector into a new dictionary. "update_time" is when the last message was received,
+    # "connected" is False when the connection is closed and the values will not be updated any more
+    def telemetry_snapshot(self):
+        return {"current_position" : list(self.otter_connector.current_position),
+                "previous_position" : list(self.otter_connector.previous_position),
+                "last_speed_update" : self.otter_connector.last_speed_update,
+                "current_course_over_ground" : self.otter_connector.current_course_over_ground,
+                "current_speed" : self.otter_connector.current_speed,
+                "current_fuel_capacity" : self.otter_connector.current_fuel_capacity,
+                "current_orientation" : list(self.otter_connector.current_orientation),
+                "current_rotational_velocities" : list(self.otter_connector.current_rotational_velocities),
+                "update_time" : self.otter_connector.last_update_time,
+                "connected" : self.otter_connector.connection_status}
+
+    # Starts a thread that keeps reading the messages from the Otter and publishes a new snapshot after every read.
+    # Requires connection established. Not needed with the async_otter_connector, which already reads in a task of its own
+    def start_telemetry(self):
+        if self.telemetry_thread is not None:
+            if self.telemetry_thread.is_alive():
+                return
+            self.telemetry_thread.join()                                    # Stopped when the connection was closed
+        self.telemetry = self.telemetry_snapshot()
+        self.telemetry_stop.clear()
+        self.telemetry_thread = threading.Thread(target=self.telemetry_loop, daemon=True)
+        self.telemetry_thread.start()
+
+    # Stops the telemetry thread, update_values reads from the Otter again
+    def stop_telemetry(self):
+        if self.telemetry_thread is None:
+            return
+        self.telemetry_stop.set()
+        self.telemetry_thread.join()
+        self.telemetry_thread = None
+
+    # Stops by itself when the Otter closes the connection. The last snapshot then has "connected" False and update_values
+    # keeps returning it, so telemetry_age shows how old the values are
+    def telemetry_loop(self):
+        while not self.telemetry_stop.is_set():
+            try:
+                self.otter_connector.update_values(timeout = 0.1)
+            except Exception as e:
+                print(f"Error when reading telemetry from the Otter: {e}")
+                time.sleep(0.1)
+            self.telemetry = self.telemetry_snapshot()
+            if not self.telemetry["connected"]:
+                print("Telemetry stopped, the connection to the Otter is closed")
+                return
+
+    # Seconds since the last message in the newest snapshot was received, None if nothing is received yet
+    def telemetry_age(self):
+        telemetry = self.telemetry
+        if telemetry is None or telemetry["update_time"] is None:
+            return None
+        return time.time() - telemetry["update_time"]
+
+    # Updates the dictionaries "values" and "sorted_values" from a snapshot of the values without reading from the Otter. Uses the current values in the connector if no snapshot is given. Returns dictionary "values"
+    def sort_values(self, telemetry=None):
+        if telemetry is None:
+            telemetry = self.telemetry_snapshot()
+
+        self.values["current_position"] = telemetry["current_position"]
+        self.values["previous_position"] = telemetry["previous_position"]
+        self.values["last_speed_update"] = telemetry["last_speed_update"]
+        self.values["current_course_over_ground"] = telemetry["current_course_over_ground"]
+        self.values["current_speed"] = telemetry["current_speed"]
+        self.values["current_fuel_capacity"] = telemetry["current_fuel_capacity"]
+        self.values["current_orientation"] = telemetry["current_orientation"]
+        self.values["current_rotational_velocities"] = telemetry["current_rotational_velocities"]
         self.values["observer_coordinates"] = self.observer_coordinates
         self.values["geo2ned_from_observer"] = self.geo2ned_from_observer
         #self.values["yaw"] = self.otter_connector.yaw
@@ -102,9 +181,11 @@ class otter():
         self.sorted_values["previous_time"] = self.sorted_values["current_time"]
         self.sorted_values["current_time"] = time.time()
         self.sorted_values["cycle_time"] = self.sorted_values["current_time"] - self.sorted_values["previous_time"]
+        if telemetry["update_time"] is not None:
+            self.sorted_values["telemetry_age"] = self.sorted_values["current_time"] - telemetry["update_time"]
 
-        prev_pos_ned = pm.geodetic2ned(self.sorted_values["previous_lat"], self.sorted_values["previous_lon"], self.sorted_values["previous_height"], self.sorted_values["observer_lat"], self.sorted_values["observer_lon"], self.sorted_values["observer_height"])
-        cur_pos_ned = pm.geodetic2ned(self.sorted_values["lat"], self.sorted_values["lon"], self.sorted_values["height"], self.sorted_values["observer_lat"], self.sorted_values["observer_lon"], self.sorted_values["observer_height"])
+        prev_pos_ned = self.observer_projection().ned(self.sorted_values["previous_lat"], self.sorted_values["previous_lon"], self.sorted_values["previous_height"])
+        cur_pos_ned = self.geo2ned_from_observer
 
         diff_n = cur_pos_ned[0] - prev_pos_ned[0]
         diff_e = cur_pos_ned[1] - prev_pos_ned[1]
@@ -122,9 +203,16 @@ class otter():
 
     # Takes the otter coordinates and converts it to north east down observed from the observer coordinates
     def geo2ned_position(self):
-        n, e, d = pm.geodetic2ned(self.sorted_values["lat"], self.sorted_values["lon"], self.sorted_values["height"], self.sorted_values["observer_lat"], self.sorted_values["observer_lon"], self.sorted_values["observer_height"])
+        n, e, d = self.observer_projection().ned(self.sorted_values["lat"], self.sorted_values["lon"], self.sorted_values["height"])
         self.geo2ned_from_observer = [n, e, d]
 
+    # Returns the geodetic to ned projection for the current observer coordinates
+    def observer_projection(self):
+        observer = tuple(float(value) for value in self.observer_coordinates)
+        if self.projection is None or self.projection.observer != observer or self.projection.use_flat_earth != self.use_flat_earth:
+            self.projection = Projection.ned_projection(observer, self.use_flat_earth)
+        return self.projection
+
     # Tries to set the Otter in manual control mode, controlling the x, y and torques. force_y is not in use.
     def set_manual_control_mode(self, force_x, force_y, torque_z):
         if self.check_connection():
@@ -197,7 +285,7 @@ class otter():
         #return self.set_thrusters(throttle_left, throttle_right)                                            #  For interpolating 1D throttle map
 
 
-        torque_z, torque_x, speed = self.otter_control.interpolate_force_values(n1, n2, 3)                  # Speed is in rads
+        torque_z, torque_x, speed = self.otter_control.force_values(n1, n2, 3)                  # Speed is in rads
 
         if torque_z < 0.05:
             torque_z = 0.0
@@ -222,7 +310,7 @@ class otter():
     # Takes input in radS for each propeller and sends the command to the Otter
     def controller_inputs_radS(self, n1, n2, on_linux=False, surge_setpoint=1):
         if n1 < n2:
-            torque_z, torque_x, speed = self.otter_control.interpolate_force_values(n2, n1, 3)          # Inverts the yaw direciton because of the interpolation map
+            torque_z, torque_x, speed = self.otter_control.force_values(n2, n1, 3)          # Inverts the yaw direciton because of the interpolation map
 
             # Scipy 2D interpolate has some bugs on linux........
             if on_linux:
@@ -232,7 +320,7 @@ class otter():
                         torque_z = 0
             return self.set_manual_control_mode(torque_x, 0.0, torque_z * -1)
         else:
-            torque_z, torque_x, speed = self.otter_control.interpolate_force_values(n1, n2, 3)
+            torque_z, torque_x, speed = self.otter_control.force_values(n1, n2, 3)
             # Scipy 2D interpolate has some bugs on linux........
             if on_linux:
                 if "distance_to_target" in self.sorted_values:
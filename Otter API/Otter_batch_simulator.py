@@ -0,0 +1,336 @@
+import numpy as np
+from lib.gnc import crossFlowDragCoeff, crossFlowDragFast
+from lib.History_buffer import history_buffer
+import lib.Trajectory as Trajectory
+
+
+#
+#   Simulates many Otters in lockstep. Each vessel is described by an otter_simulator object (targets, moving target,
+#   current V_c/beta_c and payload mp), and gets its own surge and yaw PID controller. The states of all vessels are
+#   stored as (M, 6) and (M, 2) arrays and the dynamics and attitude are integrated for the whole batch at once.
+#
+#   The target options use_target_coordinates, use_moving_target and circular_target must be the same for all vessels.
+#   The target list, moving target start, moving target increase and target radius can be different for each vessel.
+#   If end_when_last_target_reached is set the batch runs until every vessel has reached its last target.
+#
+
+
+# Skew-symmetric matrices S(a) for a batch of vectors a with shape (M, 3)
+def batch_Smtrx(a):
+    S = np.zeros((a.shape[0], 3, 3))
+    S[:, 0, 1] = -a[:, 2]
+    S[:, 0, 2] = a[:, 1]
+    S[:, 1, 0] = a[:, 2]
+    S[:, 1, 2] = -a[:, 0]
+    S[:, 2, 0] = -a[:, 1]
+    S[:, 2, 1] = a[:, 0]
+    return S
+
+
+class otter_batch_simulator():
+
+    def __init__(self, simulators):
+
+        self.simulators = simulators
+        self.vessels = len(simulators)
+
+        first = simulators[0]
+        for simulator in simulators:
+            if (simulator.use_target_coordinates != first.use_target_coordinates or simulator.use_moving_target != first.use_moving_target
+                    or simulator.circular_target != first.circular_target):
+                raise ValueError("All simulators in a batch must use the same target options")
+
+        self.use_target_coordinates = first.use_target_coordinates
+        self.use_moving_target = first.use_moving_target
+        self.circular_target = first.circular_target
+        self.end_when_last_target_reached = any(simulator.end_when_last_target_reached for simulator in simulators)
+        self.verbose = any(simulator.verbose for simulator in simulators)
+        self.max_force = first.max_force
+        self.control_period = first.control_period
+        self.dimU = first.dimU
+
+        # Stacked model constants, one row for each vessel
+        self.Minv = np.array([simulator.Minv for simulator in simulators])
+        self.D = np.array([simulator.D for simulator in simulators])
+        self.G = np.array([simulator.G for simulator in simulators])
+        self.MA_sym = np.array([0.5 * (simulator.MA + simulator.MA.T) for simulator in simulators])
+        self.H_rg = np.array([simulator.H_rg for simulator in simulators])
+        self.Ig = np.array([simulator.Ig for simulator in simulators])
+        self.S_rp = np.array([simulator.S_rp for simulator in simulators])
+        self.m_total = np.array([simulator.m_total for simulator in simulators], float)
+        self.mp = np.array([simulator.mp for simulator in simulators], float)
+        self.V_c = np.array([simulator.V_c for simulator in simulators], float)
+        self.beta_c = np.array([simulator.beta_c for simulator in simulators], float)
+        self.T = np.array([simulator.T for simulator in simulators], float)
+        self.surge_setpoint = np.array([simulator.surge_setpoint for simulator in simulators], float)
+
+        self.g = first.g
+        self.L = first.L
+        self.T_n = first.T_n
+        self.k_pos = first.k_pos
+        self.k_neg = first.k_neg
+        self.n_min = first.n_min
+        self.n_max = first.n_max
+        self.l1 = first.l1
+        self.l2 = first.l2
+
+        # Cross-flow drag coefficients, one set for each vessel since the draft depends on the payload
+        self.crossflow = crossFlowDragCoeff(np.full(self.vessels, self.L), np.array([simulator.B_pont for simulator in simulators], float), self.T)
+
+        # Target lists padded to the same length
+        self.target_count = np.array([len(simulator.target_list) for simulator in simulators])
+        self.target_lists = np.zeros((self.vessels, self.target_count.max(), 2))
+        for k, simulator in enumerate(simulators):
+            self.target_lists[k, :self.target_count[k]] = np.array(simulator.target_list, float)
+
+        self.moving_target = np.array([simulator.moving_target_start for simulator in simulators], float)
+        self.moving_target_increase = np.array([simulator.moving_target_increase for simulator in simulators], float)
+
+
+    def simulate(self, N, sampleTime, otter, surge_PIDs, yaw_PIDs):
+
+        M = self.vessels
+        DOF = 6
+        rows = np.arange(M)
+        t = 0
+
+        # Initial state vectors
+        eta = np.zeros((M, DOF))
+        nu = np.array([simulator.nu for simulator in self.simulators], float)
+        u_actual = np.array([simulator.u_actual for simulator in self.simulators], float)
+
+        tau_X = np.zeros(M)
+        tau_N = np.zeros(M)
+        yaw_setpoint = np.array([simulator.yaw_setpoint for simulator in self.simulators], float)
+        distance_to_target = np.array([simulator.distance_to_target for simulator in self.simulators], float)
+        dist_tot = np.zeros(M)
+
+        if self.end_when_last_target_reached:
+            capacity = min(N + 1, 10000)
+        else:
+            capacity = N + 1
+
+        simData = history_buffer(M * (2 * DOF + 2 * self.dimU), capacity)
+        targetData = history_buffer(M * 2, capacity + 1)
+        # Moving target paths, built once for each vessel from the same parts as otter_simulator
+        if self.use_moving_target:
+            self.moving_target = np.array([simulator.moving_target_start for simulator in self.simulators], float)
+            target_paths = np.array([Trajectory.trajectory(simulator.moving_target_start,
+                                                           simulator.scenario if simulator.scenario is not None else simulator.moving_target_parts(),
+                                                           sampleTime, N + 1).positions for simulator in self.simulators])
+
+        targetData.append(self.moving_target.ravel())
+
+        target_counter = np.zeros(M, int)
+        last_target = self.target_count - 1
+
+        control_every = max(1, int(round(self.control_period / sampleTime)))
+
+        i = 0
+
+        while i < (N + 1):
+            t = i * sampleTime
+
+            if self.use_target_coordinates:
+                target = self.target_lists[rows, target_counter]
+                north_distance = target[:, 0] - eta[:, 0]
+                east_distance = target[:, 1] - eta[:, 1]
+                distance_to_target = np.sqrt(north_distance**2 + east_distance**2)
+
+                # Goes to the next target when the current target is reached
+                next_target = (distance_to_target < self.surge_setpoint) & (target_counter < last_target)
+                if next_target.any():
+                    target_counter = target_counter + next_target
+                    target = self.target_lists[rows, target_counter]
+                    north_distance = target[:, 0] - eta[:, 0]
+                    east_distance = target[:, 1] - eta[:, 1]
+                    distance_to_target = np.sqrt(north_distance**2 + east_distance**2)
+
+                # Ends the simulation when every vessel has reached its final target
+                if self.end_when_last_target_reached:
+                    if np.all((target_counter == last_target) & (distance_to_target < self.surge_setpoint)):
+                        i = N
+                        if self.verbose:
+                            print(f"Time is: {t}s!")
+
+                yaw_setpoint = np.arctan2(east_distance, north_distance)
+
+            # Handles the tracking of the moving target
+            if self.use_moving_target:
+                north_distance = self.moving_target[:, 0] - eta[:, 0]
+                east_distance = self.moving_target[:, 1] - eta[:, 1]
+
+                distance_to_target = np.sqrt(north_distance**2 + east_distance**2)
+                dist_tot = dist_tot + distance_to_target
+
+                reached = distance_to_target <= self.surge_setpoint
+                north_distance = np.where(reached, 0.0, north_distance)
+                east_distance = np.where(reached, 0.0, east_distance)
+                distance_to_target = np.where(reached, 0.0, distance_to_target)
+
+                yaw_setpoint = np.arctan2(east_distance, north_distance)
+
+                # Moves the targets to the positions at the end of this sample
+                self.moving_target[:] = target_paths[:, i + 1]
+
+            angle = eta[:, 5]
+
+            # Each vessel has its own controllers, these are sampled every control period with the simulated sample time
+            if i % control_every == 0:
+                control_sample_time = control_every * sampleTime if i > 0 else 0
+                for k in range(M):
+                    tau_X[k] = surge_PIDs[k].calculate_surge(self.surge_setpoint[k], distance_to_target[k], yaw_setpoint[k], angle[k], control_sample_time)
+                    tau_N[k] = yaw_PIDs[k].calculate_yaw(yaw_setpoint[k], angle[k], self.surge_setpoint[k], distance_to_target[k], control_sample_time)
+
+            # Makes sure that the forces are not over saturated and prioritizes yaw movement
+            tau_N = np.clip(tau_N, -self.max_force, self.max_force)
+            remaining_force = self.max_force - np.abs(tau_N)
+            tau_X = np.clip(tau_X, -remaining_force, remaining_force)
+
+            # Control allocation for all vessels. The throttle map is for positive yaw, so the thrusters are swapped for negative yaw
+            n1, n2 = otter.otter_control.controlAllocation_vectorized(tau_X, np.abs(tau_N))
+            n = np.stack((n1, n2), axis=1)
+
+            u_control = np.where((tau_N < 0)[:, None], n[:, ::-1], n)
+
+            # Store simulation data, one block of 16 columns for each vessel
+            signals = simData.next_row().reshape(M, 2 * DOF + 2 * self.dimU)
+            signals[:, 0:6] = eta
+            signals[:, 6:12] = nu
+            signals[:, 12:14] = u_control
+            signals[:, 14:16] = u_actual
+
+            # Propagate vehicle and attitude dynamics
+            [nu_next, u_actual] = self.dynamics(eta, nu, u_actual, u_control, sampleTime)
+            eta = self.attitudeEuler(eta, nu_next, sampleTime)
+            nu = nu_next
+
+            targetData.append(self.moving_target.ravel())
+
+            i = i + 1
+
+        self.avg_distance = dist_tot / i
+        if self.verbose:
+            print(f"AVG distance to target = {self.avg_distance}")
+
+        simTime = np.arange(start=0, stop=t+sampleTime, step=sampleTime)[:, None]
+
+        # Stacked results with the same column layout as otter_simulator.simulate
+        simData = simData.array().reshape(-1, M, 2 * DOF + 2 * self.dimU).transpose(1, 0, 2)
+        targetData = targetData.array().reshape(-1, M, 2).transpose(1, 0, 2)
+
+        return (simTime, simData, targetData)
+
+
+    def dynamics(self, eta, nu, u_actual, u_control, sampleTime):
+        """
+        [nu,u_actual] = dynamics(eta,nu,u_actual,u_control,sampleTime) integrates
+        the Otter USV equations of motion for all vessels using Euler's method.
+        """
+
+        M = self.vessels
+
+        # Current velocities
+        u_c = self.V_c * np.cos(self.beta_c - eta[:, 5])
+        v_c = self.V_c * np.sin(self.beta_c - eta[:, 5])
+
+        nu_c = np.zeros((M, 6))
+        nu_c[:, 0] = u_c
+        nu_c[:, 1] = v_c
+        Dnu_c = np.zeros((M, 6))
+        Dnu_c[:, 0] = nu[:, 5] * v_c
+        Dnu_c[:, 1] = -nu[:, 5] * u_c
+        nu_r = nu - nu_c
+
+        # Rigid body Coriolis and centripetal matrices
+        CRB_CG = np.zeros((M, 6, 6))
+        CRB_CG[:, 0:3, 0:3] = self.m_total[:, None, None] * batch_Smtrx(nu[:, 3:6])
+        CRB_CG[:, 3:6, 3:6] = -batch_Smtrx(np.einsum('kij,kj->ki', self.Ig, nu[:, 3:6]))
+        CRB = np.einsum('kji,kjl,klm->kim', self.H_rg, CRB_CG, self.H_rg)
+
+        # Added mass Coriolis and centripetal matrices
+        dt_dnu1 = np.einsum('kij,kj->ki', self.MA_sym[:, 0:3, 0:3], nu_r[:, 0:3]) + np.einsum('kij,kj->ki', self.MA_sym[:, 0:3, 3:6], nu_r[:, 3:6])
+        dt_dnu2 = np.einsum('kji,kj->ki', self.MA_sym[:, 0:3, 3:6], nu_r[:, 0:3]) + np.einsum('kij,kj->ki', self.MA_sym[:, 3:6, 3:6], nu_r[:, 3:6])
+        CA = np.zeros((M, 6, 6))
+        CA[:, 0:3, 3:6] = -batch_Smtrx(dt_dnu1)
+        CA[:, 3:6, 0:3] = -batch_Smtrx(dt_dnu1)
+        CA[:, 3:6, 3:6] = -batch_Smtrx(dt_dnu2)
+        CA[:, 5, 0] = 0  # assume that the Munk moment in yaw can be neglected
+        CA[:, 5, 1] = 0  # if nonzero, must be balanced by adding nonlinear damping
+        CA[:, 0, 5] = 0
+        CA[:, 1, 5] = 0
+
+        C = CRB + CA
+
+        # Payload force and moment expressed in BODY
+        cphi = np.cos(eta[:, 3])
+        sphi = np.sin(eta[:, 3])
+        cth = np.cos(eta[:, 4])
+        sth = np.sin(eta[:, 4])
+        f_payload = (self.mp * self.g)[:, None] * np.stack((-sth, cth * sphi, cth * cphi), axis=1)
+        m_payload = np.einsum('kij,kj->ki', self.S_rp, f_payload)
+        g_0 = np.concatenate((f_payload, m_payload), axis=1)
+
+        # Control forces and moments - with propeller revolution saturation
+        n = np.clip(u_actual, self.n_min, self.n_max)
+        thrust = np.where(n > 0, self.k_pos, self.k_neg) * n * np.abs(n)
+
+        tau = np.zeros((M, 6))
+        tau[:, 0] = thrust[:, 0] + thrust[:, 1]
+        tau[:, 5] = -self.l1 * thrust[:, 0] - self.l2 * thrust[:, 1]
+
+        # Hydrodynamic linear damping + nonlinear yaw damping
+        tau_damp = -np.einsum('kij,kj->ki', self.D, nu_r)
+        tau_damp[:, 5] = tau_damp[:, 5] - 10 * self.D[:, 5, 5] * np.abs(nu_r[:, 5]) * nu_r[:, 5]
+
+        # Cross-flow drag using strip theory
+        tau_crossflow = crossFlowDragFast(self.crossflow, nu_r)
+
+        sum_tau = (
+            tau
+            + tau_damp
+            + tau_crossflow
+            - np.einsum('kij,kj->ki', C, nu_r)
+            - np.einsum('kij,kj->ki', self.G, eta)
+            + g_0
+        )
+
+        nu_dot = Dnu_c + np.einsum('kij,kj->ki', self.Minv, sum_tau)  # USV dynamics
+        n_dot = (u_control - n) / self.T_n                              # propeller dynamics
+
+        # Forward Euler integration [k+1]
+        nu = nu + sampleTime * nu_dot
+        n = n + sampleTime * n_dot
+
+        return nu, n
+
+
+    def attitudeEuler(self, eta, nu, sampleTime):
+        """
+        eta = attitudeEuler(eta,nu,sampleTime) computes the generalized
+        position/Euler angles eta[k+1] for all vessels
+        """
+
+        cphi = np.cos(eta[:, 3])
+        sphi = np.sin(eta[:, 3])
+        cth = np.cos(eta[:, 4])
+        sth = np.sin(eta[:, 4])
+        cpsi = np.cos(eta[:, 5])
+        spsi = np.sin(eta[:, 5])
+
+        u = nu[:, 0]
+        v = nu[:, 1]
+        w = nu[:, 2]
+        p = nu[:, 3]
+        q = nu[:, 4]
+        r = nu[:, 5]
+
+        eta_next = np.empty_like(eta)
+        eta_next[:, 0] = eta[:, 0] + sampleTime * (cpsi * cth * u + (-spsi * cphi + cpsi * sth * sphi) * v + (spsi * sphi + cpsi * cphi * sth) * w)
+        eta_next[:, 1] = eta[:, 1] + sampleTime * (spsi * cth * u + (cpsi * cphi + sphi * sth * spsi) * v + (-cpsi * sphi + sth * spsi * cphi) * w)
+        eta_next[:, 2] = eta[:, 2] + sampleTime * (-sth * u + cth * sphi * v + cth * cphi * w)
+        eta_next[:, 3] = eta[:, 3] + sampleTime * (p + sphi * sth / cth * q + cphi * sth / cth * r)
+        eta_next[:, 4] = eta[:, 4] + sampleTime * (cphi * q - sphi * r)
+        eta_next[:, 5] = eta[:, 5] + sampleTime * (sphi / cth * q + cphi / cth * r)
+
+        return eta_next
@@ -0,0 +1,310 @@
+import asyncio
+import math
+import time
+import numpy as np
+import Otter_simulator
+import lib.Connector as Connector
+import lib.Control as Control
+import lib.Projection as Projection
+
+
+#
+#   Emulates the Otter on a local socket server, for testing the Otter API and live guidance without the boat. The otter_simulator
+#   dynamics are run in real time, or faster with speedup, and the emulator streams $PMARGPS, $PMARIMU and $PMARMOD sentences
+#   with valid checksums like the Otter does. $PMARMAN and $PMARABT commands from the clients drive the simulated Otter:
+#   the forces in $PMARMAN are turned into propeller speeds with bilinear interpolation in the throttle map, the same map
+#   lib/Control.py uses the other way. Like the Otter, it drifts if no $PMARMAN is received for command_timeout seconds.
+#
+#   The rates are in simulated time, so with speedup = 10 ten times as many sentences are sent per second. The emulator
+#   prints statistics of the telemetry and the commands every stats_interval seconds. Run this file and connect with
+#   ip = "localhost" and port = 2009, or see Benchmark_emulator.py for an end to end benchmark.
+#
+
+
+##########################################################################################################################################################
+#                                                                      OPTIONS                                                                           #
+##########################################################################################################################################################
+
+
+ip = "localhost"
+port = 2009
+speedup = 1                                                                                             # Simulated seconds per real second
+sampleTime = 0.02                                                                                       # Simulation time per sample
+gps_rate = 10                                                                                           # $PMARGPS sentences per simulated second
+imu_rate = 50                                                                                           # $PMARIMU sentences per simulated second
+mod_rate = 1                                                                                            # $PMARMOD sentences per simulated second
+start_position = [59.908642666666665, 10.71945885, 0.0]                                                 # Latitude, longitude and height the Otter starts at
+start_heading = 0                                                                                       # Degrees from north
+command_timeout = 3                                                                                     # Seconds without $PMARMAN before the Otter drifts
+stats_interval = 5                                                                                      # Seconds between the printed statistics, None for no printing
+
+
+class otter_emulator():
+
+    def __init__(self, start_position, start_heading=0, sampleTime=0.02, speedup=1, gps_rate=10, imu_rate=50, mod_rate=1,
+                 command_timeout=3, integrator="euler"):
+
+        self.sampleTime = sampleTime
+        self.speedup = speedup
+        self.gps_period = int(round(1 / (gps_rate * sampleTime))) if gps_rate else None                 # Samples between the sentences
+        self.imu_period = int(round(1 / (imu_rate * sampleTime))) if imu_rate else None
+        self.mod_period = int(round(1 / (mod_rate * sampleTime))) if mod_rate else None
+        self.command_timeout = command_timeout
+
+        # The simulator is only used for the dynamics, the targets and the controllers are not used
+        self.simulator = Otter_simulator.otter_simulator([[0, 0]], False, 1, False, [0, 0], [0, 0], False, False, False, False, False, integrator)
+        self.projection = Projection.ned_projection(start_position)
+
+        self.eta = np.zeros(6)
+        self.eta[5] = math.radians(start_heading)
+        self.nu = np.zeros(6)
+        self.u_actual = np.zeros(2)
+        self.u_control = np.zeros(2)
+        self.samples = 0
+        self.sim_time = 0.0
+        self.start_wall_time = time.time()
+
+        self.load_throttle_grid()
+
+        # Newest command from the clients as (force_x, torque_z), None when drifting
+        self.command = None
+        self.command_sim_time = 0.0
+
+        self.clients = set()
+        self.reset_stats()
+
+
+    # The throttle map as a grid of rpm's. Rows are the torque and columns the surge force, the same as lib/Control.py reads it
+    def load_throttle_grid(self):
+        control = Control.otter_control()
+        self.grid_torque = np.unique(control.force_x)
+        self.grid_surge = np.unique(control.force_z)
+        shape = (len(self.grid_torque), len(self.grid_surge))
+        if len(control.rpm_left) != shape[0] * shape[1]:
+            raise ValueError("The throttle map must have a value in every cell to be used by the emulator")
+        self.grid_rpm = np.stack((control.rpm_left.reshape(shape), control.rpm_right.reshape(shape)), axis=-1)
+
+
+    # Propeller speeds (rad/s) for a $PMARMAN command. Bilinear interpolation in the throttle map with the size of the
+    # forces. A negative torque swaps the propellers. A negative surge force reverses them, and swaps them so the yaw
+    # moment keeps the sign of the torque
+    def command_to_rads(self, force_x, torque_z):
+        x = np.interp(abs(torque_z), self.grid_torque, np.arange(len(self.grid_torque)))
+        y = np.interp(abs(force_x), self.grid_surge, np.arange(len(self.grid_surge)))
+        i = min(int(x), len(self.grid_torque) - 2)
+        j = min(int(y), len(self.grid_surge) - 2)
+        fx = x - i
+        fy = y - j
+
+        rpm = ((1 - fx) * (1 - fy) * self.grid_rpm[i, j] + fx * (1 - fy) * self.grid_rpm[i + 1, j]
+               + (1 - fx) * fy * self.grid_rpm[i, j + 1] + fx * fy * self.grid_rpm[i + 1, j + 1])
+
+        if torque_z < 0:
+            rpm = rpm[::-1]
+        if force_x < 0:
+            rpm = -rpm[::-1]
+        return rpm * 2 * math.pi / 60
+
+
+    def reset_stats(self):
+        self.stats_start = time.monotonic()
+        self.stats_sim_start = self.sim_time
+        self.sentences_sent = 0
+        self.bytes_sent = 0
+        self.command_times = []
+        self.command_delays = []
+        self.checksum_errors = 0
+        self.command_errors = 0
+        self.last_telemetry_time = None
+
+
+    # Handles one sentence from a client. Returns False if it is not a command the Otter knows, or if its fields can not be read
+    def handle_command(self, sentence):
+        now = time.monotonic()
+        name = sentence[:8]
+
+        if name == b"$PMARABT":
+            self.command = None
+        elif name == b"$PMARMAN":
+            fields = Connector.sentence_fields(sentence)
+            if fields is None:
+                self.checksum_errors = self.checksum_errors + 1
+                return False
+            try:
+                self.command = (float(fields[1]), float(fields[3]))
+            except (ValueError, IndexError):
+                self.command_errors = self.command_errors + 1
+                return False
+            self.command_sim_time = self.sim_time
+        else:
+            return False
+
+        self.command_times.append(now)
+        if self.last_telemetry_time is not None:
+            self.command_delays.append(now - self.last_telemetry_time)
+        return True
+
+
+    # Runs the dynamics one sample forward and returns the sentences to send after the sample
+    def step(self):
+        if self.command is not None and self.sim_time - self.command_sim_time > self.command_timeout:
+            self.command = None                                                                     # Drifts like the Otter
+
+        if self.command is None:
+            self.u_control = np.zeros(2)
+        else:
+            self.u_control = self.command_to_rads(*self.command)
+
+        self.eta, self.nu, self.u_actual = self.simulator.propagate(self.eta, self.nu, self.u_actual, self.u_control, self.sampleTime)
+        self.samples = self.samples + 1
+        self.sim_time = self.samples * self.sampleTime
+
+        sentences = []
+        if self.gps_period and self.samples % self.gps_period == 0:
+            sentences.append(self.gps_sentence())
+        if self.imu_period and self.samples % self.imu_period == 0:
+            sentences.append(self.imu_sentence())
+        if self.mod_period and self.samples % self.mod_period == 0:
+            sentences.append(self.mod_sentence())
+        return sentences
+
+
+    def utc_time(self):
+        seconds = self.start_wall_time + self.sim_time
+        return time.strftime("%H%M%S", time.gmtime(seconds)) + f"{seconds % 1:.2f}"[1:]
+
+
+    def gps_sentence(self):
+        lat, lon, height = self.projection.geodetic(self.eta[0], self.eta[1], self.eta[2])
+
+        lat_deg = int(abs(lat))
+        lon_deg = int(abs(lon))
+        lat_field = f"{lat_deg:02d}{(abs(lat) - lat_deg) * 60:09.6f}"
+        lon_field = f"{lon_deg:03d}{(abs(lon) - lon_deg) * 60:09.6f}"
+
+        psi = self.eta[5]
+        v_north = self.nu[0] * math.cos(psi) - self.nu[1] * math.sin(psi)
+        v_east = self.nu[0] * math.sin(psi) + self.nu[1] * math.cos(psi)
+        speed_knots = math.hypot(v_north, v_east) * 3600 / 1852
+        course = math.degrees(math.atan2(v_east, v_north)) % 360
+
+        return nmea(f"PMARGPS,{self.utc_time()},{lat_field},{'N' if lat >= 0 else 'S'},{lon_field},{'E' if lon >= 0 else 'W'},1,{speed_knots:.2f},{course:.2f}")
+
+
+    # Orientation in degrees, heading from north, and rotational velocities in degrees per second
+    def imu_sentence(self):
+        roll, pitch, yaw = np.degrees(self.eta[3:6])
+        p, q, r = np.degrees(self.nu[3:6])
+        return nmea(f"PMARIMU,{roll:.3f},{pitch:.3f},{yaw % 360:.3f},{p:.3f},{q:.3f},{r:.3f}")
+
+
+    # The fuel capacity is a fraction like on the Otter, the emulator is always fully charged
+    def mod_sentence(self):
+        mode = "DRIFT" if self.command is None else "MANUAL"
+        return nmea(f"PMARMOD,{self.utc_time()},1.0,{mode}")
+
+
+    # Sends the sentences to all clients. Clients that do not keep up are disconnected instead of slowing down the emulator
+    def broadcast(self, sentences):
+        data = b"".join(sentences)
+        for writer in list(self.clients):
+            if writer.transport.get_write_buffer_size() > 1 << 20:
+                print("Client is not reading, disconnecting it")
+                self.clients.discard(writer)
+                writer.close()
+                continue
+            writer.write(data)
+        self.sentences_sent = self.sentences_sent + len(sentences)
+        self.bytes_sent = self.bytes_sent + len(data)
+        self.last_telemetry_time = time.monotonic()
+
+
+    async def handle_client(self, reader, writer):
+        print("[+] Connection from", writer.get_extra_info("peername"))
+        self.clients.add(writer)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                self.handle_command(line.strip())
+        except OSError:
+            pass
+        finally:
+            print("[+] Client disconnected")
+            self.clients.discard(writer)
+            writer.close()
+
+
+    # Runs the dynamics in steps of sampleTime / speedup real seconds. If the emulator is behind, the samples that are
+    # due are run at once, so the simulated time keeps up with the real time on average
+    async def run_dynamics(self, duration=None):
+        start = time.monotonic()
+        self.start_wall_time = time.time()
+        self.reset_stats()
+        while duration is None or self.sim_time < duration:
+            due = int((time.monotonic() - start) * self.speedup / self.sampleTime)
+            sentences = []
+            while self.samples < due:
+                sentences.extend(self.step())
+            if sentences:
+                self.broadcast(sentences)
+            await asyncio.sleep(max(0.0, start + (self.samples + 1) * self.sampleTime / self.speedup - time.monotonic()))
+
+
+    # Statistics since the last reset. The command delay is the time from the last telemetry was sent until a command
+    # is received, which is the reaction time of the client plus the time it waited for its next cycle
+    def stats(self):
+        wall = time.monotonic() - self.stats_start
+        intervals = np.diff(self.command_times)
+        delays = np.array(self.command_delays)
+        return {"wall_time" : wall,
+                "real_time_factor" : (self.sim_time - self.stats_sim_start) / wall if wall > 0 else math.nan,
+                "sentences_per_second" : self.sentences_sent / wall if wall > 0 else math.nan,
+                "bytes_per_second" : self.bytes_sent / wall if wall > 0 else math.nan,
+                "commands" : len(self.command_times),
+                "command_interval_mean" : intervals.mean() if len(intervals) else math.nan,
+                "command_interval_max" : intervals.max() if len(intervals) else math.nan,
+                "command_interval_std" : intervals.std() if len(intervals) else math.nan,
+                "command_delay_mean" : delays.mean() if len(delays) else math.nan,
+                "command_delay_p95" : np.percentile(delays, 95) if len(delays) else math.nan,
+                "checksum_errors" : self.checksum_errors,
+                "command_errors" : self.command_errors}
+
+
+    async def print_stats(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            s = self.stats()
+            print(f"x{s['real_time_factor']:.2f} real time, {s['sentences_per_second']:.0f} sentences/s, {s['commands']} commands, "
+                  f"interval {s['command_interval_mean'] * 1e3:.1f} ms (max {s['command_interval_max'] * 1e3:.1f} ms), "
+                  f"delay {s['command_delay_mean'] * 1e3:.1f} ms (p95 {s['command_delay_p95'] * 1e3:.1f} ms), "
+                  f"position {self.eta[0]:.1f} N {self.eta[1]:.1f} E")
+            self.reset_stats()
+
+
+    # Starts the server and runs the emulator for duration simulated seconds, or until it is stopped
+    async def serve(self, ip, port, duration=None, stats_interval=None):
+        server = await asyncio.start_server(self.handle_client, ip, port)
+        print(f"[+] Otter emulator on ip {ip} and port {port}, x{self.speedup} real time")
+        stats_task = asyncio.create_task(self.print_stats(stats_interval)) if stats_interval else None
+        try:
+            async with server:
+                await self.run_dynamics(duration)
+        finally:
+            if stats_task is not None:
+                stats_task.cancel()
+            for writer in list(self.clients):
+                writer.close()
+
+
+def nmea(body):
+    return f"${body}*{Connector.checksum(body).upper()}\r\n".encode()
+
+
+if __name__ == "__main__":
+    emulator = otter_emulator(start_position, start_heading, sampleTime, speedup, gps_rate, imu_rate, mod_rate, command_timeout)
+    try:
+        asyncio.run(emulator.serve(ip, port, stats_interval=stats_interval))
+    except KeyboardInterrupt:
+        print("Emulator stopped")
@@ -1,19 +1,44 @@
 import numpy as np
 import math
-from lib.gnc import Smtrx, Hmtrx, Rzyx, m2c, crossFlowDrag, sat, attitudeEuler
-import pandas as pd
-from numba import jit, cuda
+from lib.gnc import Smtrx, Hmtrx, Rzyx, Tzyx, m2c, crossFlowDragCoeff, crossFlowDragFast, sat, attitudeEuler
+from lib.History_buffer import history_buffer
+import lib.Dynamics_kernel as Dynamics_kernel
+import lib.Trajectory as Trajectory
+
+
+history_buffer_chunk = 10000                                                                    # Rows added each time a history buffer runs full
+
+# Dormand-Prince 5(4) coefficients used by the rk45 integrator
+dormand_prince_a = [
+    [1/5],
+    [3/40, 9/40],
+    [44/45, -56/15, 32/9],
+    [19372/6561, -25360/2187, 64448/6561, -212/729],
+    [9017/3168, -355/33, 46732/5247, 49/176, -5103/18656],
+    [35/384, 0, 500/1113, 125/192, -2187/6784, 11/84]]
+dormand_prince_b5 = [35/384, 0, 500/1113, 125/192, -2187/6784, 11/84, 0]
+dormand_prince_e = [71/57600, 0, -71/16695, 71/1920, -17253/339200, 22/525, -1/40]         # 5th order minus 4th order weights
+dormand_prince_dense = np.array([                                                                   # Dense output, weights of sigma, sigma^2, sigma^3 and sigma^4
+    [1, -8048581381/2820520608, 8663915743/2820520608, -12715105075/11282082432],
+    [0, 0, 0, 0],
+    [0, 131558114200/32700410799, -68118460800/10900136933, 87487479700/32700410799],
+    [0, -1754552775/470086768, 14199869525/1410260304, -10690763975/1880347072],
+    [0, 127303824393/49829197408, -318862633887/49829197408, 701980252875/199316789632],
+    [0, -282668133/205662961, 2019193451/616988883, -1453857185/822651844],
+    [0, 40617522/29380423, -110615467/29380423, 69997945/29380423]])
 
 
 class otter_simulator():
 
-    def __init__(self, target_list, use_target_coordinates, surge_target_radius, use_moving_target, moving_target_start, moving_target_increase, end_when_last_target_reached, verbose, store_force_file, circular_target):
+    def __init__(self, target_list, use_target_coordinates, surge_target_radius, use_moving_target, moving_target_start, moving_target_increase, end_when_last_target_reached, verbose, store_force_file, circular_target, use_compiled_dynamics=False, integrator="euler", scenario=None):
 
         # Variable initializations:
         self.use_target_coordinates = use_target_coordinates
         self.use_moving_target = use_moving_target
         self.moving_target_increase = moving_target_increase
         self.moving_target = moving_target_start
+        self.moving_target_start = list(moving_target_start)
+        self.scenario = scenario                                                                # List of trajectory parts for the moving target, see lib/Trajectory.py. None uses moving_target_parts
         self.target_list = target_list
         self.surge_setpoint = surge_target_radius
         self.last_target = target_list[-1]
@@ -21,6 +46,14 @@ class otter_simulator():
         self.verbose = verbose
         self.store_force_file = store_force_file
         self.circular_target = circular_target
+        self.use_compiled_dynamics = use_compiled_dynamics                                      # Uses the numba compiled step function if numba is installed
+        self.integrator = integrator                                                            # "euler", "rk4" or "rk45". The compiled step function is only used with euler
+        self.rk45_rtol = 1e-6                                                                   # Relative and absolute error tolerance for rk45
+        self.rk45_atol = 1e-8                                                                   #
+        self.rk45_step = None                                                                   # Internal step size of rk45, kept between samples
+        self.rk45_states = np.empty((0, 14))                                                    # States from rk45 for the rest of the control period
+        self.control_period = 0.1                                                               # Time between each controller update (s)
+        self.dynamics_evaluations = 0                                                           # Number of times the dynamics have been evaluated
 
         self.max_force = 200                                                                    # Combined max force in yaw and surge. Used for saturation of control forces
         self.V_c = 0.0                                                                          # Starting speed (m/s)
@@ -31,17 +64,12 @@ class otter_simulator():
         self.yaw_setpoint = -90                                                                 # If not using target coordinates or a moving target, but instead using a surge distance and a heading:
 
         self.force_array = np.empty((0, 2), float)
+        self.record_forces = False                                                              # Keeps the control forces in self.force_array without storing the .csv file
 
         self.tau_X = 0.0
         self.tau_N = 0.0
 
 
-        self.throttledf = pd.read_csv('lib/throttle_map_v2_noneg.csv', index_col=0, sep=";")
-        self.throttledf = self.throttledf.dropna(axis=1, how='all')
-        # Drop rows where all values are NaN
-        self.throttledf = self.throttledf.dropna(axis=0, how='all')
-
-
         self.n1neg = False
         self.n2neg = False
 
@@ -68,9 +96,17 @@ class otter_simulator():
         self.controls = ["Left propeller shaft speed (rad/s)", "Right propeller shaft speed (rad/s)"]
         self.dimU = len(self.controls)
 
+        self.mp = 0.0                           # Payload (kg)
+        self.init_model()
+
+
+    # Calculates the mass, damping and restoring matrices of the Otter from the payload in self.mp
+    def init_model(self):
+
+        rho = 1026              # density of water (kg/m^3)
+
         # Vehicle parameters
         m = 62.0                                 # mass (kg)
-        self.mp = 0.0                           # Payload (kg)
         self.m_total = m + self.mp
         self.rp = np.array([0.05, 0, -0.35], float) # location of payload (m)
         rg = np.array([0.2, 0, -0.2], float)     # CG for hull only (m)
@@ -95,6 +131,7 @@ class otter_simulator():
         # Inertia dyadic, volume displacement and draft
         nabla = (m + self.mp) / rho  # volume
         self.T = nabla / (2 * Cb_pont * self.B_pont * self.L)  # draft
+        self.crossflow = crossFlowDragCoeff(self.L, self.B_pont, self.T)  # cross-flow drag strips, computed once
         Ig_CG = m * np.diag(np.array([R44 ** 2, R55 ** 2, R66 ** 2]))
         self.Ig = Ig_CG - m * self.S_rg @ self.S_rg - self.mp * self.S_rp @ self.S_rp
 
@@ -173,14 +210,75 @@ class otter_simulator():
         self.mass = m + self.mp
 
 
-    def simulate(self, N, sampleTime, otter, surge_PID, yaw_PID):
+    # Changes the payload (kg) and updates the model
+    def set_payload(self, mp):
+        self.mp = mp
+        self.init_model()
+
+
+    # Runs the whole simulation and returns the complete history. state is a state from load_checkpoint to continue a
+    # saved run, then only the samples after the checkpoint are returned
+    def simulate(self, N, sampleTime, otter, surge_PID, yaw_PID, state=None):
+
+        # Buffers used to store the simulation data. If the simulation can end early the buffers grow in chunks instead of
+        # being allocated for all N + 1 samples
+        if self.end_when_last_target_reached:
+            capacity = min(N + 1, history_buffer_chunk)
+        else:
+            capacity = N + 1
+
+        simData = history_buffer(12 + 2 * self.dimU, capacity, history_buffer_chunk)
+        targetData = history_buffer(2, capacity + 1, history_buffer_chunk)
+        force_data = history_buffer(2, capacity if (self.store_force_file or self.record_forces) else 0, history_buffer_chunk)
+
+        # Intitial target array
+        if state is None:
+            targetData.append([self.moving_target_start[0], self.moving_target_start[1]])
+        else:
+            targetData.append(state["moving_target"])
+
+        t = 0
+        times = []
+        for time_chunk, data_chunk, target_chunk, force_chunk in self.simulate_stream(N, sampleTime, otter, surge_PID, yaw_PID, history_buffer_chunk, state):
+            simData.extend(data_chunk)
+            targetData.extend(target_chunk)
+            if self.store_force_file or self.record_forces:
+                force_data.extend(force_chunk)
+            t = time_chunk[-1, 0]
+            times.append(time_chunk)
+
+        if state is None:
+            simTime = np.arange(start=0, stop=t+sampleTime, step=sampleTime)[:, None]
+        else:
+            simTime = np.concatenate(times) if times else np.empty((0, 1))
+        simData = simData.array()
+        self.targetData = targetData.array()
+        targetData = self.targetData
+        self.force_array = force_data.array()
+
+        if self.store_force_file:
+            np.savetxt("force_array.csv", self.force_array, delimiter=";", header="tau_X;tau_N", comments="")
+
+        return (simTime, simData, targetData)
+
+
+    #
+    #   Runs the simulation as a generator. Every chunk_size samples it yields (simTime, simData, targetData, forceData)
+    #   for those samples, with the same columns as simulate: simData is [eta, nu, u_control, u_actual], targetData is the
+    #   target after each sample and forceData is [tau_X, tau_N]. Only one chunk is held at a time, so the memory use does
+    #   not grow with the length of the run. N can be None to run until the generator is closed.
+    #
+    #   The loop state is stored in self.run_state before every chunk is yielded and when the run ends, so checkpoint can
+    #   save it. With a state from load_checkpoint the run continues from that sample, and N is still the total number of
+    #   samples of the run.
+    #
+    def simulate_stream(self, N, sampleTime, otter, surge_PID, yaw_PID, chunk_size=1000, state=None):
 
         counter = 0                         #
         reached_target_time = 0             #
         self.reached_yaw_target_time = 0    #  For tuning, prints time in console
         finished = False                    #
         finished_yaw = False                #
-        asd = 0
 
         yaw_setpoint = 0                    # Heading setpoint, this will be updated in the loop if using a target
 
@@ -193,13 +291,26 @@ class otter_simulator():
         nu = self.nu                                # velocity
         u_actual = self.u_actual                    # actual inputs
 
-        # Intitial target array
-        self.targetData = np.array([self.moving_target[0], self.moving_target[1]])
-
-
-        # Table used to store the simulation data
-        simData = np.empty([0, 2 * DOF + 2 * self.dimU], float)
-
+        # The compiled step function writes the next states into these arrays
+        compiled = self.use_compiled_dynamics and Dynamics_kernel.numba_available and self.integrator == "euler"
+        if compiled:
+            constants = Dynamics_kernel.model_constants(self)
+            eta_next = np.zeros(6)
+            nu = np.array(nu, float)
+            nu_next = np.zeros(6)
+            u_actual = np.array(u_actual, float)
+            u_next = np.zeros(2)
+        elif self.use_compiled_dynamics:
+            print("Numba is not installed, using the NumPy dynamics")
+
+        # Arrays for the current chunk, a new set is made for every chunk so the yielded arrays can be kept by the caller
+        if N is None:
+            N = math.inf
+        j = 0
+        time_chunk = np.empty((chunk_size, 1))
+        data_chunk = np.empty((chunk_size, 2 * DOF + 2 * self.dimU))
+        target_chunk = np.empty((chunk_size, 2))
+        force_chunk = np.empty((chunk_size, 2))
 
         # Sets the first target from the target list
         self.target_counter = 0
@@ -208,9 +319,61 @@ class otter_simulator():
         dist_tot = 0
 
 
+        # The controller is sampled every control_period, independent of the integrator sample time
+        control_every = max(1, int(round(self.control_period / sampleTime)))
+        self.rk45_step = None
+        self.rk45_states = np.empty((0, 14))
+
         # Main simulation loop
         i = 0
 
+        # The moving target path is built once for the whole run, or a window at a time when the run has no end
+        if self.use_moving_target:
+            self.moving_target[0] = self.moving_target_start[0]
+            self.moving_target[1] = self.moving_target_start[1]
+            parts = self.scenario if self.scenario is not None else self.moving_target_parts()
+            self.trajectory = Trajectory.trajectory(self.moving_target_start, parts, sampleTime, None if N == math.inf else N + 1)
+
+        # Continues from a saved state
+        if state is not None:
+            if float(state["sampleTime"]) != sampleTime:
+                raise ValueError(f"The checkpoint was made with sampleTime {float(state['sampleTime'])}, not {sampleTime}")
+
+            eta = np.array(state["eta"], float)
+            nu = np.array(state["nu"], float)
+            u_actual = np.array(state["u_actual"], float)
+            i = int(state["i"])
+            counter = int(state["counter"])
+            dist_tot = float(state["dist_tot"])
+            reached_target_time = float(state["reached_target_time"])
+            finished = bool(state["finished"])
+            finished_yaw = bool(state["finished_yaw"])
+            self.reached_yaw_target_time = float(state["reached_yaw_target_time"])
+            self.target_counter = int(state["target_counter"])
+            self.target_coordinates = self.target_list[self.target_counter]
+            self.moving_target[0] = float(state["moving_target"][0])
+            self.moving_target[1] = float(state["moving_target"][1])
+            self.distance_to_target = float(state["distance_to_target"])
+            self.yaw_setpoint = float(state["yaw_setpoint"])
+            self.tau_X = float(state["tau_X"])
+            self.tau_N = float(state["tau_N"])
+            self.rk45_step = float(state["rk45_step"]) if not math.isnan(state["rk45_step"]) else None
+            if "rk45_states" in state:
+                self.rk45_states = np.array(state["rk45_states"], float).reshape(-1, 14)
+
+        # Stores the loop state for checkpoint
+        def store_state():
+            self.run_state = {"sampleTime" : sampleTime, "eta" : np.array(eta, float), "nu" : np.array(nu, float),
+                              "u_actual" : np.array(u_actual, float), "i" : i, "counter" : counter,
+                              "dist_tot" : dist_tot, "reached_target_time" : reached_target_time, "finished" : finished,
+                              "finished_yaw" : finished_yaw, "reached_yaw_target_time" : self.reached_yaw_target_time,
+                              "target_counter" : self.target_counter,
+                              "moving_target" : np.array([self.moving_target[0], self.moving_target[1]], float),
+                              "distance_to_target" : self.distance_to_target, "yaw_setpoint" : self.yaw_setpoint,
+                              "tau_X" : self.tau_X, "tau_N" : self.tau_N,
+                              "rk45_step" : self.rk45_step if self.rk45_step is not None else math.nan,
+                              "rk45_states" : self.rk45_states.copy()}
+
         while i < (N + 1):
             t = i * sampleTime
 
@@ -257,36 +420,11 @@ class otter_simulator():
 
                 self.yaw_setpoint = math.atan2(east_distance, north_distance)
                 #self.yaw_setpoint = self.yaw_setpoint  * (180 / math.pi)
-                if not self.circular_target:
-                    # Increases the target values every second
-                    if counter % (1/sampleTime) == 0:                                                                           #
-                        if counter >= 15000 and counter < 25000:                                                                #
-                            self.moving_target[0] = self.moving_target[0] + self.moving_target_increase[0]                      #
-                            self.moving_target[1] = self.moving_target[1] - self.moving_target_increase[1]                      #
-                            #self.moving_target[1] = self.moving_target[1]                                                       #
-                            #self.moving_target[0] = self.moving_target[0]                                                       #
-                        elif counter >= 25000 and counter < 35000:                                                              #
-                            self.moving_target[0] = self.moving_target[0] - self.moving_target_increase[0]/4                    #
-                            self.moving_target[1] = self.moving_target[1] - self.moving_target_increase[1]/4                    #
-                                                                                                                                #
-                        elif counter >= 35000 and counter < 50000:                                                              #
-                            self.moving_target[0] = self.moving_target[0] - self.moving_target_increase[0]*4                    #   Some random target movement, edit to test different paths
-                            self.moving_target[1] = self.moving_target[1]                                                       #
-                                                                                                                                #
-                        elif counter > 50000:                                                                                   #
-                            self.moving_target[0] = self.moving_target[0]                                                       #
-                            self.moving_target[1] = self.moving_target[1]                                                       #
-                                                                                                                                #
-                        else:                                                                                                   #
-                            self.moving_target[0] = self.moving_target[0] + self.moving_target_increase[0]                      #
-                            self.moving_target[1] = self.moving_target[1] + self.moving_target_increase[1]                      #
-
-                else:
-                    omega = 1.5 / 50
-                    asd = asd + sampleTime
-                    theta = omega * asd
-                    self.moving_target[0] = -20 + 40 * np.cos(theta)
-                    self.moving_target[1] = -20 + 40 * np.sin(theta)
+
+                # Moves the target to the position at the end of this sample
+                position = self.trajectory.position_at_sample(i + 1)
+                self.moving_target[0] = position[0]
+                self.moving_target[1] = position[1]
 
 
 
@@ -294,9 +432,10 @@ class otter_simulator():
 
             angle = eta[5]                                                                                                          # Gets the current heading of the Otter
 
-            if i % 5 == 0:
-                self.tau_X = surge_PID.calculate_surge(self.surge_setpoint, self.distance_to_target, self.yaw_setpoint, angle)               # Gets surge control force      every 0.1s
-                self.tau_N = yaw_PID.calculate_yaw(self.yaw_setpoint, angle, self.surge_setpoint, self.distance_to_target)                   # Gets yaw control force
+            if i % control_every == 0:
+                control_sample_time = control_every * sampleTime if i > 0 else 0                                                            # Simulated time since the last controller update
+                self.tau_X = surge_PID.calculate_surge(self.surge_setpoint, self.distance_to_target, self.yaw_setpoint, angle, control_sample_time)  # Gets surge control force      every 0.1s
+                self.tau_N = yaw_PID.calculate_yaw(self.yaw_setpoint, angle, self.surge_setpoint, self.distance_to_target, control_sample_time)      # Gets yaw control force
 
             else:
                 self.tau_X = self.tau_X
@@ -312,9 +451,8 @@ class otter_simulator():
                 self.tau_X = -(remaining_force)                                  #
 
 
-            if self.store_force_file:                                            #
-                forces = np.array([self.tau_X, self.tau_N])                      # Stores all the forces in a .csv file
-                self.force_array = np.vstack((self.force_array, forces))         #
+            force_chunk[j, 0] = self.tau_X                                       # Stores the forces, simulate can store these in a .csv file
+            force_chunk[j, 1] = self.tau_N                                       #
 
 
             # Calculate thruster speeds in rad/s
@@ -345,7 +483,7 @@ class otter_simulator():
            # n1, n2 = map(float, speed.strip("()").split(';'))                                                  #   2D throttle map, no interpolation
 
 
-            torque_z, torque_x, speed = otter.otter_control.interpolate_force_values(n1, n2, 3)                 #   2D interpolation
+            torque_z, torque_x, speed = otter.otter_control.force_values(n1, n2, 3)                          #   2D interpolation
 
             if self.n1neg:
                 n1 = n1 * -1
@@ -372,12 +510,30 @@ class otter_simulator():
 
 
             # Store simulation data in simData
-            signals = np.append(np.append(np.append(eta, nu), u_control), u_actual)
-            simData = np.vstack([simData, signals])
+            time_chunk[j, 0] = t
+            signals = data_chunk[j]
+            signals[0:6] = eta
+            signals[6:12] = nu
+            signals[12:14] = u_control
+            signals[14:16] = u_actual
 
             # Propagate vehicle and attitude dynamics
-            [nu, u_actual] = self.dynamics(eta, nu, u_actual, u_control, sampleTime)
-            eta = attitudeEuler(eta, nu, sampleTime)
+            if compiled:
+                Dynamics_kernel.otter_step(eta, nu, u_actual, u_control, sampleTime, *constants, eta_next, nu_next, u_next)
+                eta, eta_next = eta_next, eta
+                nu, nu_next = nu_next, nu
+                u_actual, u_next = u_next, u_actual
+                self.dynamics_evaluations = self.dynamics_evaluations + 1
+            elif self.integrator == "rk45":
+                # The commands are held until the next controller update, so rk45 integrates up to it at once and the
+                # samples in between are taken from the dense output
+                if len(self.rk45_states) == 0:
+                    x = np.concatenate((eta, nu, u_actual))
+                    self.rk45_states = self.rk45(x, u_control, sampleTime, control_every - i % control_every)
+                eta, nu, u_actual = self.split_state(self.rk45_states[0])
+                self.rk45_states = self.rk45_states[1:]
+            else:
+                eta, nu, u_actual = self.propagate(eta, nu, u_actual, u_control, sampleTime)
 
             # Counts and prints the current number of simulation
             counter = counter +1
@@ -399,27 +555,71 @@ class otter_simulator():
                     finished_yaw = True
 
 
-            newTargetData = [self.moving_target[0], self.moving_target[1]]
-            self.targetData = np.vstack([self.targetData, newTargetData])
+            target_chunk[j, 0] = self.moving_target[0]
+            target_chunk[j, 1] = self.moving_target[1]
 
             i = i + 1
+            j = j + 1
 
+            if j == chunk_size:
+                store_state()
+                yield time_chunk, data_chunk, target_chunk, force_chunk
+                j = 0
+                time_chunk = np.empty((chunk_size, 1))
+                data_chunk = np.empty((chunk_size, 2 * DOF + 2 * self.dimU))
+                target_chunk = np.empty((chunk_size, 2))
+                force_chunk = np.empty((chunk_size, 2))
 
-        print(f"AVG distance to target = {dist_tot/i}")
+        store_state()
+        if j > 0:
+            yield time_chunk[:j], data_chunk[:j], target_chunk[:j], force_chunk[:j]
 
-        simTime = np.arange(start=0, stop=t+sampleTime, step=sampleTime)[:, None]
-        targetData = self.targetData
 
-        if self.store_force_file:
-            np.savetxt("force_array.csv", self.force_array, delimiter=";", header="tau_X;tau_N", comments="")
+        self.avg_distance = dist_tot/i
+        print(f"AVG distance to target = {self.avg_distance}")
 
         if self.verbose:
             print(f"Reached target in {reached_target_time}s")
             print(f"Reached yaw target in {self.reached_yaw_target_time}s")
 
-        return (simTime, simData, targetData)
 
 
+    # The moving target path used when no scenario is given. The linear path moves the target once every second with
+    # moving_target_increase, with some random changes on the way. Edit to test different paths
+    def moving_target_parts(self):
+        if self.circular_target:
+            return [{"type" : "circle", "center" : [-20, -20], "radius" : 40, "angular_velocity" : 1.5 / 50}]
+
+        increase = self.moving_target_increase
+        return [{"type" : "steps", "step" : [increase[0], increase[1]], "every" : 1, "samples" : 15000},
+                {"type" : "steps", "step" : [increase[0], -increase[1]], "every" : 1, "samples" : 10000},
+                {"type" : "steps", "step" : [-increase[0] / 4, -increase[1] / 4], "every" : 1, "samples" : 10000},
+                {"type" : "steps", "step" : [-increase[0] * 4, 0], "every" : 1, "samples" : 15000},
+                {"type" : "steps", "step" : [increase[0], increase[1]], "samples" : 1}]
+
+
+    # Saves the state from the last simulate or simulate_stream chunk and the PID states to a .npz file
+    def checkpoint(self, file, surge_PID, yaw_PID):
+        state = dict(self.run_state)
+        for name, value in surge_PID.get_state().items():
+            state["surge_PID_" + name] = value
+        for name, value in yaw_PID.get_state().items():
+            state["yaw_PID_" + name] = value
+
+        np.savez(file, **state)
+
+
+    # Loads a checkpoint made with checkpoint, restores the PID states and returns the state to give to simulate or
+    # simulate_stream
+    def load_checkpoint(self, file, surge_PID, yaw_PID):
+        with np.load(file) as data:
+            state = {name : data[name] for name in data.files}
+
+        surge_PID.set_state({name[len("surge_PID_"):] : value for name, value in state.items() if name.startswith("surge_PID_")})
+        yaw_PID.set_state({name[len("yaw_PID_"):] : value for name, value in state.items() if name.startswith("yaw_PID_")})
+
+        return state
+
 
     def dynamics(self, eta, nu, u_actual, u_control, sampleTime):
         """
@@ -427,6 +627,26 @@ class otter_simulator():
         the Otter USV equations of motion using Euler's method.
         """
 
+        nu_dot, n_dot, n = self.derivatives(eta, nu, u_actual, u_control)
+
+        # Forward Euler integration [k+1]
+        nu = nu + sampleTime * nu_dot
+        n = n + sampleTime * n_dot
+
+        u_actual = np.array(n, float)
+
+        return nu, u_actual
+
+
+    def derivatives(self, eta, nu, u_actual, u_control):
+        """
+        [nu_dot,n_dot,n] = derivatives(eta,nu,u_actual,u_control) computes the
+        Otter USV and propeller state derivatives. n is the saturated propeller
+        revolution state.
+        """
+
+        self.dynamics_evaluations = self.dynamics_evaluations + 1
+
         # Input vector
         n = np.array([u_actual[0], u_actual[1]])
 
@@ -489,7 +709,7 @@ class otter_simulator():
         tau_damp[5] = tau_damp[5] - 10 * self.D[5, 5] * abs(nu_r[5]) * nu_r[5]
 
         # State derivatives (with dimension)
-        tau_crossflow = crossFlowDrag(self.L, self.B_pont, self.T, nu_r)
+        tau_crossflow = crossFlowDragFast(self.crossflow, nu_r)
         sum_tau = (
             tau
             + tau_damp
@@ -502,11 +722,127 @@ class otter_simulator():
         nu_dot = Dnu_c + np.matmul(self.Minv, sum_tau)  # USV dynamics
         n_dot = (u_control - n) / self.T_n  # propeller dynamics
 
-        # Forward Euler integration [k+1]
-        nu = nu + sampleTime * nu_dot
-        n = n + sampleTime * n_dot
+        return nu_dot, n_dot, n
 
-        u_actual = np.array(n, float)
 
-        return nu, u_actual
+    def state_derivative(self, x, u_control):
+        """
+        x_dot = state_derivative(x,u_control) returns the derivative of the
+        full state x = [eta, nu, u_actual] for the Runge-Kutta integrators
+        """
+
+        eta = x[0:6]
+        nu = x[6:12]
+
+        nu_dot, n_dot, n = self.derivatives(eta, nu, x[12:14], u_control)
+        p_dot = np.matmul(Rzyx(eta[3], eta[4], eta[5]), nu[0:3])
+        v_dot = np.matmul(Tzyx(eta[3], eta[4]), nu[3:6])
+
+        return np.concatenate((p_dot, v_dot, nu_dot, n_dot))
+
+
+    def propagate(self, eta, nu, u_actual, u_control, sampleTime):
+        """
+        [eta,nu,u_actual] = propagate(eta,nu,u_actual,u_control,sampleTime)
+        integrates the Otter one sample forward with the selected integrator.
+        u_control is held constant during the sample.
+        """
+
+        if self.integrator == "euler":
+            [nu, u_actual] = self.dynamics(eta, nu, u_actual, u_control, sampleTime)
+            eta = attitudeEuler(eta, nu, sampleTime)
+            return eta, nu, u_actual
+
+        x = np.concatenate((eta, nu, u_actual))
+
+        if self.integrator == "rk4":
+            x = self.rk4(x, u_control, sampleTime)
+        elif self.integrator == "rk45":
+            x = self.rk45(x, u_control, sampleTime)[-1]
+        else:
+            raise ValueError(f"Unknown integrator {self.integrator}, use euler, rk4 or rk45")
+
+        return self.split_state(x)
+
+
+    # Splits a full state x into eta, nu and u_actual. The propeller revolutions are saturated after every sample, like
+    # the Euler integration does
+    def split_state(self, x):
+        u_actual = np.array([sat(x[12], self.n_min, self.n_max), sat(x[13], self.n_min, self.n_max)], float)
+
+        return x[0:6].copy(), x[6:12].copy(), u_actual
+
+
+    # Classic 4th order Runge-Kutta, one step over the whole sample
+    def rk4(self, x, u_control, h):
+        k1 = self.state_derivative(x, u_control)
+        k2 = self.state_derivative(x + h / 2 * k1, u_control)
+        k3 = self.state_derivative(x + h / 2 * k2, u_control)
+        k4 = self.state_derivative(x + h * k3, u_control)
+
+        return x + h / 6 * (k1 + 2 * k2 + 2 * k3 + k4)
+
+
+    # Dormand-Prince 5(4) with error control over a number of samples with u_control held constant. The steps are as long
+    # as the error allows, up to all the samples at once, and the states at the samples inside a step are found with the
+    # dense output of the method. Returns the state after each sample as one row each. The step size is kept for the
+    # next call
+    def rk45(self, x, u_control, sampleTime, samples=1):
+        span = samples * sampleTime
+        h = min(self.rk45_step if self.rk45_step else span, span)
+        t = 0.0
+
+        states = np.empty((samples, len(x)))
+        sample = 0
+
+        k1 = self.state_derivative(x, u_control)
+
+        while sample < samples:
+            remaining = span - t
+            last = h >= remaining - 1e-12
+            if last:
+                h_used = remaining
+            else:
+                h_used = h
+
+            k = [k1]
+            for row in dormand_prince_a:
+                k.append(self.state_derivative(x + h_used * sum(a * k_i for a, k_i in zip(row, k) if a != 0), u_control))
+
+            x_new = x + h_used * sum(b * k_i for b, k_i in zip(dormand_prince_b5, k) if b != 0)
+            error = h_used * sum(e * k_i for e, k_i in zip(dormand_prince_e, k) if e != 0)
+
+            scale = self.rk45_atol + self.rk45_rtol * np.maximum(np.abs(x), np.abs(x_new))
+            error_norm = math.sqrt(np.mean((error / scale) ** 2))
+
+            if error_norm <= 1:
+                t_new = span if last else t + h_used
+
+                # The samples that end inside this step
+                dense = None
+                while sample < samples and (sample + 1) * sampleTime <= t_new + 1e-12:
+                    sigma = ((sample + 1) * sampleTime - t) / h_used
+                    if sigma >= 1 - 1e-12:
+                        states[sample] = x_new
+                    else:
+                        if dense is None:
+                            dense = np.matmul(np.array(k).T, dormand_prince_dense)
+                        states[sample] = x + h_used * np.matmul(dense, sigma ** np.arange(1, 5))
+                    sample = sample + 1
+
+                x = x_new
+                k1 = k[6]                                                           # First same as last
+                t = t_new
+
+            # New step size. Only increased when the whole step was used
+            factor = 0.9 * error_norm ** -0.2 if error_norm > 0 else 5
+            factor = min(max(factor, 0.2), 5)
+            if error_norm > 1 or not last:
+                h = h_used * factor
+            else:
+                h = max(h, h_used * factor)
+
+        self.rk45_step = h
+
+        return states
 
@@ -0,0 +1,37 @@
+import sys
+import matplotlib.pyplot as plt
+import lib.Live_plotter as Live_plotter
+import lib.Telemetry_channel as Telemetry_channel
+
+
+#
+#   Live plot of a tracking, in a process of its own. Reads the values the guidance publishes with a telemetry_publisher
+#   from lib/Telemetry_channel.py, so the drawing does not take time from the control loop. main.py starts it when
+#   enable_live_plot is True, and more viewers can be started or closed while the guidance runs:
+#
+#       python Telemetry_viewer.py otter_telemetry_2009
+#
+
+
+##########################################################################################################################################################
+#                                                                      OPTIONS                                                                           #
+##########################################################################################################################################################
+
+
+channel = "otter_telemetry_2009"                                                                         # Name of the channel, the port of the Otter is added by main.py. Can be given as an argument
+backend = "TkAgg"                                                                                       # Matplotlib backend with a window. Live_plotter uses Agg, which can not show the plot
+window = 600                                                                                            # Seconds of data in the plot
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        channel = sys.argv[1]
+
+    subscriber = Telemetry_channel.telemetry_subscriber(channel)
+    print(f"Waiting for telemetry on {channel}")
+    subscriber.wait_for_publisher()
+    print("Connected to the guidance")
+
+    plt.switch_backend(backend)
+    plotter = Live_plotter.live_plotter(subscriber, window)
+    subscriber.close()
@@ -0,0 +1,194 @@
+import asyncio
+import time
+import lib.Connector as Connector
+
+
+#
+#   Asyncio version of the connector in lib/Connector.py, with the same functions and the same current values of the Otter.
+#   The connection is made with asyncio streams, and when it is established two tasks are started on the event loop: one
+#   that reads the telemetry and updates the values as soon as a sentence arrives, and one that writes the commands.
+#   send_message only puts the message in the queue of the writing task and returns at once, so a slow read or write never
+#   holds up the guidance loop. Only the newest message of each type is kept in the queue, so if the connection is slow an
+#   old $PMARMAN is replaced by the new one instead of being sent late.
+#
+#   The connector can be passed to the Otter API, otter(async_otter_connector()), and used with
+#   live_guidance.trajectory_tracking_async. Several Otters can be driven from the same event loop with one connector each:
+#
+#       asyncio.run(asyncio.gather(guidance_1.trajectory_tracking_async(path_1), guidance_2.trajectory_tracking_async(path_2)))
+#
+
+
+class async_otter_connector(Connector.otter_connector):
+
+    def __init__(self):
+        super().__init__()
+
+        self.reader = None
+        self.writer = None
+        self.tasks = []
+
+        # Messages waiting to be sent, the newest message of each sentence type in the order they were queued
+        self.outgoing = {}
+        self.outgoing_queued = asyncio.Event()
+        self.outgoing_sent = asyncio.Event()
+        self.outgoing_sent.set()
+
+        # Set every time a sentence is received from the Otter
+        self.message_received = asyncio.Event()
+        self.sentences_received = 0
+
+
+    # Opens the connection to the Otter and starts the tasks reading the telemetry and sending the commands. Returns boolean
+    async def establish_connection(self, ip, port, timeout=10):
+        try:
+            if self.verbose:
+                print(f"Connecting with ip {ip} and port {port}")
+            self.reader, self.writer = await asyncio.wait_for(asyncio.open_connection(ip, port), timeout)
+        except (OSError, asyncio.TimeoutError):
+            print("Could not connect to Otter")
+            return False
+
+        self.connection_status = True
+        self.tasks = [asyncio.create_task(self.receive()), asyncio.create_task(self.transmit())]
+        print("connected")
+        return True
+
+
+    # Queues a message to the Otter. Calculates checksum and adds \r\n to the message like otter_connector.send_message.
+    # Returns at once, the message is written by the transmit task
+    def send_message(self, message, checksum_needed):
+        if not self.connection_status:
+            print("Couldn't send message to Otter")
+            return False
+
+        name = message[:8]
+        if checksum_needed:
+            message += "*"
+            message += Connector.checksum(message[1:-1])
+        message += "\r\n"
+
+        self.outgoing.pop(name, None)                       # A newer message goes to the back of the queue
+        self.outgoing[name] = message.encode()
+        self.outgoing_sent.clear()
+        self.outgoing_queued.set()
+        return True
+
+
+    # Waits until all queued messages are written to the Otter. Returns boolean
+    async def flush(self, timeout=1):
+        try:
+            await asyncio.wait_for(self.outgoing_sent.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            print("Could not send all messages to Otter")
+            return False
+
+
+    # Makes the Otter enter drift mode and waits until the message is sent. Returns boolean
+    async def drift(self):
+        if self.verbose:
+            print("Otter entering drift mode")
+        if not self.send_message("$PMARABT", False):
+            return False
+        return await self.flush()
+
+
+    # Stops the tasks and closes the connection. Queued messages are sent first
+    async def close_connection(self):
+        if self.connection_status:
+            await self.flush()
+
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+        try:
+            self.writer.close()
+            await self.writer.wait_closed()
+            self.connection_status = False
+            return True
+        except Exception:
+            print("Error when disconnecting from Otter")
+            self.connection_status = False
+            return False
+
+
+    # Waits for the next sentence from the Otter and returns it, or None if nothing is received within the timeout
+    async def read_message(self, timeout = 10):
+        if await self.wait_for_message(timeout):
+            return self.last_message_received
+        return None
+
+
+    # The values are updated by the receive task as soon as the sentences arrive. This waits until the next sentence is
+    # received, so the values are newer than when it was called. Timeout is by default 10
+    async def update_values(self, timeout = 10):
+        if not await self.wait_for_message(timeout):
+            if self.verbose:
+                print("No message received from Otter")
+                print("Check communication")
+
+
+    async def wait_for_message(self, timeout):
+        self.message_received.clear()
+        try:
+            await asyncio.wait_for(self.message_received.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+    # Task reading the telemetry. Every sentence updates the values as soon as it is received
+    async def receive(self):
+        while True:
+            try:
+                line = await self.reader.readuntil(b"\n")
+            except asyncio.IncompleteReadError:
+                print("Connection closed by the Otter")
+                self.connection_status = False
+                return
+            except asyncio.LimitOverrunError as error:
+                await self.reader.readexactly(error.consumed)             # Throws away a line that is too long to be a sentence
+                continue
+            except OSError:
+                print("Error in recieving message from Otter")
+                self.connection_status = False
+                return
+
+            sentence = line.strip()
+            if not sentence:
+                continue
+
+            try:
+                if self.update_from_sentence(sentence):
+                    self.last_update_time = time.time()
+            except (IndexError, ValueError):
+                print("Could not read message from Otter:", sentence)
+
+            self.last_bytes_received = sentence
+            self.sentences_received = self.sentences_received + 1
+            self.message_received.set()
+
+
+    # Task writing the queued messages to the Otter
+    async def transmit(self):
+        while True:
+            await self.outgoing_queued.wait()
+            self.outgoing_queued.clear()
+
+            try:
+                while self.outgoing:
+                    name = next(iter(self.outgoing))
+                    message = self.outgoing.pop(name)
+                    self.writer.write(message)
+                    await self.writer.drain()
+                    if self.verbose:
+                        print("Sending message:", message.decode())
+            except OSError:
+                print("Couldn't send message to Otter")
+                self.connection_status = False
+                self.outgoing.clear()
+
+            if not self.outgoing:
+                self.outgoing_sent.set()
@@ -6,6 +6,7 @@ import pandas as pd
 from scipy.spatial import cKDTree
 from scipy.interpolate import griddata
 import os
+import hashlib
 
 
 
@@ -69,17 +70,99 @@ class otter_control():
         path = os.path.dirname(os.path.abspath(__file__))
         self.throttle_map_name = os.path.join(path, 'throttle_map_v2_noneg.csv')
 
-        self.throttledf = pd.read_csv(self.throttle_map_name, index_col=0, sep=";")
-
-        self.throttledf = self.throttledf.dropna(axis=1, how='all')
-
-        # Drop rows where all values are NaN
-        self.throttledf = self.throttledf.dropna(axis=0, how='all')
-
-        self.rpm_left, self.rpm_right, self.force_x, self.force_z = self.load_and_prepare_data(
-            self.throttle_map_name)
+        # The parsed throttle map is loaded from a binary cache made from the csv file. The DataFrame is only read from the
+        # csv when self.throttledf is used
+        self._throttledf = None
+        self.rpm_left, self.rpm_right, self.force_x, self.force_z = self.load_throttle_map()
         self.tree = cKDTree(np.vstack((self.rpm_left, self.rpm_right)).T)
 
+        # Lookup table on a regular rpm grid used instead of the k-NN interpolation in the control loops
+        self.use_force_lut = True
+        self.build_force_lut()
+
+        # Index of the throttle map cells used by find_closest
+        self.load_throttle_cells()
+
+
+
+    # The throttle map as a DataFrame, read from the csv file the first time it is used
+    @property
+    def throttledf(self):
+        if self._throttledf is None:
+            self._throttledf = pd.read_csv(self.throttle_map_name, index_col=0, sep=";")
+
+            self._throttledf = self._throttledf.dropna(axis=1, how='all')
+
+            # Drop rows where all values are NaN
+            self._throttledf = self._throttledf.dropna(axis=0, how='all')
+
+        return self._throttledf
+
+
+    # Loads the rpm's and forces of the throttle map from the cache, or parses the csv file and stores them in the cache.
+    # The cache is a folder of .npy files named with the hash of the csv file, so a changed csv file is parsed again.
+    # The arrays are memory mapped, so loading is fast and processes share the memory
+    def load_throttle_map(self):
+        with open(self.throttle_map_name, 'rb') as file:
+            key = hashlib.sha1(file.read()).hexdigest()[:16]
+        self.throttle_cache_dir = os.path.join(os.path.dirname(self.throttle_map_name), "__throttle_cache__", key)
+
+        names = ["rpm_left", "rpm_right", "force_x", "force_z"]
+        arrays = [self.load_cached(name) for name in names]
+        if any(array is None for array in arrays):
+            arrays = self.load_and_prepare_data(self.throttle_map_name)
+            for name, array in zip(names, arrays):
+                self.store_cached(name, array)
+
+        return arrays
+
+    # Loads the cells of the throttle map for find_closest from the cache, or makes them from throttledf. The cells are
+    # in the same order as find_closest used to scan them (column by column) and cells with the same rpm's are only
+    # kept the first time, so the KD-tree gives the same cell as the scan
+    def load_throttle_cells(self):
+        names = ["cell_rpm", "cell_column", "cell_row", "cell_value"]
+        arrays = [self.load_cached(name) for name in names]
+        if any(array is None for array in arrays):
+            rpm = []
+            columns = []
+            rows = []
+            values = []
+            for column in self.throttledf.columns:
+                for row_index, value in self.throttledf[column].items():
+                    if pd.notna(value):
+                        rpm.append(list(map(float, value.split(';'))))
+                        columns.append(column)
+                        rows.append(row_index)
+                        values.append(value)
+
+            rpm = np.array(rpm, float)
+            _, first = np.unique(rpm, axis=0, return_index=True)
+            first = np.sort(first)
+            arrays = [rpm[first], np.array(columns)[first], np.array(rows, float)[first], np.array(values)[first]]
+            for name, array in zip(names, arrays):
+                self.store_cached(name, array)
+
+        self.cell_rpm, self.cell_column, self.cell_row, self.cell_value = arrays
+        self.cell_tree = cKDTree(self.cell_rpm)
+
+    # Returns an array from the throttle map cache, or None if it is not in the cache
+    def load_cached(self, name):
+        try:
+            return np.load(os.path.join(self.throttle_cache_dir, name + ".npy"), mmap_mode='r')
+        except (OSError, ValueError):
+            return None
+
+    # Stores an array in the throttle map cache. The file is written under a temporary name first so other processes
+    # never read half written files. Does nothing if the folder is not writable
+    def store_cached(self, name, array):
+        try:
+            os.makedirs(self.throttle_cache_dir, exist_ok=True)
+            temporary = os.path.join(self.throttle_cache_dir, f"{name}.{os.getpid()}.tmp.npy")
+            np.save(temporary, np.asarray(array))
+            os.replace(temporary, os.path.join(self.throttle_cache_dir, name + ".npy"))
+        except OSError as e:
+            if self.verbose:
+                print(f"Could not store the throttle map cache: {e}")
 
 
     # Sets the Otter in drift mode with zero trust
@@ -268,32 +351,116 @@ class otter_control():
         return throttle_left, throttle_right
 
 
+    #
+    #   Vectorized versions of the functions above. These take scalars or arrays of any shape, return arrays of the same
+    #   shape and keep no state in the object, so they can be used for whole logs, many vessels or plotting grids.
+    #
+
+    # Same as controlAllocation
+    def controlAllocation_vectorized(self, tau_X, tau_N):
+        tau = np.stack(np.broadcast_arrays(np.minimum(tau_X, self.max_surge_N), np.minimum(tau_N, self.max_yaw_N)), axis=-1).astype(float)
+        u_alloc = tau @ self.Binv.T
+        n = np.sign(u_alloc) * np.sqrt(np.abs(u_alloc))
+
+        return n[..., 0], n[..., 1]
+
+    # Same as radS_to_throttle_interpolation. A speed of zero gives a positive throttle
+    def radS_to_throttle_vectorized(self, n1, n2):
+        throttle = []
+        for n in (n1, n2):
+            n = np.asarray(n, float)
+            n_rpm = np.minimum(np.abs(n) / ((2*pi) / 60), self.max_rpm)
+            n_throttle = np.abs(self.rpm_to_throttle_spline(n_rpm) / 100)
+            throttle.append(np.where(n < 0, -n_throttle, n_throttle))
+
+        return throttle[0], throttle[1]
+
+    # Same as throttle_to_rads_interpolation
+    def throttle_to_rads_vectorized(self, throttle_left, throttle_right):
+        speed = []
+        for throttle in (throttle_left, throttle_right):
+            throttle = np.asarray(throttle, float)
+            n = np.abs(self.throttle_to_rpm_spline(np.clip(np.abs(throttle), 0.15, 0.60) * 100) * ((2 * math.pi) / 60))
+            speed.append(np.where(throttle < 0, -n, n))
+
+        return speed[0], speed[1]
+
+    # Same as interpolate_force_values. speed is an array with the left and right speeds in the last axis
+    def interpolate_force_values_vectorized(self, rads_left, rads_right, k=3):
+        rads_left, rads_right = np.broadcast_arrays(np.asarray(rads_left, float), np.asarray(rads_right, float))
+        rpm = np.stack(((rads_left * 60) / (2 * math.pi), (rads_right * 60) / (2 * math.pi)), axis=-1)
+
+        distances, indices = self.tree.query(rpm.reshape(-1, 2), k)
+        distances = distances.reshape(-1, k)
+        indices = indices.reshape(-1, k)
+        weights = 1 / (distances + 1e-10)
+        normalized_weights = weights / np.sum(weights, axis=1, keepdims=True)
+
+        force_x_interp = np.sum(normalized_weights * self.force_x[indices], axis=1).reshape(rads_left.shape)
+        force_z_interp = np.sum(normalized_weights * self.force_z[indices], axis=1).reshape(rads_left.shape)
+        interpolated_rpm = np.stack((np.sum(normalized_weights * self.rpm_left[indices], axis=1),
+                                     np.sum(normalized_weights * self.rpm_right[indices], axis=1)), axis=-1)
+
+        speed = ((interpolated_rpm * 2 * math.pi) / 60).reshape(rads_left.shape + (2,))
+
+        return force_x_interp, force_z_interp, speed
+
+    # The force_x and torque_z sent to the Otter for the control forces tau_X and tau_N, the same way as
+    # otter.controller_inputs_torque. Used to go through logged or simulated forces offline
+    def tau_to_force_values_vectorized(self, tau_X, tau_N):
+        tau_X, tau_N = np.broadcast_arrays(np.asarray(tau_X, float), np.asarray(tau_N, float))
+
+        # The throttle map is for positive surge and yaw, so the signs are put back on after the lookup
+        n1, n2 = self.controlAllocation_vectorized(np.abs(tau_X), np.abs(tau_N))
+        n1 = np.where(n1 < 0, 0.1, n1)
+        n2 = np.where(n2 < 0, 0.1, n2)
+
+        if self.use_force_lut:
+            torque_z, torque_x, speed = self.lookup_force_values(n1, n2)
+        else:
+            torque_z, torque_x, speed = self.interpolate_force_values_vectorized(n1, n2, 3)
+
+        torque_z = np.where(torque_z < 0.05, 0.0, torque_z)
+        torque_z = np.where(tau_N < 0, -torque_z, torque_z)
+        torque_x = np.where(tau_X < 0, -torque_x, torque_x)
+
+        return torque_x, torque_z
+
+
     # Finds the closest throttle values from the inputet rpm's in the throttle map
     def find_closest(self, input_value):
 
         target_x, target_y = map(float, input_value.strip("()").split(';'))
 
-        target_x = (target_x*60)/(2*math.pi)
-        target_y = (target_y * 60) / (2 * math.pi)
+        cell = self.find_closest_cells(target_x, target_y)[0]
 
+        closest_indices = (str(self.cell_column[cell]), self.cell_row[cell])
+        speed = str(self.cell_value[cell])
 
-        closest_distance = float('inf')
-        closest_indices = None
+        return closest_indices, speed
 
-        for column in self.throttledf.columns:
-            for row_index, value in self.throttledf[column].items():
-                if pd.notna(value):
-                    cell_x, cell_y = map(float, value.split(';'))
-                    distance = np.sqrt((cell_x - target_x) ** 2 + (cell_y - target_y) ** 2)
+    # Finds the closest throttle map cells for arrays of speeds (rad/s). Returns the indices of the cells in the cell_
+    # arrays. The nearest few cells are checked with the same distance as the old scan, and equal distances go to the
+    # cell that comes first column by column like the scan did
+    def find_closest_cells(self, rads_left, rads_right, k=4):
+        target = np.stack(np.broadcast_arrays((np.asarray(rads_left, float) * 60) / (2 * math.pi),
+                                              (np.asarray(rads_right, float) * 60) / (2 * math.pi)), axis=-1).reshape(-1, 2)
 
-                    if distance < closest_distance:
-                        closest_distance = distance
-                        closest_indices = (column, row_index)
-                        speed = self.throttledf[f"{float(column):.2f}"][float(row_index)]
+        k = min(k, len(self.cell_rpm))
+        _, candidates = self.cell_tree.query(target, k)
+        candidates = np.sort(candidates.reshape(-1, k), axis=1)
 
+        cells = self.cell_rpm[candidates]
+        distance = np.sqrt((cells[..., 0] - target[:, 0:1]) ** 2 + (cells[..., 1] - target[:, 1:2]) ** 2)
 
+        return candidates[np.arange(len(target)), np.argmin(distance, axis=1)]
 
-        return closest_indices, speed
+    # Batch version of find_closest. Returns the throttle map row and column values (force_x, force_z) and the rpm's of
+    # the closest cells
+    def find_closest_batch(self, rads_left, rads_right):
+        cells = self.find_closest_cells(rads_left, rads_right)
+
+        return self.cell_row[cells], self.cell_column[cells].astype(float), self.cell_rpm[cells]
 
     # Loads and prepares data for interpolating throttle 2D throttle map
     def load_and_prepare_data(self, csv_file_path):
@@ -337,6 +504,81 @@ class otter_control():
 
 
 
+    # Builds a lookup table of force_x, force_z and the interpolated rpm's on a regular rpm grid, using the k-NN
+    # interpolation at every grid point. lookup_force_values interpolates bilinear between the grid points
+    def build_force_lut(self, rpm_step=10, k=3):
+        cache_name = f"force_lut_{rpm_step}_{k}"
+        rpm_max = max(self.rpm_left.max(), self.rpm_right.max())
+        self.lut_rpm_step = rpm_step
+        self.lut_size = int(math.ceil(rpm_max / rpm_step)) + 1
+
+        self.force_lut = self.load_cached(cache_name)
+        if self.force_lut is None or self.force_lut.shape != (self.lut_size, self.lut_size, 4):
+            grid = np.arange(self.lut_size) * rpm_step
+            grid_left, grid_right = np.meshgrid(grid, grid, indexing='ij')
+            distances, indices = self.tree.query(np.column_stack((grid_left.ravel(), grid_right.ravel())), k)
+            weights = 1 / (distances + 1e-10)
+            normalized_weights = weights / np.sum(weights, axis=1, keepdims=True)
+
+            values = [np.sum(normalized_weights * data[indices], axis=1) for data in (self.force_x, self.force_z, self.rpm_left, self.rpm_right)]
+            self.force_lut = np.stack(values, axis=1).reshape(self.lut_size, self.lut_size, 4)
+            self.store_cached(cache_name, self.force_lut)
+
+        self.force_lut_list = self.force_lut.tolist()                           # Plain lists are faster for single values
+
+    # Same as interpolate_force_values but with bilinear interpolation in the lookup table. Takes scalars or arrays
+    def lookup_force_values(self, rads_left, rads_right):
+        if isinstance(rads_left, float) and isinstance(rads_right, float) or np.ndim(rads_left) == 0 and np.ndim(rads_right) == 0:
+            return self.lookup_force_value(float(rads_left), float(rads_right))
+
+        x = np.clip((np.asarray(rads_left, float) * 60) / (2 * math.pi) / self.lut_rpm_step, 0, self.lut_size - 1)
+        y = np.clip((np.asarray(rads_right, float) * 60) / (2 * math.pi) / self.lut_rpm_step, 0, self.lut_size - 1)
+
+        i = np.minimum(x.astype(int), self.lut_size - 2)
+        j = np.minimum(y.astype(int), self.lut_size - 2)
+        fx = (x - i)[..., None]
+        fy = (y - j)[..., None]
+
+        lut = self.force_lut
+        values = ((1 - fx) * (1 - fy) * lut[i, j] + fx * (1 - fy) * lut[i + 1, j]
+                  + (1 - fx) * fy * lut[i, j + 1] + fx * fy * lut[i + 1, j + 1])
+
+        speed = [(values[..., 2]*2*math.pi)/60, (values[..., 3]*2*math.pi)/60]
+
+        return values[..., 0], values[..., 1], speed
+
+    # Single value version of lookup_force_values without NumPy overhead
+    def lookup_force_value(self, rads_left, rads_right):
+        last = self.lut_size - 1
+        x = min(max((rads_left * 60) / (2 * math.pi) / self.lut_rpm_step, 0.0), last)
+        y = min(max((rads_right * 60) / (2 * math.pi) / self.lut_rpm_step, 0.0), last)
+
+        i = min(int(x), last - 1)
+        j = min(int(y), last - 1)
+        fx = x - i
+        fy = y - j
+
+        w00 = (1 - fx) * (1 - fy)
+        w10 = fx * (1 - fy)
+        w01 = (1 - fx) * fy
+        w11 = fx * fy
+        v00 = self.force_lut_list[i][j]
+        v10 = self.force_lut_list[i + 1][j]
+        v01 = self.force_lut_list[i][j + 1]
+        v11 = self.force_lut_list[i + 1][j + 1]
+        values = [w00 * v00[n] + w10 * v10[n] + w01 * v01[n] + w11 * v11[n] for n in range(4)]
+
+        speed = [(values[2]*2*math.pi)/60, (values[3]*2*math.pi)/60]
+
+        return values[0], values[1], speed
+
+    # Force and torque from the propeller speeds, from the lookup table or the k-NN interpolation
+    def force_values(self, rads_left, rads_right, k=3):
+        if self.use_force_lut:
+            return self.lookup_force_values(rads_left, rads_right)
+        return self.interpolate_force_values(rads_left, rads_right, k)
+
+
     # Applies emergency brakes using reverse trusting until the speed of the Otter is below zero
     def EMERGENCY_BRAKES(self, otter_connector):
         print("APPLYING EMERGENCY BRAKES")
@@ -0,0 +1,120 @@
+import numpy as np
+
+
+#
+#   Row buffer for storing simulation history without growing arrays with np.vstack every step.
+#   If the number of rows is known the buffer is allocated once. If the run can end early the buffer starts
+#   with one chunk and grows in chunks, so memory is not wasted on a run that stops after a few rows.
+#
+
+
+class history_buffer():
+
+    def __init__(self, columns, capacity=None, chunk_size=10000):
+
+        self.columns = columns
+        self.chunk_size = chunk_size
+
+        if capacity is None:
+            capacity = chunk_size
+
+        self.data = np.empty((capacity, columns), float)
+        self.length = 0
+
+
+    # Adds one row to the buffer. Grows the buffer with one chunk if it is full
+    def append(self, row):
+        if self.length == self.data.shape[0]:
+            self.grow(self.growth())
+
+        self.data[self.length] = row
+        self.length = self.length + 1
+
+
+    # Returns a writable view of the next row in the buffer. Used to fill in a row in place without building it first
+    def next_row(self):
+        if self.length == self.data.shape[0]:
+            self.grow(self.growth())
+
+        self.length = self.length + 1
+        return self.data[self.length - 1]
+
+
+    # Adds several rows to the buffer at once
+    def extend(self, rows):
+        rows = np.asarray(rows, float).reshape(-1, self.columns)
+        missing = self.length + rows.shape[0] - self.data.shape[0]
+        if missing > 0:
+            self.grow(max(missing, self.chunk_size))
+
+        self.data[self.length:self.length + rows.shape[0]] = rows
+        self.length = self.length + rows.shape[0]
+
+
+    # Number of rows to add when the buffer is full. At least one chunk, and half the current size for long runs so the
+    # number of copies stays low
+    def growth(self):
+        return max(self.chunk_size, self.data.shape[0] // 2)
+
+
+    # Increases the capacity of the buffer with the given number of rows
+    def grow(self, rows):
+        new_data = np.empty((self.data.shape[0] + rows, self.columns), float)
+        new_data[:self.length] = self.data[:self.length]
+        self.data = new_data
+
+
+    # Empties the buffer without freeing the memory
+    def clear(self):
+        self.length = 0
+
+
+    # Returns the stored rows. The returned array is trimmed to the number of rows stored
+    def array(self):
+        return self.data[:self.length]
+
+
+    def __len__(self):
+        return self.length
+
+
+# Row buffer keeping only the newest capacity rows, for live data where memory and the cost of reading the buffer must
+# not grow with the length of the run. Every row is written twice, capacity rows apart, so the stored rows are always
+# one contiguous block and array() returns a view without copying
+class ring_buffer():
+
+    def __init__(self, columns, capacity):
+
+        self.columns = columns
+        self.capacity = capacity
+
+        self.data = np.full((2 * capacity, columns), np.nan)
+        self.start = 0
+        self.length = 0
+
+
+    # Adds one row. The oldest row is dropped if the buffer is full
+    def append(self, row):
+        if self.length == self.capacity:
+            index = self.start
+            self.start = (self.start + 1) % self.capacity
+        else:
+            index = (self.start + self.length) % self.capacity
+            self.length = self.length + 1
+
+        self.data[index] = row
+        self.data[index + self.capacity] = row
+
+
+    def clear(self):
+        self.start = 0
+        self.length = 0
+
+
+    # Returns the stored rows from the oldest to the newest
+    def array(self):
+        return self.data[self.start:self.start + self.length]
+
+
+    def __len__(self):
+        return self.length
@@ -1,9 +1,12 @@
 import numpy as np
+import asyncio
 import time
 import math
 import datetime
-import pandas as pd
 import os
+import lib.Trajectory as Trajectory
+import lib.Run_logger as Run_logger
+import lib.Scheduler as Scheduler
 
 
 class live_guidance():
@@ -35,96 +38,62 @@ class live_guidance():
         self.total_distance_to_target = 0.0
         self.counter = 0
 
+        # Reads the telemetry in a background thread so the control cycle does not wait for the socket
+        self.use_telemetry_thread = True
 
+        # Folder save_log stores the logs in
+        self.logs_dir = './logs'
 
+        # What the control loop does when a cycle takes longer than cycletime, see lib/Scheduler.py
+        self.overrun_policy = "skip"
+        self.scheduler = None
 
-    def target_tracking(self, start_north, start_east, v_north, v_east):
-        self.otter.establish_connection(self.ip, self.port)
-        self.otter.update_values()
+        # Rows of the current tracking, the log is made from them when it is saved
+        self.logger = None
+        self.log = None
 
+        # Sends the values of every cycle to Telemetry_viewer.py if set, see lib/Telemetry_channel.py
+        self.publisher = None
 
-        self.referance_point = [self.otter.sorted_values["lat"], self.otter.sorted_values["lon"], 0.0]
-        self.otter.observer_coordinates = self.referance_point
-        self.target_ne_pos = [start_north, start_east]
-
-        current_datetime = datetime.datetime.now().strftime("%Y-%m-%d_%H:%M:%S:%f")
-        self.log = pd.DataFrame([self.otter.sorted_values], index=[current_datetime])
-
-
-        self.otter.controller_inputs_torque(10, 0)
-        time.sleep(2)
-        self.otter.controller_inputs_torque(10, 0)
-        time.sleep(1)
 
 
 
+    def target_tracking(self, start_north, start_east, v_north, v_east):
+        path = Trajectory.trajectory([start_north, start_east], [{"type" : "line", "velocity" : [v_north, v_east]}], self.cycletime)
         print(f"Starting tracking. North error is {start_north}m and east error is {start_east}m")
-        try:
-            while True:
-                start_time = time.time()
-
-                tau_X, tau_N = self.calculate_forces()
-                self.otter.controller_inputs_torque(tau_X, tau_N, self.surge_setpoint)
-
-                self.otter.sorted_values["north_error"] = self.north_error
-                self.otter.sorted_values["east_error"] = self.east_error
-                self.otter.sorted_values["distance_to_target"] = self.distance_to_target
-                self.otter.sorted_values["yaw_setpoint"] = self.yaw_setpoint
-                self.otter.sorted_values["current_angle"] = self.current_angle
-
-                self.otter.sorted_values["tau_X"] = tau_X
-                self.otter.sorted_values["tau_N"] = tau_N
-
-
-                self.target_ne_pos = [self.target_ne_pos[0] + (v_north/(1/self.cycletime)), self.target_ne_pos[1] + (v_east/(1/self.cycletime))]    # Updates target
+        self.trajectory_tracking(path)
 
-                self.otter.sorted_values["target_north_from_observer"] = self.target_ne_pos[0]
-                self.otter.sorted_values["target_east_from_observer"] = self.target_ne_pos[1]
 
-                current_datetime = datetime.datetime.now().strftime("%Y-%m-%d_%H:%M:%S:%f")
-                temp_df = pd.DataFrame([self.otter.sorted_values], index=[current_datetime])
-
-                # This makes sure there is no duplicates of datetimes in the log
-                if current_datetime in self.log.index:
-                    self.log.loc[current_datetime] = temp_df.loc[current_datetime]
-                else:
-                    self.log = pd.concat([self.log, temp_df])
-
-
-
-                elapsed_time = time.time() - start_time
-
-                self.counter = self.counter + 1
-                self.total_distance_to_target = self.total_distance_to_target + self.distance_to_target
-
-                if elapsed_time < self.cycletime:
-                    time.sleep(self.cycletime - elapsed_time)
-
-
-        except KeyboardInterrupt:
-            print("Tracking disabled. Otter is now in drift mode")
-            self.otter.drift()
-
-            logs_dir = '../logs'
-            if not os.path.exists(logs_dir):
-                os.makedirs(logs_dir)
+    def circular_tracking(self, start_north, start_east, radius, v):
+        path = Trajectory.trajectory([start_north + radius, start_east], [{"type" : "circle", "center" : [start_north, start_east], "radius" : radius, "speed" : v}], self.cycletime)
+        print(f"Starting circular tracking")
+        self.trajectory_tracking(path)
 
-            filename = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S") + '.csv'
-            file_path = os.path.join(logs_dir, filename)
-            self.log.to_csv(file_path, sep=';')
 
-            time.sleep(10)
+    def square_tracking(self, start_north, start_east, side_length, target_speed):
+        path = Trajectory.trajectory([start_north, start_east], [{"type" : "square", "side_length" : side_length, "speed" : target_speed}], self.cycletime)
+        print(f"Starting tracking. North error is {start_north}m and east error is {start_east}m")
+        self.trajectory_tracking(path)
 
 
-    def circular_tracking(self, start_north, start_east, radius, v):
+    # Tracks a target moving along a path from lib/Trajectory.py. The target position is looked up from the time since
+    # the tracking started, so a slow cycle does not slow down the target
+    def trajectory_tracking(self, path):
         self.otter.establish_connection(self.ip, self.port)
         self.otter.update_values()
+        start_time = time.time()
+        while self.otter.otter_connector.current_position[:2] == [0.0, 0.0] and time.time() - start_time < 10:     # Waits for a position like trajectory_tracking_async
+            self.otter.update_values()
+        if self.use_telemetry_thread:
+            self.otter.start_telemetry()
+
 
         self.referance_point = [self.otter.sorted_values["lat"], self.otter.sorted_values["lon"], 0.0]
         self.otter.observer_coordinates = self.referance_point
+        self.target_ne_pos = list(path.position(0))
+
+        self.start_log('../logs')
 
-        current_datetime = datetime.datetime.now().strftime("%Y-%m-%d_%H:%M:%S:%f")
-        self.log = pd.DataFrame([self.otter.sorted_values], index=[current_datetime])
 
         self.otter.controller_inputs_torque(10, 0)
         time.sleep(2)
@@ -132,162 +101,109 @@ class live_guidance():
         time.sleep(1)
 
         self.function_time = time.time()
+        self.scheduler = Scheduler.periodic_scheduler(self.cycletime, self.overrun_policy)
+        self.scheduler.start()
 
-        print(f"Starting circular tracking")
         try:
             while True:
-                start_time = time.time()
-
-                omega = v / radius
-                theta = omega * (time.time() - self.function_time)
-                self.target_ne_pos = [start_north + radius * np.cos(theta), start_east + radius * np.sin(theta)]
+                self.target_ne_pos = list(path.position(self.scheduler.elapsed()))                     # Updates target
 
-                tau_X, tau_N = self.calculate_forces()
+                self.otter.update_values()
+                self.scheduler.mark("read")
+                tau_X, tau_N = self.calculate_forces(update_values=False)
+                self.scheduler.mark("compute")
                 self.otter.controller_inputs_torque(tau_X, tau_N, self.surge_setpoint)
+                self.scheduler.mark("send")
 
-                self.otter.sorted_values["north_error"] = self.north_error
-                self.otter.sorted_values["east_error"] = self.east_error
-                self.otter.sorted_values["distance_to_target"] = self.distance_to_target
-                self.otter.sorted_values["yaw_setpoint"] = self.yaw_setpoint
-                self.otter.sorted_values["current_angle"] = self.current_angle
+                self.log_cycle(tau_X, tau_N)
+                self.scheduler.mark("log")
 
-                self.otter.sorted_values["tau_X"] = tau_X
-                self.otter.sorted_values["tau_N"] = tau_N
+                self.scheduler.wait()
 
-                self.otter.sorted_values["target_north_from_observer"] = self.target_ne_pos[0]
-                self.otter.sorted_values["target_east_from_observer"] = self.target_ne_pos[1]
 
-                current_datetime = datetime.datetime.now().strftime("%Y-%m-%d_%H:%M:%S:%f")
-                temp_df = pd.DataFrame([self.otter.sorted_values], index=[current_datetime])
-
-                # This makes sure there is no duplicates of datetimes in the log
-                if current_datetime in self.log.index:
-                    self.log.loc[current_datetime] = temp_df.loc[current_datetime]
-                else:
-                    self.log = pd.concat([self.log, temp_df])
+        except KeyboardInterrupt:
+            self.otter.stop_telemetry()
+            self.save_log(logs_dir='../logs')
 
+            time.sleep(10)
 
-                elapsed_time = time.time() - start_time
 
-                self.counter = self.counter + 1
-                self.total_distance_to_target = self.total_distance_to_target + self.distance_to_target
+    # Stores the values of one cycle in sorted_values and adds them to the log
+    def log_cycle(self, tau_X, tau_N):
+        self.otter.sorted_values["north_error"] = self.north_error
+        self.otter.sorted_values["east_error"] = self.east_error
+        self.otter.sorted_values["distance_to_target"] = self.distance_to_target
+        self.otter.sorted_values["yaw_setpoint"] = self.yaw_setpoint
+        self.otter.sorted_values["current_angle"] = self.current_angle
 
-                if elapsed_time < self.cycletime:
-                    time.sleep(self.cycletime - elapsed_time)
+        self.otter.sorted_values["tau_X"] = tau_X
+        self.otter.sorted_values["tau_N"] = tau_N
 
+        self.otter.sorted_values["target_north_from_observer"] = self.target_ne_pos[0]
+        self.otter.sorted_values["target_east_from_observer"] = self.target_ne_pos[1]
 
-        except KeyboardInterrupt:
-            print("Tracking disabled. Otter is now in drift mode")
-            self.otter.drift()
+        self.logger.append(self.otter.sorted_values)
+        if self.publisher is not None:
+            self.publisher.publish(self.otter.sorted_values)
 
-            logs_dir = '../logs'
-            if not os.path.exists(logs_dir):
-                os.makedirs(logs_dir)
+        self.counter = self.counter + 1
+        self.total_distance_to_target = self.total_distance_to_target + self.distance_to_target
 
-            filename = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S") + '.csv'
-            file_path = os.path.join(logs_dir, filename)
-            self.log.to_csv(file_path, sep=';')
 
-
-            time.sleep(10)
-
-    def square_tracking(self, start_north, start_east, side_length, target_speed):
-        self.otter.establish_connection(self.ip, self.port)
-        self.otter.update_values()
+    # Same as trajectory_tracking, but as an asyncio task. The Otter API must use an async_otter_connector from
+    # lib/Async_connector.py, where the telemetry is read and the commands are sent by tasks of their own. The loop only
+    # uses the newest values and never waits for the socket, so several Otters can be driven from one event loop.
+    # Runs until the task is cancelled or until duration (s) has passed, then the Otter drifts and the log is saved
+    async def trajectory_tracking_async(self, path, duration=None):
+        connector = self.otter.otter_connector
+        if not await self.otter.establish_connection(self.ip, self.port):
+            return
+        start_time = time.time()
+        while connector.current_position[:2] == [0.0, 0.0] and time.time() - start_time < 10:     # The first sentence can be $PMARIMU, waits for a position
+            await connector.update_values(timeout = 1)
+        self.otter.sort_values()
 
 
         self.referance_point = [self.otter.sorted_values["lat"], self.otter.sorted_values["lon"], 0.0]
         self.otter.observer_coordinates = self.referance_point
-        self.target_ne_pos = [start_north, start_east]
-
-        current_datetime = datetime.datetime.now().strftime("%Y-%m-%d_%H:%M:%S:%f")
-        self.log = pd.DataFrame([self.otter.sorted_values], index=[current_datetime])
+        self.target_ne_pos = list(path.position(0))
 
+        self.start_log(self.logs_dir, f"_{self.ip}_{self.port}")
 
-        self.otter.controller_inputs_torque(10, 0)
-        time.sleep(2)
-        self.otter.controller_inputs_torque(10, 0)
-        time.sleep(1)
-
-        curdir = "we"
-
-        print(f"Starting tracking. North error is {start_north}m and east error is {start_east}m")
         try:
-            while True:
-                start_time = time.time()
-
-                tau_X, tau_N = self.calculate_forces()
+            self.otter.controller_inputs_torque(10, 0)
+            await asyncio.sleep(2)
+            self.otter.controller_inputs_torque(10, 0)
+            await asyncio.sleep(1)
+
+            self.function_time = time.time()
+            self.scheduler = Scheduler.periodic_scheduler(self.cycletime, self.overrun_policy)
+            self.scheduler.start()
+
+            while duration is None or self.scheduler.elapsed() < duration:
+                self.target_ne_pos = list(path.position(self.scheduler.elapsed()))                     # Updates target
+
+                self.otter.sort_values()
+                self.scheduler.mark("read")
+                tau_X, tau_N = self.calculate_forces(update_values=False)
+                self.scheduler.mark("compute")
                 self.otter.controller_inputs_torque(tau_X, tau_N, self.surge_setpoint)
+                self.scheduler.mark("send")
 
-                self.otter.sorted_values["north_error"] = self.north_error
-                self.otter.sorted_values["east_error"] = self.east_error
-                self.otter.sorted_values["distance_to_target"] = self.distance_to_target
-                self.otter.sorted_values["yaw_setpoint"] = self.yaw_setpoint
-                self.otter.sorted_values["current_angle"] = self.current_angle
-
-                self.otter.sorted_values["tau_X"] = tau_X
-                self.otter.sorted_values["tau_N"] = tau_N
+                self.log_cycle(tau_X, tau_N)
+                self.scheduler.mark("log")
 
-                if self.cycletime*target_speed*self.counter % side_length == 0:
-                    if curdir == "ns":
-                        curdir = "ew"
-                    elif curdir == "ew":
-                        curdir = "sn"
-                    elif curdir == "sn":
-                        curdir = "we"
-                    elif curdir == "we":
-                        curdir = "ns"
+                await self.scheduler.wait_async()
 
-                if curdir == "ns":
-                    self.target_ne_pos = [self.target_ne_pos[0] - (target_speed/(1/self.cycletime)), self.target_ne_pos[1]]
-                elif curdir == "ew":
-                    self.target_ne_pos = [self.target_ne_pos[0], self.target_ne_pos[1] - (target_speed/(1/self.cycletime))]
-                elif curdir == "sn":
-                    self.target_ne_pos = [self.target_ne_pos[0] + (target_speed/(1/self.cycletime)), self.target_ne_pos[1]]
-                elif curdir == "we":
-                    self.target_ne_pos = [self.target_ne_pos[0], self.target_ne_pos[1] + (target_speed / (1 / self.cycletime))]
+        finally:
+            self.save_log(f"_{self.ip}_{self.port}")                # Several Otters can be tracked at the same time
+            await connector.close_connection()
 
 
-                self.otter.sorted_values["target_north_from_observer"] = self.target_ne_pos[0]
-                self.otter.sorted_values["target_east_from_observer"] = self.target_ne_pos[1]
+    def calculate_forces(self, update_values=True):
 
-                current_datetime = datetime.datetime.now().strftime("%Y-%m-%d_%H:%M:%S:%f")
-                temp_df = pd.DataFrame([self.otter.sorted_values], index=[current_datetime])
-
-                # This makes sure there is no duplicates of datetimes in the log
-                if current_datetime in self.log.index:
-                    self.log.loc[current_datetime] = temp_df.loc[current_datetime]
-                else:
-                    self.log = pd.concat([self.log, temp_df])
-
-
-
-                elapsed_time = time.time() - start_time
-
-                self.counter = self.counter + 1
-                self.total_distance_to_target = self.total_distance_to_target + self.distance_to_target
-
-                if elapsed_time < self.cycletime:
-                    time.sleep(self.cycletime - elapsed_time)
-
-
-        except KeyboardInterrupt:
-            print("Tracking disabled. Otter is now in drift mode")
-            self.otter.drift()
-
-            logs_dir = '../logs'
-            if not os.path.exists(logs_dir):
-                os.makedirs(logs_dir)
-
-            filename = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S") + '.csv'
-            file_path = os.path.join(logs_dir, filename)
-            self.log.to_csv(file_path, sep=';')
-
-            time.sleep(10)
-
-    def calculate_forces(self):
-
-        self.otter.update_values()
+        if update_values:
+            self.otter.update_values()
         self.otter_ne_pos = [self.otter.sorted_values["north_from_observer"], self.otter.sorted_values["east_from_observer"]]
 
         self.north_error = self.target_ne_pos[0] - self.otter_ne_pos[0]
@@ -315,15 +231,37 @@ class live_guidance():
         return tau_X, tau_N
 
 
-    def save_log(self):
+    # Starts a new log with the current values as the first row. During the tracking the full chunks of the log are
+    # written to a .chunks file in logs_dir by a background thread, see lib/Run_logger.py
+    def start_log(self, logs_dir, suffix=""):
+        if not os.path.exists(logs_dir):
+            os.makedirs(logs_dir)
+        spill_path = os.path.join(logs_dir, datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S") + suffix + '.chunks')
+        self.logger = Run_logger.run_logger(spill_path)
+        self.logger.append(self.otter.sorted_values)
+
+
+    # Saves the log as CSV. The log is also kept as a DataFrame in self.log. The timing histograms of the control loop
+    # are saved next to it in a file ending with _timing.csv
+    def save_log(self, suffix="", logs_dir=None):
         print("Tracking disabled. Otter is now in drift mode")
         self.otter.drift()
-        logs_dir = './logs'
+        if self.logger is None:                                             # Already saved, the exit handler in main.py saves again
+            return
+        if logs_dir is None:
+            logs_dir = self.logs_dir
         if not os.path.exists(logs_dir):
             os.makedirs(logs_dir)
-        filename = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S") + '.csv'
+        filename = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S") + suffix + '.csv'
         file_path = os.path.join(logs_dir, filename)
+        spill_path = self.logger.spill_path
         try:
-            self.log.to_csv(file_path, sep=';')
+            self.log = self.logger.save(file_path)
+            if self.scheduler is not None:
+                print(self.scheduler.report())
+                self.scheduler.save(file_path[:-4] + '_timing.csv')
+            self.logger.close()                                             # Removes the .chunks file, so only when everything is saved
+            self.logger = None
         except Exception as e:
             print(f"Error when trying to save the log: {e}")
+            print(f"The rows of the tracking are kept in {spill_path}")
@@ -1,166 +1,174 @@
 import matplotlib.pyplot as plt
-import matplotlib.animation as animation
 from matplotlib import style
 import matplotlib
 matplotlib.use('Agg')
+import numpy as np
 import time
 import math
+import lib.History_buffer as History_buffer
+
+
+#
+#   Live plot of the tracking, sampled from otter.sorted_values every interval ms. The samples are stored in a ring
+#   buffer with the last "window" seconds, and the lines are drawn with blitting: only the lines are redrawn every frame,
+#   on top of a saved background with the axes, labels and legends. The background is only drawn again when the data
+#   leaves the axis limits, which have some room so it happens seldom. Lines with more than max_points samples are
+#   decimated to the min and max of each bucket of samples, so peaks are still shown. The time of a frame therefore
+#   stays the same however long the tracking runs, and the plotter takes little time from the control loop.
+#
 
 
 class live_plotter():
 
-    def __init__(self, otter):
+    def __init__(self, otter, window=600, interval=200, max_points=500, show=True):
 
         self.otter = otter
+        self.interval = interval
+        self.max_points = max_points
 
         self.fig, ax = plt.subplots(2, 3, figsize=(10,8))
         self.ax1, self.ax2, self.ax3, self.ax4, self.ax5, self.ax6 = ax.flatten()
 
         self.fig.suptitle("Live data")
 
-        self.xs11 = []
-        self.xs12 = []
-        self.ys11 = []
-        self.ys12 = []
-        self.x11 = "time"
-        self.x12 = "time"
-        self.y11 = "tau_X"
-        self.y12 = "tau_N"
-
-        self.xs21 = []
-        self.xs22 = []
-        self.ys21 = []
-        self.ys22 = []
-        self.x21 = "east_from_observer"
-        self.x22 = "target_east_from_observer"
-        self.y21 = "north_from_observer"
-        self.y22 = "target_north_from_observer"
-
-        self.xs31 = []
-        self.xs32 = []
-        self.ys31 = []
-        self.ys32 = []
-        self.x31 = "time"
-        self.x32 = "time"
-        self.y31 = "current_orientation_3"
-        self.y32 = "yaw_setpoint"
-
-        self.xs41 = []
-        self.xs42 = []
-        self.ys41 = []
-        self.ys42 = []
-        self.x41 = "time"
-        self.x42 = "time"
-        self.y41 = "distance_to_target"
-        self.y42 = "distance_to_target"
-
-        self.xs51 = []
-        self.xs52 = []
-        self.ys51 = []
-        self.ys52 = []
-        self.x51 = "time"
-        self.x52 = "time"
-        self.y51 = "n1"
-        self.y52 = "n2"
+        # The values in the ring buffer. "time" is the time since the plot started, yaw_setpoint is stored in degrees
+        self.keys = ["time", "tau_X", "tau_N", "east_from_observer", "north_from_observer", "target_east_from_observer",
+                     "target_north_from_observer", "current_orientation_3", "yaw_setpoint", "distance_to_target", "n1", "n2"]
+        self.scale = {"yaw_setpoint" : 180 / math.pi}
+        self.buffer = History_buffer.ring_buffer(len(self.keys), int(window * 1000 / interval))
+        self.column = {key : k for k, key in enumerate(self.keys)}
+
+        # Axes, axis labels and the lines in them as (x, y, style, label)
+        self.panels = [(self.ax1, "Time (s)", "N", [("time", "tau_X", "r-", "tau_X"), ("time", "tau_N", "b-", "tau_N")]),
+                       (self.ax2, "East (m)", "North (m)", [("east_from_observer", "north_from_observer", "r-", "Otter position"),
+                                                           ("target_east_from_observer", "target_north_from_observer", "c-", "Target position")]),
+                       (self.ax3, "Time (s)", "Angle (deg)", [("time", "current_orientation_3", "m-", "Current angle"), ("time", "yaw_setpoint", "y-", "Desired angle")]),
+                       (self.ax4, "Time (s)", "Distance (m)", [("time", "distance_to_target", "k-", "Distance_to_target")]),
+                       (self.ax5, "Time (s)", "Thruster speed (rad/s)", [("time", "n1", "r-", "Left thruster"), ("time", "n2", "b-", "Right thruster")])]
+
+        self.lines = []
+        for ax, xlabel, ylabel, lines in self.panels:
+            ax.set_xlabel(xlabel)
+            ax.set_ylabel(ylabel)
+            for x, y, line_style, label in lines:
+                line, = ax.plot([], [], line_style, label=label, animated=True)
+                self.lines.append((ax, line, self.column[x], self.column[y], x == "time"))
+            ax.legend()
+
+        self.background = None
+        self.fig.canvas.mpl_connect("draw_event", self.on_draw)
 
         self.start_time = 0.0
 
-        self.plot()
-
-
-    def animate(self, i):
-
-        if self.x11 == "time" and self.x12 == "time":
-            self.xs11.append(float(time.time() - self.start_time))
-            self.xs12 = self.xs11
-
+        if show:
+            self.plot()
+
+
+    # Adds the current values of the Otter to the ring buffer. Values that are not set yet are NaN
+    def sample(self):
+        row = np.empty(len(self.keys))
+        row[0] = time.time() - self.start_time
+        for k, key in enumerate(self.keys[1:], 1):
+            value = self.otter.sorted_values.get(key, math.nan)
+            try:
+                row[k] = float(value) * self.scale.get(key, 1)
+            except (TypeError, ValueError):
+                row[k] = math.nan
+        self.buffer.append(row)
+
+
+    def animate(self, i=None):
+        self.sample()
+        data = self.buffer.array()
+
+        for ax, line, x, y, time_series in self.lines:
+            if time_series:
+                line.set_data(*min_max_decimate(data[:, x], data[:, y], self.max_points))
+            else:
+                step = max(1, math.ceil(len(data) / self.max_points))
+                line.set_data(data[::step, x], data[::step, y])
+
+        rescaled = False
+        for ax, xlabel, ylabel, lines in self.panels:
+            rescaled = self.update_limits(ax, xlabel == "Time (s)") or rescaled
+
+        canvas = self.fig.canvas
+        if rescaled or self.background is None:
+            canvas.draw()                                                   # New background, on_draw draws the lines
         else:
-            self.xs11.append(float(self.otter.sorted_values[self.x11]))
-            self.xs12.append(float(self.otter.sorted_values[self.x12]))
-        self.ys11.append(float(self.otter.sorted_values[self.y11]))
-        self.ys12.append(float(self.otter.sorted_values[self.y12]))
-
-        self.ax1.clear()
-        self.ax1.set_xlabel("Time (s)")
-        self.ax1.set_ylabel("N")
-        self.ax1.plot(self.xs11, self.ys11, "r-", label=self.y11)
-        self.ax1.plot(self.xs12, self.ys12, "b-", label=self.y12)
-        self.ax1.legend()
-
-
-        if self.x21 == "time" and self.x22 == "time":
-            self.xs21.append(float(time.time() - self.start_time))
-            self.xs22 = self.xs21
-
+            canvas.restore_region(self.background)
+            self.draw_lines()
+            canvas.blit(self.fig.bbox)
+        canvas.flush_events()
+
+
+    # Sets new limits if the lines are outside the axes, or if a time axis has scrolled a quarter of the way past the
+    # data. The new limits have room for the lines to grow. Returns True if the limits changed
+    def update_limits(self, ax, time_axis):
+        x = []
+        y = []
+        for line in ax.get_lines():
+            x.append(line.get_xdata())
+            y.append(line.get_ydata())
+        x = np.concatenate(x)
+        y = np.concatenate(y)
+        if not np.isfinite(y).any() or not np.isfinite(x).any():
+            return False
+        x_min, x_max = np.nanmin(x), np.nanmax(x)
+        y_min, y_max = np.nanmin(y), np.nanmax(y)
+
+        left, right = ax.get_xlim()
+        bottom, top = ax.get_ylim()
+        inside = left <= x_min and x_max <= right and bottom <= y_min and y_max <= top
+        if inside and not (time_axis and x_min > left + (right - left) / 4):
+            return False
+
+        x_room = max(x_max - x_min, 1.0) / 4
+        y_room = max(y_max - y_min, 1.0) / 4
+        if time_axis:
+            ax.set_xlim(x_min, x_max + x_room)
         else:
-            self.xs21.append(float(self.otter.sorted_values[self.x21]))
-            self.xs22.append(float(self.otter.sorted_values[self.x22]))
-        self.ys21.append(float(self.otter.sorted_values[self.y21]))
-        self.ys22.append(float(self.otter.sorted_values[self.y22]))
+            ax.set_xlim(x_min - x_room, x_max + x_room)
+        ax.set_ylim(y_min - y_room, y_max + y_room)
+        return True
 
-        self.ax2.clear()
-        self.ax2.set_xlabel("East (m)")
-        self.ax2.set_ylabel("North (m)")
-        self.ax2.plot(self.xs21, self.ys21, "r-", label="Otter position")
-        self.ax2.plot(self.xs22, self.ys22, "c-", label="Target position")
-        self.ax2.legend()
 
+    # Saves the background after a full draw of the figure, e.g. after new limits or when the window is resized
+    def on_draw(self, event):
+        self.background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+        self.draw_lines()
 
-        if self.x31 == "time" and self.x32 == "time":
-            self.xs31.append(float(time.time() - self.start_time))
-            self.xs32 = self.xs31
 
-        else:
-            self.xs31.append(float(self.otter.sorted_values[self.x31]))
-            self.xs32.append(float(self.otter.sorted_values[self.x32]))
-        self.ys31.append(float(self.otter.sorted_values[self.y31]))
-        self.ys32.append(float(self.otter.sorted_values[self.y32] * (180/math.pi)))
-        self.ax3.clear()
-        self.ax3.set_xlabel("Time (s)")
-        self.ax3.set_ylabel("Angle (deg)")
-        self.ax3.plot(self.xs31, self.ys31, "m-", label="Current angle")
-        self.ax3.plot(self.xs32, self.ys32, "y-", label="Desired angle")
-        self.ax3.legend()
-
-
-        if self.x41 == "time" and self.x42 == "time":
-            self.xs41.append(float(time.time() - self.start_time))
-            self.xs42 = self.xs41
-
-        else:
-            self.xs41.append(float(self.otter.sorted_values[self.x41]))
-            self.xs42.append(float(self.otter.sorted_values[self.x42]))
-        self.ys41.append(float(self.otter.sorted_values[self.y41]))
-        self.ys42.append(float(self.otter.sorted_values[self.y42]))
-
-        self.ax4.clear()
-        self.ax4.set_xlabel("Time (s)")
-        self.ax4.set_ylabel("Distance (m)")
-        self.ax4.plot(self.xs41, self.ys41, "w-", label="Distance_to_target")
-        self.ax4.plot(self.xs42, self.ys42, "k-", label="Distance_to_target")
-        self.ax4.legend()
+    def draw_lines(self):
+        for ax, line, x, y, time_series in self.lines:
+            ax.draw_artist(line)
 
 
-        if self.x51 == "time" and self.x52 == "time":
-            self.xs51.append(float(time.time() - self.start_time))
-            self.xs52 = self.xs51
+    def plot(self):
+        self.start_time = time.time()
+        self.timer = self.fig.canvas.new_timer(interval=self.interval)
+        self.timer.add_callback(self.animate)
+        self.timer.start()
+        plt.show()
 
-        else:
-            self.xs51.append(float(self.otter.sorted_values[self.x51]))
-            self.xs52.append(float(self.otter.sorted_values[self.x52]))
-        self.ys51.append(float(self.otter.sorted_values[self.y51]))
-        self.ys52.append(float(self.otter.sorted_values[self.y52]))
 
-        self.ax5.clear()
-        self.ax5.set_xlabel("Time (s)")
-        self.ax5.set_ylabel("Thruster speed (rad/s")
-        self.ax5.plot(self.xs51, self.ys51, "r-", label="Left thruster")
-        self.ax5.plot(self.xs52, self.ys52, "b-", label="Right thruster")
-        self.ax5.legend()
+# Decimates a line to at most max_points points by keeping the smallest and largest y of each bucket of samples, in the
+# order they came. The peaks are kept, unlike when every n-th sample is kept
+def min_max_decimate(x, y, max_points):
+    if len(x) <= max_points:
+        return x, y
 
+    bucket = math.ceil(len(x) / (max_points // 2))
+    n = len(x) // bucket * bucket
+    x_buckets = x[:n].reshape(-1, bucket)
+    y_buckets = y[:n].reshape(-1, bucket)
 
-    def plot(self):
-        self.start_time = time.time()
-        ani = animation.FuncAnimation(self.fig, self.animate, interval=200)
-        plt.show()
+    i_min = np.argmin(y_buckets, axis=1)
+    i_max = np.argmax(y_buckets, axis=1)
+    first = np.minimum(i_min, i_max)
+    second = np.maximum(i_min, i_max)
+    rows = np.arange(len(first))
 
+    x_decimated = np.column_stack((x_buckets[rows, first], x_buckets[rows, second])).ravel()
+    y_decimated = np.column_stack((y_buckets[rows, first], y_buckets[rows, second])).ravel()
+    return np.concatenate((x_decimated, x[n:])), np.concatenate((y_decimated, y[n:]))
@@ -2,14 +2,21 @@ import time
 import math
 
 
+#
+#   The sample time of the regulators is taken from the clock, which is time.time by default for live runs. The clock can be
+#   any function returning the time in seconds, e.g. the simulated time. The sample time can also be given directly to
+#   calculate_surge and calculate_yaw, which is what the simulator does so it can run faster than real time.
+#
+
 class PIDController:
-    def __init__(self, kp, ki, kd):
+    def __init__(self, kp, ki, kd, clock=None):
         self.kp = kp
         self.ki = ki
         self.kd = kd
         self.previous_error = 0
         self.integral = 0
         self.previous_time = None
+        self.clock = clock if clock is not None else time.time
 
 
         self.integrator_limits = [0, 10]     # Limits the integrator in both regulators
@@ -17,11 +24,34 @@ class PIDController:
         self.previous_distance = None
 
 
-    def calculate_surge(self, surge_radius, distance_to_target, yaw_setpoint, yaw_measured):
-        current_time = time.time()
-        sample_time = current_time - self.previous_time if self.previous_time else 0
-        #sample_time = 0.1
+    # Returns the internal state of the regulator, used to save and restore simulations
+    def get_state(self):
+        return {"integral" : self.integral, "previous_error" : self.previous_error,
+                "previous_time" : self.previous_time if self.previous_time is not None else math.nan,
+                "previous_distance" : self.previous_distance if self.previous_distance is not None else math.nan}
+
+
+    def set_state(self, state):
+        self.integral = float(state["integral"])
+        self.previous_error = float(state["previous_error"])
+        self.previous_time = None if math.isnan(state["previous_time"]) else float(state["previous_time"])
+        self.previous_distance = None if math.isnan(state["previous_distance"]) else float(state["previous_distance"])
+
+
+    # Returns the time since the last call from the clock, or 0 on the first call. A given sample time is used as it is
+    def get_sample_time(self, sample_time=None):
+        if sample_time is not None:
+            return sample_time
+
+        current_time = self.clock()
+        sample_time = current_time - self.previous_time if self.previous_time is not None else 0
         self.previous_time = current_time
+        return sample_time
+
+
+    def calculate_surge(self, surge_radius, distance_to_target, yaw_setpoint, yaw_measured, sample_time=None):
+        sample_time = self.get_sample_time(sample_time)
+        #sample_time = 0.1
 
 
         error = distance_to_target - surge_radius
@@ -50,11 +80,9 @@ class PIDController:
         return output
 
 
-    def calculate_yaw(self, setpoint, measured_value, surge_radius, distance_to_target):
-        current_time = time.time()
-        sample_time = current_time - self.previous_time if self.previous_time else 0
+    def calculate_yaw(self, setpoint, measured_value, surge_radius, distance_to_target, sample_time=None):
+        sample_time = self.get_sample_time(sample_time)
         #sample_time = 0.1
-        self.previous_time = current_time
 
 
         error = (setpoint - measured_value + math.pi) % (2 * math.pi) - math.pi
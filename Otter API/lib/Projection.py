@@ -0,0 +1,169 @@
+import math
+import numpy as np
+
+
+#
+#   North east down positions relative to a fixed observer, the same as pymap3d.geodetic2ned on the WGS84 ellipsoid.
+#   The ECEF position of the observer and the rotation from ECEF to NED are calculated once when the projection is made,
+#   so each position only needs the geodetic to ECEF conversion and one rotation:
+#
+#       projection = ned_projection([lat, lon, height])
+#       n, e, d = projection.ned(lat, lon, height)                  Floats, plain math without NumPy
+#       n, e, d = projection.ned_array(lats, lons, heights)         Arrays, e.g. all the rows of a log
+#       lat, lon, height = projection.geodetic(n, e, d)             The other way, used by the emulator in Otter_emulator.py
+#
+#   With flat_earth = True a local tangent plane approximation is used instead, with the radii of curvature of the
+#   ellipsoid at the observer. It is about 1.5 times as fast for single positions and 4 times for arrays. The largest error
+#   within "radius" meters of the observer is found when the projection is made, around 3 mm for 2 km at 60 degrees north.
+#   If it is larger than "tolerance" meters the exact projection is used instead.
+#
+
+# WGS84 ellipsoid
+a = 6378137.0
+f = 1 / 298.257223563
+e2 = f * (2 - f)
+
+
+class ned_projection():
+
+    def __init__(self, observer, flat_earth=False, radius=2000, tolerance=0.01):
+
+        self.observer = tuple(float(value) for value in observer)
+        lat0, lon0, h0 = self.observer
+
+        phi = math.radians(lat0)
+        lam = math.radians(lon0)
+        self.sin_lat0 = math.sin(phi)
+        self.cos_lat0 = math.cos(phi)
+        self.sin_lon0 = math.sin(lam)
+        self.cos_lon0 = math.cos(lam)
+
+        # ECEF position of the observer
+        self.x0, self.y0, self.z0 = geodetic2ecef(lat0, lon0, h0)
+
+        # Rows of the rotation from ECEF to north, east and up
+        self.rotation = np.array([[-self.sin_lat0 * self.cos_lon0, -self.sin_lat0 * self.sin_lon0, self.cos_lat0],
+                                  [-self.sin_lon0, self.cos_lon0, 0.0],
+                                  [self.cos_lat0 * self.cos_lon0, self.cos_lat0 * self.sin_lon0, self.sin_lat0]])
+
+        # Meridian and prime vertical radius of curvature at the observer, in meters per radian
+        w = math.sqrt(1 - e2 * self.sin_lat0 ** 2)
+        self.meridian_radius = a * (1 - e2) / w ** 3
+        self.prime_vertical_radius = a / w
+        self.tan_lat0 = self.sin_lat0 / self.cos_lat0
+        self.radians_per_degree = math.pi / 180
+
+        self.use_flat_earth = flat_earth
+        self.radius = radius
+        self.tolerance = tolerance
+        self.flat_earth = False
+        self.flat_earth_error = None
+        if flat_earth:
+            self.flat_earth_error = self.max_flat_earth_error(radius)
+            if self.flat_earth_error <= tolerance:
+                self.flat_earth = True
+            else:
+                print(f"Flat earth error is {self.flat_earth_error:.3f} m within {radius} m, which is more than {tolerance} m. Using the exact projection")
+
+
+    # North, east and down (m) from the observer for one position
+    def ned(self, lat, lon, height=0.0):
+        if self.flat_earth:
+            return self.flat_earth_ned(lat, lon, height)
+
+        x, y, z = geodetic2ecef(lat, lon, height)
+        dx = x - self.x0
+        dy = y - self.y0
+        dz = z - self.z0
+
+        t = self.cos_lon0 * dx + self.sin_lon0 * dy
+        north = -self.sin_lat0 * t + self.cos_lat0 * dz
+        east = -self.sin_lon0 * dx + self.cos_lon0 * dy
+        up = self.cos_lat0 * t + self.sin_lat0 * dz
+        return north, east, -up
+
+
+    # North, east and down (m) from the observer for arrays of positions
+    def ned_array(self, lat, lon, height=0.0):
+        lat = np.asarray(lat, float)
+        lon = np.asarray(lon, float)
+        height = np.asarray(height, float)
+        if self.flat_earth:
+            return self.flat_earth_ned(lat, lon, height)
+
+        phi = np.radians(lat)
+        lam = np.radians(lon)
+        sin_phi = np.sin(phi)
+        N = a / np.sqrt(1 - e2 * sin_phi ** 2)
+        r = (N + height) * np.cos(phi)
+
+        d = np.stack(np.broadcast_arrays(r * np.cos(lam) - self.x0, r * np.sin(lam) - self.y0, (N * (1 - e2) + height) * sin_phi - self.z0))
+        north, east, up = np.tensordot(self.rotation, d, axes=1)
+        return north, east, -up
+
+
+    # Local tangent plane approximation with the radii of curvature at the observer. The cosine of the latitude is
+    # linearized around the observer, and the north and down include the curvature of the parallels and of the earth
+    # under the tangent plane, so the error grows with the third power of the distance
+    def flat_earth_ned(self, lat, lon, height=0.0):
+        d_lat = (lat - self.observer[0]) * self.radians_per_degree
+        d_lon = (lon - self.observer[1]) * self.radians_per_degree
+
+        east = d_lon * self.prime_vertical_radius * self.cos_lat0 * (1 - self.tan_lat0 * d_lat)
+        north = d_lat * self.meridian_radius + east * east * self.tan_lat0 / (2 * self.prime_vertical_radius)
+        down = self.observer[2] - height + north * north / (2 * self.meridian_radius) + east * east / (2 * self.prime_vertical_radius)
+        return north, east, down
+
+
+    # Latitude, longitude (deg) and height (m) from north, east and down (m) from the observer. The inverse of the flat
+    # earth approximation, so the round trip through ned() has the same error as flat_earth_ned. Takes floats or arrays
+    def geodetic(self, north, east, down=0.0):
+        d_lat = (north - east * east * self.tan_lat0 / (2 * self.prime_vertical_radius)) / self.meridian_radius
+        d_lon = east / (self.prime_vertical_radius * self.cos_lat0 * (1 - self.tan_lat0 * d_lat))
+        height = self.observer[2] - down + north * north / (2 * self.meridian_radius) + east * east / (2 * self.prime_vertical_radius)
+        return self.observer[0] + d_lat / self.radians_per_degree, self.observer[1] + d_lon / self.radians_per_degree, height
+
+
+    # Largest horizontal and vertical difference between the flat earth and the exact projection within radius (m) of the
+    # observer. Found from points in all directions at several distances, the error grows with the distance
+    def max_flat_earth_error(self, radius, directions=72, distances=20):
+        bearing, distance = np.meshgrid(np.linspace(0, 2 * math.pi, directions, endpoint=False), np.linspace(0, radius, distances + 1)[1:])
+        lat = self.observer[0] + np.degrees(distance * np.cos(bearing) / self.meridian_radius)
+        lon = self.observer[1] + np.degrees(distance * np.sin(bearing) / (self.prime_vertical_radius * self.cos_lat0))
+
+        flat_earth = self.flat_earth
+        self.flat_earth = False
+        exact = np.array(self.ned_array(lat, lon, self.observer[2]))
+        approximate = np.array(self.flat_earth_ned(lat, lon, self.observer[2]))
+        self.flat_earth = flat_earth
+
+        return float(np.sqrt(((exact - approximate) ** 2).sum(axis=0)).max())
+
+
+# ECEF position (m) of a geodetic position on the WGS84 ellipsoid
+def geodetic2ecef(lat, lon, height=0.0):
+    phi = math.radians(lat)
+    lam = math.radians(lon)
+    sin_phi = math.sin(phi)
+    N = a / math.sqrt(1 - e2 * sin_phi * sin_phi)
+    r = (N + height) * math.cos(phi)
+    return r * math.cos(lam), r * math.sin(lam), (N * (1 - e2) + height) * sin_phi
+
+
+# Distance (m) on the ground between two positions that are close together, e.g. two GPS fixes after each other.
+# Flat earth around the second position, the difference from geodetic2ned is below a millimeter for positions less than
+# 100 m apart
+def local_distance(lat, lon, lat0, lon0):
+    phi = math.radians(lat0)
+    w2 = 1 - e2 * math.sin(phi) ** 2
+    north = math.radians(lat - lat0) * a * (1 - e2) / (w2 * math.sqrt(w2))
+    east = math.radians(lon - lon0) * a / math.sqrt(w2) * math.cos(math.radians(lat))
+    return math.hypot(north, east)
+
+
+# North, east and down (m) for all the rows of a log from live_guidance, from the lat, lon and height columns and the
+# observer in the first row
+def ned_from_log(data, flat_earth=False):
+    observer = [float(data["observer_lat"].iloc[0]), float(data["observer_lon"].iloc[0]), float(data["observer_height"].iloc[0])]
+    projection = ned_projection(observer, flat_earth)
+    return projection.ned_array(data["lat"].to_numpy(float), data["lon"].to_numpy(float), data["height"].to_numpy(float))
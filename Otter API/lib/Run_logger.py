@@ -0,0 +1,216 @@
+import os
+import time
+import pickle
+import queue
+import threading
+import numbers
+import numpy as np
+import pandas as pd
+
+
+#
+#   Log of the values of every guidance cycle, without building a DataFrame for every row. Each row is a dict like
+#   otter.sorted_values and is written into NumPy columns that are allocated one chunk at a time, so adding a row takes
+#   the same time at the start and at the end of a long run. The columns are made when a key is first seen, so rows
+#   can have different keys like the rows of the pd.concat log, with NaN where a value is missing. The first value of a
+#   column decides its type: a column of numbers stores floats and a later value that is not a number is logged as NaN,
+#   any other column stores the values as they are.
+#
+#   When a chunk is full it is handed to a background thread that appends it to a spill file, so a crash loses at
+#   most one chunk and the memory use does not grow with the run. Without a spill file the chunks are kept in memory.
+#   At the end the chunks are joined into one DataFrame with the same columns and datetime index as the old log:
+#
+#       logger = run_logger("logs/run.chunks")
+#       logger.append(otter.sorted_values)                  Every cycle
+#       logger.save("logs/run.csv")                         Same CSV as before, or a .pkl which is faster to save and load
+#       logger.close()                                      Stops the thread and removes the spill file
+#
+#   If the program stops before the log is saved, load_spill("logs/run.chunks") returns the rows in the spill file.
+#
+
+# Format of the index of the log, the time the row was added. format_index makes these strings without strftime
+index_format = "%Y-%m-%d_%H:%M:%S:%f"
+
+
+class run_logger():
+
+    def __init__(self, spill_path=None, chunk_rows=600):
+
+        self.spill_path = spill_path
+        self.chunk_rows = chunk_rows                                        # 600 rows is one minute of guidance cycles
+
+        self.dtypes = {}                                                    # Columns in the order they were first logged
+        self.chunks = []                                                    # Full chunks, when there is no spill file
+        self.rows = 0
+        self.new_chunk()
+
+        self.queue = queue.Queue()
+        self.writer = None
+        self.write_error = None
+        if spill_path is not None:
+            if os.path.exists(spill_path):
+                os.remove(spill_path)
+            self.writer = threading.Thread(target=self.write_chunks, daemon=True)
+            self.writer.start()
+
+
+    # Adds one row. The keys of values are the columns, the time the row was added is the index
+    def append(self, values, timestamp=None):
+        if self.length == self.chunk_rows:
+            self.flush_chunk()
+
+        row = self.length
+        self.times[row] = time.time() if timestamp is None else timestamp
+        for name, value in values.items():
+            column = self.columns.get(name)
+            if column is None:
+                column = self.add_column(name, value)
+            if isinstance(value, float) or self.dtypes[name] is object or is_number(value):
+                column[row] = value                                         # Left as NaN if it is not a number in a column of numbers
+
+        self.length = self.length + 1
+        self.rows = self.rows + 1
+
+
+    # Makes a column in the current chunk, of numbers if the first value is a number. It is NaN in the earlier rows
+    def add_column(self, name, value):
+        dtype = float if is_number(value) else object
+        self.dtypes[name] = dtype
+
+        column = empty_column(self.chunk_rows, dtype)
+        self.columns[name] = column
+        return column
+
+
+    def new_chunk(self):
+        self.times = np.empty(self.chunk_rows)
+        self.columns = {name : empty_column(self.chunk_rows, dtype) for name, dtype in self.dtypes.items()}
+        self.length = 0
+
+
+    # Hands the current chunk to the spill file or the list of chunks, and starts a new one
+    def flush_chunk(self):
+        if self.length == 0:
+            return
+        chunk = (self.times[:self.length], {name : column[:self.length] for name, column in self.columns.items()})
+        if self.writer is not None:
+            self.queue.put(chunk)
+        else:
+            self.chunks.append(chunk)
+        self.new_chunk()
+
+
+    # Background thread appending the full chunks to the spill file
+    def write_chunks(self):
+        with open(self.spill_path, "ab") as file:
+            while True:
+                chunk = self.queue.get()
+                try:
+                    if chunk is None:
+                        return
+                    pickle.dump(chunk, file, pickle.HIGHEST_PROTOCOL)
+                    file.flush()
+                except OSError as error:
+                    self.write_error = error
+                    print(f"Could not write the log to {self.spill_path}: {error}")
+                finally:
+                    self.queue.task_done()
+
+
+    # All the logged rows as one DataFrame
+    def dataframe(self):
+        if self.writer is not None:
+            self.queue.join()                                               # Waits until the full chunks are written
+            chunks = read_chunks(self.spill_path)
+        else:
+            chunks = list(self.chunks)
+
+        if self.length > 0:
+            chunks.append((self.times[:self.length], {name : column[:self.length] for name, column in self.columns.items()}))
+        return chunks_to_dataframe(chunks)
+
+
+    # Saves the log as CSV with ; as separator like before, or as a pickled DataFrame if the file name ends with .pkl
+    def save(self, file_path):
+        data = self.dataframe()
+        if file_path.endswith(".pkl"):
+            data.to_pickle(file_path)
+        else:
+            data.to_csv(file_path, sep=';')
+        return data
+
+
+    # Stops the background thread. The spill file is removed unless keep_spill is True
+    def close(self, keep_spill=False):
+        if self.writer is not None:
+            self.queue.put(None)
+            self.writer.join()
+            self.writer = None
+            if not keep_spill and os.path.exists(self.spill_path):
+                os.remove(self.spill_path)
+
+
+    def __len__(self):
+        return self.rows
+
+
+# True for the values a column of numbers stores. Booleans and complex numbers are kept as they are in an object column
+def is_number(value):
+    return isinstance(value, numbers.Real) and not isinstance(value, (bool, np.bool_))
+
+
+def empty_column(rows, dtype):
+    if dtype is float:
+        return np.full(rows, np.nan)
+    return np.full(rows, None, object)
+
+
+# Reads the chunks in a spill file. A chunk that was only partly written when the program stopped is left out
+def read_chunks(spill_path):
+    chunks = []
+    if not os.path.exists(spill_path):
+        return chunks
+    with open(spill_path, "rb") as file:
+        while True:
+            try:
+                chunks.append(pickle.load(file))
+            except (EOFError, pickle.UnpicklingError):
+                return chunks
+
+
+# Joins chunks of (times, columns) into one DataFrame. The columns are in the order they were first logged, with NaN
+# in the rows of chunks that did not have them
+def chunks_to_dataframe(chunks):
+    names = {}
+    for times, columns in chunks:
+        names.update(dict.fromkeys(columns))
+
+    data = {}
+    for name in names:
+        data[name] = np.concatenate([columns[name] if name in columns else np.full(len(times), np.nan) for times, columns in chunks]) if chunks else []
+
+    times = np.concatenate([times for times, columns in chunks]) if chunks else np.empty(0)
+    return pd.DataFrame(data, index=format_index(times), columns=list(names))
+
+
+# The times as strings in index_format, in local time and rounded to microseconds like datetime.fromtimestamp. The
+# offset to UTC is looked up once for every 15 minutes of the run, the time zone changes are always on the quarter hour
+def format_index(times):
+    seconds = np.floor(times)
+    microseconds = seconds.astype(np.int64) * 1000000 + np.round((times - seconds) * 1e6).astype(np.int64)
+
+    quarters, inverse = np.unique(seconds.astype(np.int64) // 900, return_inverse=True)
+    offsets = np.array([time.localtime(quarter * 900).tm_gmtoff for quarter in quarters], np.int64)
+    local = (microseconds + offsets[inverse] * 1000000).astype("datetime64[us]")
+
+    # "YYYY-MM-DDTHH:MM:SS.ffffff" to "YYYY-MM-DD_HH:MM:SS:ffffff"
+    text = np.datetime_as_string(local, unit="us").astype("U26")
+    characters = text.view("U1").reshape(len(text), 26)
+    characters[:, 10] = "_"
+    characters[:, 19] = ":"
+    return pd.Index(text)
+
+
+# The rows of the spill file of a run that stopped before the log was saved
+def load_spill(spill_path):
+    return chunks_to_dataframe(read_chunks(spill_path))
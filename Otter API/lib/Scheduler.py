@@ -0,0 +1,230 @@
+import time
+import asyncio
+import collections
+import numpy as np
+import pandas as pd
+
+
+#
+#   Periodic scheduler for the guidance loop. The cycles start at absolute deadlines, start + k * period on the monotonic
+#   clock, so a late wake-up or a slow cycle does not push the following cycles later like sleeping for the rest of the
+#   cycle time does. When a cycle ends after the next deadline, the overrun policy decides what happens:
+#
+#       "catch_up"  The next cycles start at once until the loop is back on the schedule, so no cycles are lost
+#       "skip"      The missed deadlines are skipped and the next cycle starts at the next deadline on the schedule
+#       "degrade"   Like skip, but if more than degrade_limit of the last degrade_window cycles overran, the period is
+#                   doubled up to max_period. It is halved again after degrade_window cycles without an overrun
+#
+#   The time of each phase of a cycle is measured with mark() and counted in a histogram, together with the time between
+#   the cycle starts ("cycle") and how late the loop woke up after the deadline ("lateness"):
+#
+#       scheduler = periodic_scheduler(0.1)
+#       scheduler.start()
+#       while True:
+#           read the values                 scheduler.mark("read")
+#           calculate the forces            scheduler.mark("compute")
+#           send the command                scheduler.mark("send")
+#           log the values                  scheduler.mark("log")
+#           scheduler.wait()                await scheduler.wait_async() in an asyncio task
+#
+
+overrun_policies = ("catch_up", "skip", "degrade")
+
+
+class periodic_scheduler():
+
+    def __init__(self, period, overrun_policy="skip", max_period=None, degrade_window=20, degrade_limit=5, spin=0.0, verbose=True):
+
+        if overrun_policy not in overrun_policies:
+            raise ValueError(f"Unknown overrun policy {overrun_policy}, must be one of {overrun_policies}")
+
+        self.nominal_period = period
+        self.period = period
+        self.overrun_policy = overrun_policy
+        self.max_period = max_period if max_period is not None else 4 * period
+        self.degrade_window = degrade_window
+        self.degrade_limit = degrade_limit
+        self.spin = spin                                                    # The last part of the wait is spent polling the clock instead of sleeping
+        self.verbose = verbose
+
+        self.histograms = {}
+        self.recent_overruns = collections.deque(maxlen=degrade_window)
+        self.start_time = None
+
+
+    # Starts the first cycle now
+    def start(self):
+        self.start_time = time.monotonic()
+        self.deadline = self.start_time
+        self.next_deadline = self.start_time
+        self.cycle_start = None
+        self.cycles = 0
+        self.overruns = 0
+        self.skipped = 0
+        self.begin_cycle()
+
+
+    # Seconds since start, for looking up the target position
+    def elapsed(self):
+        return time.monotonic() - self.start_time
+
+
+    # Counts the time since the last mark, or since the cycle started, as the time of the phase name
+    def mark(self, name):
+        now = time.monotonic()
+        self.add(name, now - self.last_mark)
+        self.last_mark = now
+
+
+    # Waits until the next cycle should start
+    def wait(self):
+        delay = self.end_cycle()
+        if delay > self.spin:
+            time.sleep(delay - self.spin)
+        while time.monotonic() < self.next_deadline:
+            pass
+        self.begin_cycle()
+
+
+    async def wait_async(self):
+        delay = self.end_cycle()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        self.begin_cycle()
+
+
+    # Finds the next deadline with the overrun policy. Returns the time (s) until it
+    def end_cycle(self):
+        now = time.monotonic()
+        self.add("work", now - self.cycle_start)
+
+        deadline = self.deadline + self.period
+        overrun = now > deadline
+        if overrun:
+            self.overruns = self.overruns + 1
+            if self.overrun_policy != "catch_up":
+                missed = int((now - deadline) / self.period) + 1
+                deadline = deadline + missed * self.period
+                self.skipped = self.skipped + missed
+
+        if self.overrun_policy == "degrade":
+            self.recent_overruns.append(overrun)
+            if sum(self.recent_overruns) > self.degrade_limit and self.period < self.max_period:
+                self.set_period(min(2 * self.period, self.max_period))
+            elif len(self.recent_overruns) == self.degrade_window and not any(self.recent_overruns) and self.period > self.nominal_period:
+                self.set_period(max(self.period / 2, self.nominal_period))
+
+        self.next_deadline = deadline
+        return deadline - now
+
+
+    def set_period(self, period):
+        if self.verbose:
+            print(f"Cycle period changed from {self.period * 1e3:.0f} ms to {period * 1e3:.0f} ms, {sum(self.recent_overruns)} of the last {len(self.recent_overruns)} cycles overran")
+        self.period = period
+        self.recent_overruns.clear()
+
+
+    def begin_cycle(self):
+        now = time.monotonic()
+        self.add("lateness", now - self.next_deadline)
+        if self.cycle_start is not None:
+            self.add("cycle", now - self.cycle_start)
+        self.deadline = self.next_deadline
+        self.cycle_start = now
+        self.last_mark = now
+        self.cycles = self.cycles + 1
+
+
+    def add(self, name, value):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = timing_histogram(max_time=10 * self.nominal_period)
+            self.histograms[name] = histogram
+        histogram.add(value)
+
+
+    # Count, mean, percentiles and max (s) of every phase, and the number of overruns
+    def summary(self):
+        summary = {name : histogram.summary() for name, histogram in self.histograms.items()}
+        summary["overruns"] = self.overruns
+        summary["skipped"] = self.skipped
+        summary["period"] = self.period
+        return summary
+
+
+    def report(self):
+        lines = [f"{self.cycles} cycles of {self.nominal_period * 1e3:.0f} ms, {self.overruns} overruns, {self.skipped} deadlines skipped, period now {self.period * 1e3:.0f} ms"]
+        for name, histogram in self.histograms.items():
+            values = histogram.summary()
+            lines.append(f"    {name:<9} mean {values['mean'] * 1e3:7.2f} ms   p50 {values['p50'] * 1e3:7.2f} ms   p95 {values['p95'] * 1e3:7.2f} ms   "
+                         f"p99 {values['p99'] * 1e3:7.2f} ms   max {values['max'] * 1e3:7.2f} ms")
+        return "\n".join(lines)
+
+
+    # The histograms as a DataFrame with the start of each bin (s) and the count of every phase
+    def dataframe(self):
+        if not self.histograms:
+            return pd.DataFrame()
+        bins = max(histogram.used_bins() for histogram in self.histograms.values())
+        histogram = next(iter(self.histograms.values()))
+        data = {"bin_start" : np.arange(bins) * histogram.bin_width}
+        for name, histogram in self.histograms.items():
+            data[name] = histogram.counts[:bins]
+        return pd.DataFrame(data)
+
+
+    # Saves the histograms as CSV with ; as separator, like the log
+    def save(self, file_path):
+        self.dataframe().to_csv(file_path, sep=';', index=False)
+
+
+# Histogram of times with bins of equal width. Times above max_time are counted in the last bin, the exact mean and
+# max are kept as well
+class timing_histogram():
+
+    def __init__(self, bin_width=0.0001, max_time=1.0):
+
+        self.bin_width = bin_width
+        self.counts = np.zeros(int(round(max_time / bin_width)) + 1, int)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+
+    def add(self, value):
+        index = int(value / self.bin_width)
+        if index < 0:
+            index = 0
+        elif index >= len(self.counts):
+            index = len(self.counts) - 1
+        self.counts[index] = self.counts[index] + 1
+        self.count = self.count + 1
+        self.total = self.total + value
+        if value > self.max:
+            self.max = value
+
+
+    def mean(self):
+        return self.total / self.count if self.count > 0 else 0.0
+
+
+    # Time (s) q percent of the times are below, interpolated within the bin and never more than the largest time
+    def percentile(self, q):
+        if self.count == 0:
+            return 0.0
+        cumulative = np.cumsum(self.counts)
+        target = q / 100 * self.count
+        index = int(np.searchsorted(cumulative, target))
+        below = cumulative[index - 1] if index > 0 else 0
+        return min((index + (target - below) / self.counts[index]) * self.bin_width, self.max)
+
+
+    def used_bins(self):
+        nonzero = np.flatnonzero(self.counts)
+        return int(nonzero[-1]) + 1 if len(nonzero) > 0 else 0
+
+
+    def summary(self):
+        return {"count" : self.count, "mean" : self.mean(), "p50" : self.percentile(50), "p95" : self.percentile(95),
+                "p99" : self.percentile(99), "max" : self.max}
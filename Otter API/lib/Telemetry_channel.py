@@ -0,0 +1,233 @@
+import math
+import time
+import numpy as np
+from multiprocessing import shared_memory, resource_tracker
+
+
+#
+#   Sends the values of every guidance cycle to other processes, e.g. the live plot in Telemetry_viewer.py, so drawing
+#   does not take time from the control loop. The values are written to a ring buffer in shared memory with a fixed
+#   list of fields, one float64 each. The publisher never waits for the readers: a reader that is too slow loses the
+#   oldest records, and any number of readers can attach and detach while the guidance runs.
+#
+#       publisher = telemetry_publisher("otter_telemetry_2009")           In the guidance process
+#       publisher.publish(otter.sorted_values)                             Every cycle, about 20 microseconds
+#
+#       subscriber = telemetry_subscriber("otter_telemetry_2009")         In the viewer process
+#       subscriber.sorted_values                                           Newest values as a dict, like otter.sorted_values
+#       records = subscriber.read()                                        All records since the last read, one row each with
+#                                                                          the columns in subscriber.keys
+#
+#   Every slot of the ring has a sequence number that is odd while the publisher writes it. A reader copies the slot and
+#   only keeps the copy if the sequence number was even and the same before and after, so it never sees half a record.
+#
+
+# Values sent by default, the ones the live plot uses and a few more
+fields = ["current_time", "lat", "lon", "north_from_observer", "east_from_observer", "target_north_from_observer",
+          "target_east_from_observer", "current_orientation_3", "yaw_setpoint", "current_angle", "distance_to_target",
+          "tau_X", "tau_N", "n1", "n2", "current_speed", "cycle_time", "telemetry_age"]
+
+magic = 0x4F54544552                                                        # "OTTER", set when the channel is ready
+name_length = 32                                                            # Bytes per field name
+header_length = 8                                                           # magic, fields, capacity, counter, closed and spare
+
+# Index in the header
+MAGIC = 0
+FIELDS = 1
+CAPACITY = 2
+COUNTER = 3
+CLOSED = 4
+
+
+def channel_size(field_count, capacity):
+    return 8 * header_length + name_length * field_count + 8 * capacity + 8 * capacity * field_count
+
+
+# Numpy views of the header, names, sequence numbers and records in the shared memory
+def channel_arrays(buffer, field_count, capacity):
+    offset = 8 * header_length
+    names = np.ndarray((field_count,), f"S{name_length}", buffer, offset)
+    offset = offset + name_length * field_count
+    sequence = np.ndarray((capacity,), np.uint64, buffer, offset)
+    offset = offset + 8 * capacity
+    records = np.ndarray((capacity, field_count), np.float64, buffer, offset)
+    return names, sequence, records
+
+
+class telemetry_publisher():
+
+    def __init__(self, name="otter_telemetry", keys=None, capacity=1024):
+
+        self.name = name
+        self.keys = list(keys) if keys is not None else list(fields)
+        self.capacity = capacity
+
+        for key in self.keys:
+            if len(key.encode()) > name_length:
+                raise ValueError(f"Field name {key} is longer than {name_length} bytes")
+
+        size = channel_size(len(self.keys), capacity)
+        try:
+            self.memory = shared_memory.SharedMemory(name, create=True, size=size)
+        except FileExistsError:                                             # Left behind by a publisher that did not close
+            print(f"Replacing the telemetry channel {name}")
+            old = shared_memory.SharedMemory(name)
+            old.close()
+            old.unlink()
+            self.memory = shared_memory.SharedMemory(name, create=True, size=size)
+
+        self.header = np.ndarray((header_length,), np.uint64, self.memory.buf)
+        self.names, self.sequence, self.records = channel_arrays(self.memory.buf, len(self.keys), capacity)
+        self.header[:] = 0
+        self.names[:] = [key.encode() for key in self.keys]
+        self.sequence[:] = 0
+        self.header[FIELDS] = len(self.keys)
+        self.header[CAPACITY] = capacity
+        self.header[MAGIC] = magic
+
+        self.counter = 0
+        self.row = np.empty(len(self.keys))
+
+
+    # Writes the values of one cycle. Keys that are missing or not numbers are sent as NaN
+    def publish(self, values):
+        row = self.row
+        for k, key in enumerate(self.keys):
+            try:
+                row[k] = values.get(key, math.nan)
+            except (TypeError, ValueError):
+                row[k] = math.nan
+
+        slot = self.counter % self.capacity
+        self.sequence[slot] = 2 * self.counter + 1                          # Odd while the slot is written
+        self.records[slot] = row
+        self.sequence[slot] = 2 * self.counter + 2
+        self.counter = self.counter + 1
+        self.header[COUNTER] = self.counter
+
+
+    # Tells the readers there will be no more records and removes the shared memory. Readers that are attached keep
+    # their mapping until they close it
+    def close(self):
+        if self.memory is None:
+            return
+        self.header[CLOSED] = 1
+        del self.header, self.names, self.sequence, self.records
+        self.memory.close()
+        self.memory.unlink()
+        self.memory = None
+
+
+class telemetry_subscriber():
+
+    def __init__(self, name="otter_telemetry"):
+
+        self.name = name
+        self.memory = None
+        self.values = {}
+        self.next = 0
+        self.newest = 0
+        self.dropped = 0
+
+
+    # Attaches to the channel. Returns False if no publisher with the name is running
+    def attach(self):
+        try:
+            memory = shared_memory.SharedMemory(self.name)
+        except FileNotFoundError:
+            return False
+        try:                                                                # The resource tracker would remove the memory when the reader exits
+            resource_tracker.unregister(memory._name, "shared_memory")
+        except Exception:
+            pass
+
+        header = np.ndarray((header_length,), np.uint64, memory.buf)
+        if header[MAGIC] != magic:
+            del header
+            memory.close()
+            return False
+
+        self.memory = memory
+        self.header = header
+        field_count = int(header[FIELDS])
+        self.capacity = int(header[CAPACITY])
+        self.names, self.sequence, self.records = channel_arrays(memory.buf, field_count, self.capacity)
+        self.keys = [name.decode() for name in self.names]
+        self.next = int(self.header[COUNTER])                               # Starts with the records published from now on
+        self.newest = 0
+        return True
+
+
+    # Waits until the channel can be attached to. Returns boolean
+    def wait_for_publisher(self, timeout=None, interval=1):
+        start = time.monotonic()
+        while not self.attach():
+            if timeout is not None and time.monotonic() - start > timeout:
+                return False
+            time.sleep(interval)
+        return True
+
+
+    # Returns True if attached to a running publisher. Leaves a channel that was closed and attaches to a new one
+    def connected(self):
+        if self.memory is not None and self.header[CLOSED]:
+            self.close()
+        return self.memory is not None or self.attach()
+
+
+    # Copies one record. Returns None if it was overwritten or is being written
+    def read_slot(self, number):
+        slot = number % self.capacity
+        before = int(self.sequence[slot])
+        record = self.records[slot].copy()
+        after = int(self.sequence[slot])
+        if before != after or before != 2 * number + 2:
+            return None
+        return record
+
+
+    # All records published since the last read, as an array with one row per record. Records that were overwritten
+    # before they were read are counted in dropped
+    def read(self):
+        if not self.connected():
+            return np.empty((0, 0))
+
+        counter = int(self.header[COUNTER])
+        start = max(self.next, counter - self.capacity + 1)                 # The oldest slot can be overwritten next
+        self.dropped = self.dropped + start - self.next
+
+        rows = []
+        for number in range(start, counter):
+            record = self.read_slot(number)
+            if record is None:
+                self.dropped = self.dropped + 1
+            else:
+                rows.append(record)
+        self.next = counter
+
+        if rows:
+            self.values = dict(zip(self.keys, rows[-1].tolist()))
+        return np.array(rows).reshape(-1, len(self.keys))
+
+
+    # The newest values as a dict, used in place of otter.sorted_values by the live plotter
+    @property
+    def sorted_values(self):
+        if not self.connected():
+            return self.values
+
+        counter = int(self.header[COUNTER])
+        if counter > 0 and counter != self.newest:
+            record = self.read_slot(counter - 1)
+            if record is not None:
+                self.values = dict(zip(self.keys, record.tolist()))
+                self.newest = counter
+        return self.values
+
+
+    def close(self):
+        if self.memory is None:
+            return
+        del self.header, self.names, self.sequence, self.records
+        self.memory.close()
+        self.memory = None
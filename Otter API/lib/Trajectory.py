@@ -0,0 +1,180 @@
+import math
+import numpy as np
+
+
+#
+#   Moving target paths built once as arrays of north/east positions, one row for each sample. The path is described as
+#   a list of parts that follow each other, each part starts where the previous one ended:
+#
+#       {"type" : "hold", "duration" : 10}                                                      Stands still
+#       {"type" : "line", "velocity" : [v_north, v_east], "duration" : 60}                      Constant velocity (m/s)
+#       {"type" : "steps", "step" : [d_north, d_east], "every" : 1, "duration" : 60}            Jumps step (m) every "every" seconds
+#       {"type" : "circle", "center" : [n, e], "radius" : 40, "speed" : 1.5, "duration" : 600}   Circle, "angular_velocity" (rad/s) can be used instead of speed
+#       {"type" : "square", "side_length" : 50, "speed" : 1, "laps" : 2}                        Square, first side south, then west, north and east
+#       {"type" : "waypoints", "points" : [[n, e], ...], "speed" : 1.5}                         Straight lines between the points
+#
+#   A part without "duration" (or "laps" for the square) lasts until the end of the path. "samples" can be used instead
+#   of "duration" to give the length as a number of samples. After the last part the target stays at the last position.
+#
+#   The arrays hold the samples first..first + samples, row k - first is the target position at time k * sampleTime.
+#   With samples given the whole run is built at once. Without, the path is open ended and the arrays hold a window of
+#   "window" samples. If a position past the end is asked for, the next window is built on from the last row, so the
+#   memory stays the same however long the path is used and every sample is only built once. The positions are the
+#   same as when the whole path is built at once.
+#
+
+
+class trajectory():
+
+    def __init__(self, start, parts, sampleTime, samples=None, window=1000):
+
+        self.start = np.array(start, float)
+        self.parts = parts
+        self.sampleTime = sampleTime
+
+        if samples is None:
+            samples = window
+        self.samples = samples
+
+        self.build(0)
+
+
+    # Number of samples of one part, None if the part lasts until the end of the path
+    def part_samples(self, part, position):
+        if "samples" in part:
+            return int(part["samples"])
+
+        if part["type"] == "square":
+            if part.get("laps") is None:
+                return None
+            return 4 * int(part["laps"]) * int(round(part["side_length"] / part["speed"] / self.sampleTime))
+
+        if part["type"] == "waypoints":
+            points = np.vstack((position, np.array(part["points"], float)))
+            length = np.sqrt((np.diff(points, axis=0) ** 2).sum(axis=1)).sum()
+            return int(math.ceil(length / part["speed"] / self.sampleTime))
+
+        if part.get("duration") is None:
+            return None
+        return int(round(part["duration"] / self.sampleTime))
+
+
+    # Builds the time and position arrays for the samples first..first + self.samples. The path is built from the start
+    # if first is 0, otherwise it is built on from the last row of the arrays before, which must be sample first
+    def build(self, first):
+        if first == 0:
+            time = 0.0
+            position = self.start
+            self.part_index = 0                                             # The part at the last row, where it started and
+            self.part_first = 0                                             # the time and position at its start
+            self.part_time = 0.0
+            self.part_start = self.start
+        else:
+            time = self.time[-1]
+            position = self.positions[-1]
+
+        samples = self.samples
+        self.time = np.cumsum(np.concatenate(([time], np.full(samples, self.sampleTime))))
+        self.positions = np.empty((samples + 1, 2))
+        self.positions[0] = position
+        self.first = first
+
+        r = 0
+        while r < samples and self.part_index < len(self.parts):
+            part = self.parts[self.part_index]
+            offset = first + r - self.part_first
+
+            n = self.part_samples(part, self.part_start)
+            if n is None or n - offset > samples - r:
+                n = samples - r
+                last = False
+            else:
+                n = n - offset
+                last = True
+
+            elapsed = self.time[r + 1:r + n + 1] - self.part_time
+            self.positions[r + 1:r + n + 1] = self.build_part(part, self.part_start, self.positions[r], elapsed, offset, n)
+            r = r + n
+
+            if last:                                                        # The next part starts at this row
+                self.part_index = self.part_index + 1
+                self.part_first = first + r
+                self.part_time = self.time[r]
+                self.part_start = self.positions[r].copy()
+
+        self.positions[r + 1:] = self.positions[r]
+
+
+    # Builds the windows until sample k is in the arrays. Goes back to the start of the path for a sample before them
+    def move_to(self, k):
+        if k < self.first:
+            self.build(0)
+        while k > self.first + self.samples:
+            self.build(self.first + self.samples)
+
+
+    # Positions of one part for n samples, given the position where the part started, the position at the sample before,
+    # the time since the part started and the number of samples of the part before the first one
+    def build_part(self, part, start, position, elapsed, offset, n):
+        kind = part["type"]
+
+        if kind == "hold":
+            return np.repeat(position[None, :], n, axis=0)
+
+        if kind == "line":
+            increments = np.repeat(np.array(part["velocity"], float)[None, :] * self.sampleTime, n, axis=0)
+            return self.accumulate(position, increments)
+
+        if kind == "steps":
+            increments = np.zeros((n, 2))
+            every = max(1, int(round(part.get("every", 1) / self.sampleTime)))
+            increments[(offset + np.arange(n)) % every == 0] = np.array(part["step"], float)
+            return self.accumulate(position, increments)
+
+        if kind == "circle":
+            if "angular_velocity" in part:
+                omega = part["angular_velocity"]
+            else:
+                omega = part["speed"] / part["radius"]
+            theta = part.get("start_angle", 0.0) + omega * elapsed
+            center = part["center"]
+            return np.stack((center[0] + part["radius"] * np.cos(theta), center[1] + part["radius"] * np.sin(theta)), axis=1)
+
+        if kind == "square":
+            directions = np.array(part.get("directions", [[-1, 0], [0, -1], [1, 0], [0, 1]]), float)
+            side = int(round(part["side_length"] / part["speed"] / self.sampleTime))
+            side_index = ((offset + np.arange(n)) // max(side, 1)) % len(directions)
+            increments = directions[side_index] * part["speed"] * self.sampleTime
+            return self.accumulate(position, increments)
+
+        if kind == "waypoints":
+            points = np.vstack((start, np.array(part["points"], float)))
+            distance = np.concatenate(([0.0], np.cumsum(np.sqrt((np.diff(points, axis=0) ** 2).sum(axis=1)))))
+            travelled = np.minimum(part["speed"] * elapsed, distance[-1])
+            return np.stack((np.interp(travelled, distance, points[:, 0]), np.interp(travelled, distance, points[:, 1])), axis=1)
+
+        raise ValueError(f"Unknown trajectory part {kind}, use hold, line, steps, circle, square or waypoints")
+
+
+    # Adds the increments one after another to the position, the same way as updating the target every sample
+    def accumulate(self, position, increments):
+        return np.cumsum(np.vstack((position[None, :], increments)), axis=0)[1:]
+
+
+    # Target position at sample k
+    def position_at_sample(self, k):
+        self.move_to(k)
+        return self.positions[k - self.first]
+
+
+    # Target position at time t (s), interpolated between the samples
+    def position(self, t):
+        k = t / self.sampleTime
+        i = int(k)
+        self.move_to(i)
+        if i == self.first + self.samples:                                  # Sample i + 1 is in the next window, which starts at i
+            self.build(i)
+
+        fraction = k - i
+        row = i - self.first
+        return self.positions[row] + fraction * (self.positions[row + 1] - self.positions[row])
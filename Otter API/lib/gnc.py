@@ -233,6 +233,91 @@ def crossFlowDrag(L,B,T,nu_r):
 
 #------------------------------------------------------------------------------
 
+def crossFlowDragCoeff(L,B,T):
+    """
+    cf = crossFlowDragCoeff(L,B,T) precomputes the strip positions, the strip
+    weight 0.5*rho*T*Cd_2D*dx and the power sums S_j = sum(x^j), j = 0..3, used
+    by crossFlowDragFast. Call once per vessel, or again when T changes. L, B
+    and T can be scalars or arrays with one value for each vessel.
+    """
+
+    rho = 1026               # density of water
+    n = 20                   # number of strips
+
+    L = np.asarray(L, float)[..., None]
+    dx = L/n
+    x = -L/2 + dx * np.arange(0,n+1)                    # strip positions
+    k = 0.5 * rho * np.asarray(T, float) * Hoerner(B,T) * dx[..., 0]
+    S = np.stack([(x**j).sum(axis=-1) for j in range(0,4)], axis=-1)
+
+    cf = { 'x': x, 'k': k, 'S': S,
+           'x_min': x[..., 0], 'x_max': x[..., -1] }
+
+    return cf
+
+#------------------------------------------------------------------------------
+
+def crossFlowDragFast(cf,nu_r):
+    """
+    tau_crossflow = crossFlowDragFast(cf,nu_r) computes the same cross-flow
+    drag as crossFlowDrag using the coefficients cf = crossFlowDragCoeff(L,B,T).
+    nu_r is a 6 vector, or an M x 6 array for M vessels.
+
+    When the cross-flow velocity U(x) = v_r + x*r has the same sign along the
+    hull, |U|*U = sign(U)*(v_r^2 + 2*v_r*r*x + r^2*x^2) and the strip sums are
+    polynomials in (v_r, r) with the power sums S_j. Otherwise the strips are
+    summed in one vectorized reduction.
+    """
+
+    if np.ndim(nu_r) == 1:
+        v_r = float(nu_r[1])     # relative sway velocity
+        r = float(nu_r[5])       # yaw rate
+        k = float(cf['k'])
+        U_min = v_r + float(cf['x_min']) * r
+        U_max = v_r + float(cf['x_max']) * r
+
+        if U_min * U_max >= 0:
+            S0, S1, S2, S3 = cf['S']
+            sign = 1.0 if (U_min + U_max) >= 0 else -1.0
+            Yh = -k * sign * (v_r * v_r * S0 + 2 * v_r * r * S1 + r * r * S2)
+            Nh = -k * sign * (v_r * v_r * S1 + 2 * v_r * r * S2 + r * r * S3)
+        else:
+            U = v_r + cf['x'] * r
+            Ucf = np.abs(U) * U
+            Yh = -k * Ucf.sum()
+            Nh = -k * (cf['x'] * Ucf).sum()
+
+        return np.array([0, Yh, 0, 0, 0, Nh],float)
+
+    M = nu_r.shape[0]
+    v_r = nu_r[:, 1]
+    r = nu_r[:, 5]
+    k = np.broadcast_to(cf['k'], (M,))
+    x = np.broadcast_to(cf['x'], (M, cf['x'].shape[-1]))
+    S = np.broadcast_to(cf['S'], (M, 4))
+    U_min = v_r + cf['x_min'] * r
+    U_max = v_r + cf['x_max'] * r
+
+    sign = np.where(U_min + U_max >= 0, 1.0, -1.0)
+    Yh = -k * sign * (v_r * v_r * S[:, 0] + 2 * v_r * r * S[:, 1] + r * r * S[:, 2])
+    Nh = -k * sign * (v_r * v_r * S[:, 1] + 2 * v_r * r * S[:, 2] + r * r * S[:, 3])
+
+    # Vessels where U(x) changes sign along the hull
+    mixed = U_min * U_max < 0
+    if mixed.any():
+        U = v_r[mixed, None] + x[mixed] * r[mixed, None]
+        Ucf = np.abs(U) * U
+        Yh[mixed] = -k[mixed] * Ucf.sum(axis=1)
+        Nh[mixed] = -k[mixed] * (x[mixed] * Ucf).sum(axis=1)
+
+    tau_crossflow = np.zeros((M, 6))
+    tau_crossflow[:, 1] = Yh
+    tau_crossflow[:, 5] = Nh
+
+    return tau_crossflow
+
+#------------------------------------------------------------------------------
+
 def forceLiftDrag(b,S,CD_0,alpha,U_r):
     """
     tau_liftdrag = forceLiftDrag(b,S,CD_0,alpha,Ur) computes the hydrodynamic
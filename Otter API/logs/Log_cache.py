@@ -0,0 +1,129 @@
+import os
+import time
+import pandas as pd
+
+
+#
+#   Loads the logs from live_guidance for the plot scripts. Each log is only parsed from the csv file once: the time
+#   stamps are parsed into a "Timestamp" column and the values are made numeric, and the result is stored in a cache
+#   file in __log_cache__. The cache file is named with the size and modification time of the csv file, so a changed log
+#   is parsed again. The cache is Parquet if pyarrow is installed, otherwise a pickled DataFrame. A loaded log is also
+#   kept in memory, so the plots of one log in Plot_all.py only load it once:
+#
+#       data = Log_cache.load(date)                     A copy, the plot scripts can change it as they like
+#
+
+cache_dir = "__log_cache__"
+timestamp_format = '%Y-%m-%d_%H:%M:%S:%f'
+
+try:
+    import pyarrow
+    cache_extensions = [".parquet", ".pkl"]
+except ImportError:
+    cache_extensions = [".pkl"]
+
+# Logs loaded in this process, by the path of the csv file, with the key of the csv file they were loaded from
+frames = {}
+
+
+# The log in {date}.csv as a DataFrame, from memory, the cache or the csv file
+def load(date, folder="."):
+    csv_path = os.path.abspath(os.path.join(folder, f"{date}.csv"))
+    stat = os.stat(csv_path)
+    key = f"{stat.st_size}_{stat.st_mtime_ns}"
+
+    if csv_path in frames and frames[csv_path][0] == key:
+        return frames[csv_path][1].copy()
+
+    cache_path = os.path.join(os.path.dirname(csv_path), cache_dir, f"{date}.{key}")
+    data = load_cached(cache_path)
+    if data is None:
+        data = parse(csv_path)
+        store_cached(cache_path, data, date)
+
+    frames[csv_path] = (key, data)
+    return data.copy()
+
+
+# Reads the csv file, parses the time stamps in the first column and makes the values numeric. Columns that only have
+# text are kept as they are
+def parse(csv_path):
+    data = pd.read_csv(csv_path, sep=';')
+
+    for column in data.columns[1:]:
+        if not pd.api.types.is_numeric_dtype(data[column]):
+            numeric = pd.to_numeric(data[column], errors='coerce')
+            if numeric.notna().any() or data[column].isna().all():
+                data[column] = numeric
+
+    data['Timestamp'] = pd.to_datetime(data.iloc[:, 0], format=timestamp_format, errors='coerce')
+    return data
+
+
+# Returns the cached log, or None if there is no cache file for this version of the csv file
+def load_cached(cache_path):
+    for extension in cache_extensions:
+        path = cache_path + extension
+        if not os.path.exists(path):
+            continue
+        try:
+            if extension == ".parquet":
+                return pd.read_parquet(path)
+            return pd.read_pickle(path)
+        except Exception:
+            pass
+    return None
+
+
+# Stores the log in the cache and removes the cache files of older versions of the csv file. The file is written under
+# a temporary name first so other processes never read half written files. Does nothing if the folder is not writable
+def store_cached(cache_path, data, date):
+    folder = os.path.dirname(cache_path)
+    try:
+        os.makedirs(folder, exist_ok=True)
+        for extension in cache_extensions:
+            temporary = f"{cache_path}.{os.getpid()}.tmp{extension}"
+            try:
+                if extension == ".parquet":
+                    data.to_parquet(temporary)
+                else:
+                    data.to_pickle(temporary)
+            except (ValueError, TypeError, ImportError):               # E.g. a column Parquet can not store, the next format is tried
+                if os.path.exists(temporary):
+                    os.remove(temporary)
+                continue
+            os.replace(temporary, cache_path + extension)
+            break
+
+        for name in os.listdir(folder):
+            path = os.path.join(folder, name)
+            if name.startswith(f"{date}.") and not path.startswith(cache_path) and ".tmp" not in name:
+                os.remove(path)
+    except OSError as e:
+        print(f"Could not store the log cache: {e}")
+
+
+# Times loading all the logs in this folder from the csv files, from the cache and from memory
+if __name__ == "__main__":
+    dates = sorted(name[:-4] for name in os.listdir(".") if name.endswith(".csv"))
+
+    start = time.perf_counter()
+    for date in dates:
+        parse(os.path.abspath(f"{date}.csv"))
+    print(f"Parsing {len(dates)} csv files:  {time.perf_counter() - start:.2f} s")
+
+    start = time.perf_counter()
+    for date in dates:
+        load(date)
+    print(f"First load, fills the cache:  {time.perf_counter() - start:.2f} s")
+
+    frames.clear()
+    start = time.perf_counter()
+    for date in dates:
+        load(date)
+    print(f"From the cache:               {time.perf_counter() - start:.2f} s")
+
+    start = time.perf_counter()
+    for date in dates:
+        load(date)
+    print(f"From memory:                  {time.perf_counter() - start:.2f} s")
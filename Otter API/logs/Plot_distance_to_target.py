@@ -1,5 +1,5 @@
-import pandas as pd
 import matplotlib.pyplot as plt
+import Log_cache
 import matplotlib
 matplotlib.use('Agg')
 
@@ -11,21 +11,16 @@ def plot(date):
     dpi = 600
     fontsize = 14
 
-    data = pd.read_csv(f"{date}.csv", sep=';')
+    data = Log_cache.load(date)
 
 
 
     data_corrected = data.iloc[3:]
 
 
-    data_corrected['Timestamp'] = pd.to_datetime(data_corrected.iloc[:, 0], format='%Y-%m-%d_%H:%M:%S:%f', errors='coerce')
-
-
     data_corrected = data_corrected.dropna(subset=['Timestamp'])
 
 
-    data_corrected[y] = pd.to_numeric(data_corrected[y], errors='coerce')
-
     # variable for plotting every nth data point
     n = 5
     data_thinned = data_corrected.iloc[::n, :]
@@ -1,11 +1,11 @@
-import pandas as pd
 import matplotlib.pyplot as plt
+import Log_cache
 import matplotlib
 matplotlib.use('Agg')
 
 def plot(date):
 
-    data = pd.read_csv(f'{date}.csv', sep=';')
+    data = Log_cache.load(date)
     dpi = 600
     fontsize = 14
 
@@ -13,12 +13,6 @@ def plot(date):
     data_corrected = data.iloc[3:]
 
 
-    data_corrected['north_from_observer'] = pd.to_numeric(data_corrected['north_from_observer'], errors='coerce')
-    data_corrected['east_from_observer'] = pd.to_numeric(data_corrected['east_from_observer'], errors='coerce')
-    data_corrected['target_north_from_observer'] = pd.to_numeric(data_corrected['target_north_from_observer'], errors='coerce')
-    data_corrected['target_east_from_observer'] = pd.to_numeric(data_corrected['target_east_from_observer'], errors='coerce')
-
-
     plt.figure(figsize=(10, 6))
 
 
@@ -1,6 +1,7 @@
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
+import Log_cache
 from scipy.interpolate import interp1d
 
 
@@ -12,24 +13,14 @@ def plot(date):
     max_value = 3
     n = 7  # Number of points to average for downsampling
 
-    file_path = f'{date}.csv'
-    data = pd.read_csv(file_path, sep=';')
+    data = Log_cache.load(date)
 
     # Skipping first three rows and keeping a copy of the original data
     data_corrected = data.iloc[3:].copy()
 
-    # Convert Timestamp to datetime
-    data_corrected['Timestamp'] = pd.to_datetime(data_corrected.iloc[:, 0], format='%Y-%m-%d_%H:%M:%S:%f',
-                                                 errors='coerce')
-
     # Drop rows where Timestamp couldn't be parsed
     data_corrected = data_corrected.dropna(subset=['Timestamp'])
 
-    # Ensure numeric values
-    data_corrected['north_from_observer'] = pd.to_numeric(data_corrected['north_from_observer'], errors='coerce')
-    data_corrected['east_from_observer'] = pd.to_numeric(data_corrected['east_from_observer'], errors='coerce')
-    data_corrected['current_orientation_3'] = pd.to_numeric(data_corrected['current_orientation_3'], errors='coerce')
-
     # Downsample the data
     def downsample(data, n):
         return data.groupby(data.index // n).mean()
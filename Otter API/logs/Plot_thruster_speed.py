@@ -1,5 +1,5 @@
-import pandas as pd
 import matplotlib.pyplot as plt
+import Log_cache
 import matplotlib
 matplotlib.use('Agg')
 
@@ -12,21 +12,15 @@ def plot(date):
     dpi = 600
     fontsize = 14
 
-    data = pd.read_csv(f"{date}.csv", sep=';')
+    data = Log_cache.load(date)
 
 
     data_corrected = data.iloc[3:]
 
 
-    data_corrected['Timestamp'] = pd.to_datetime(data_corrected.iloc[:, 0], format='%Y-%m-%d_%H:%M:%S:%f', errors='coerce')
-
-
     data_corrected = data_corrected.dropna(subset=['Timestamp'])
 
 
-    data_corrected[y1] = pd.to_numeric(data_corrected[y1], errors='coerce')
-    data_corrected[y2] = pd.to_numeric(data_corrected[y2], errors='coerce')
-
     # Every nth data
     n = 5
     data_thinned = data_corrected.iloc[::n, :]
@@ -2,11 +2,12 @@ import Otter_api
 import lib.PID_Controller_test_v2 as PID_Controller_test_v2
 import Otter_simulator
 import lib.Live_guidance as Live_guidance
-import lib.Live_plotter as Live_plotter
+import lib.Telemetry_channel as Telemetry_channel
 from lib.plotTimeSeries import *
-import threading
+import subprocess
+import sys
+import os
 import atexit
-import time
 
 
 
@@ -28,6 +29,9 @@ verbose = True
 store_force_file = False                                                                                # Store the simulated control forces in a .csv file
 circular_target = True                                                                                  # Make the moving target a circle in the simulation
 animate_path = True                                                                                     # This takes a lot of time! File stored as 2D_animation.gif
+use_compiled_dynamics = True                                                                            # Uses the numba compiled dynamics if numba is installed. Much faster for long simulations
+integrator = "euler"                                                                                    # "euler", "rk4" or "rk45". rk4 and rk45 are stable with larger sampleTime, e.g. 0.1. The compiled dynamics are only used with euler
+scenario = None                                                                                         # Moving target path as a list of parts, see lib/Trajectory.py. None uses circular_target or the built in path
 
 
 # When connecting to live otter and using target tracking or simulating circular target:
@@ -41,7 +45,7 @@ radius = 40
 v_circle = 1.5                                                                                            # Angular velocity (m/s)
 side_length = 50                                                                                           # Square tracking side length
 side_target_speed = 1                                                                                      # Speed of square target
-enable_live_plot = True                                                                                  # Enables live plotting
+enable_live_plot = True                                                                                  # Enables live plotting in a separate window, see Telemetry_viewer.py
 
 
 parameter_list = 3                                    # Tuning parameters, 1 for trial and error, 2 for pole placement wb = 0.5, and 3 for pole placement wb = 0.4
@@ -64,7 +68,7 @@ test_pdi = {"surge_kp" : 14.39, "surge_ki" : 3.13, "surge_kd" : 0, "yaw_kp" : 15
 
 
 otter = Otter_api.otter()                                                                                                                                                                                                          # Creates Otter object from the API
-simulator = Otter_simulator.otter_simulator(target_list, use_target_coordinates, target_radius, use_moving_target, moving_target_start, moving_target_increase, end_when_last_target_reached, verbose, store_force_file, circular_target)           # Creates Simulator object
+simulator = Otter_simulator.otter_simulator(target_list, use_target_coordinates, target_radius, use_moving_target, moving_target_start, moving_target_increase, end_when_last_target_reached, verbose, store_force_file, circular_target, use_compiled_dynamics, integrator, scenario)           # Creates Simulator object
 
 
 
@@ -130,6 +134,13 @@ def _square_tracking():
 
 def exit_handler():
     live_guidance.save_log()
+    if live_guidance.publisher is not None:
+        live_guidance.publisher.close()
+
+# The live plot runs in a process of its own, Telemetry_viewer.py, and gets the values of every cycle through shared memory
+def start_live_plot():
+    live_guidance.publisher = Telemetry_channel.telemetry_publisher(f"otter_telemetry_{port}")
+    subprocess.Popen([sys.executable, "Telemetry_viewer.py", live_guidance.publisher.name], cwd=os.path.dirname(os.path.abspath(__file__)))
 
 
 
@@ -156,49 +167,18 @@ def main(option):
 
     elif option == 2:
 
-        _target_thread = threading.Thread(target=_target_tracking, args=())
-        _target_thread.daemon = True
-        _circle_thread = threading.Thread(target=_circular_tracking, args=())
-        _circle_thread.daemon = True
-        _square_thread = threading.Thread(target=_square_tracking, args=())
-        _square_thread.daemon = True
-
-
         option = float(input("Enter 1 for target tracking with moving target, 2 for circular motion or 3 for square tracking: "))
 
+        if enable_live_plot:
+            start_live_plot()
+        atexit.register(exit_handler)
 
         if option == 1:
-
-            if enable_live_plot:
-                _target_thread.start()
-                print(" Waiting for data")
-                time.sleep(6)
-                p1 = Live_plotter.live_plotter(otter)
-                atexit.register(exit_handler)
-            else:
-                live_guidance.target_tracking(start_north, start_east, v_north, v_east)
-                atexit.register(exit_handler)
+            _target_tracking()
         elif option == 2:
-            if enable_live_plot:
-                _circle_thread.start()
-                print(" Waiting for data")
-                time.sleep(6)
-                p1 = Live_plotter.live_plotter(otter)
-                atexit.register(exit_handler)
-            else:
-                live_guidance.circular_tracking(start_north, start_east, radius, v_circle)
-                atexit.register(exit_handler)
-
+            _circular_tracking()
         elif option == 3:
-            if enable_live_plot:
-                _square_thread.start()
-                print(" Waiting for data")
-                time.sleep(6)
-                p1 = Live_plotter.live_plotter(otter)
-                atexit.register(exit_handler)
-            else:
-                live_guidance.square_tracking(start_north, start_east, radius, v_circle)
-                atexit.register(exit_handler)
+            _square_tracking()
         else:
             print("Error")
 